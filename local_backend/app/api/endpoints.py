@@ -1,9 +1,14 @@
 """
 FastAPI endpoints for local RAG backend
 """
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header
-from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
 import logging
+import os
+import time
 import uuid
 
 from ..models.schemas import (
@@ -12,6 +17,9 @@ from ..models.schemas import (
     EmbedResponse,
     AskRequest,
     AskResponse,
+    AskFollowupResponse,
+    AskBatchRequest,
+    AskBatchItem,
     SourceChunk,
     GenerateQuizRequest,
     GenerateQuizResponse,
@@ -22,28 +30,224 @@ from ..models.schemas import (
     HealthResponse
 )
 from ..services.embedder import embedder
-from ..services.chroma_service import chroma_service
+from ..services.chroma_service import chroma_service, build_chunk_metadatas, build_scope_filter
 from ..services.llm_wrapper import llm_wrapper
+from ..services.circuit_breaker import LLMUnavailableError
+from ..services.llm_scheduler import INTERACTIVE, STANDARD
+from ..services.model_residency import model_residency
+from ..services.quiz_generator import generate_quiz_sharded, chunks_needed as quiz_chunks_needed
+from ..services.structured_output import StructuredOutputError, structured_stats
 from ..services.sync_client import sync_client
-from ..utils.pdf_parser import extract_text_from_file
-from ..utils.chunker import chunk_text
+from ..services.answer_cache import answer_cache
+from ..services.extractive_answer import extractive_answerer, followup_answers, format_citation
+from ..services.llm_cache import llm_cache
+from ..services.llm_metrics import llm_metrics
+from ..utils.pdf_parser import extract_pages_from_file
+from ..utils.chunker import chunk_text, join_pages, count_tokens
+from ..utils.disconnect import cancel_on_disconnect
+from ..utils.deadline import ASK_DEADLINE_SECONDS, GENERATION_DEADLINE_SECONDS, DeadlineExceeded, deadline
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# AskRequest fields that change the answer for the same question
+ASK_CACHE_VARIANT_FIELDS = ("top_k", "use_summary", "document_ids", "sources", "page_start", "page_end")
+
+# Concurrent LLM generations per /ask/batch request
+ASK_BATCH_CONCURRENCY = int(os.getenv("CLARITY_ASK_BATCH_CONCURRENCY", "2"))
+
+NO_DOCUMENTS_ANSWER = "I don't have any relevant information to answer this question. Please upload some documents first."
+DEADLINE_ANSWER = "I ran out of time writing a full answer. The most relevant passage from your documents is:"
+DEADLINE_EXCERPT_CHARS = 400
+
+
+def ask_cache_variant(request) -> str:
+    """Key for the retrieval options that must match for a cached answer to apply"""
+    return json.dumps({field: getattr(request, field) for field in ASK_CACHE_VARIANT_FIELDS})
+
+
+def scope_filter_for(request) -> Optional[Dict[str, Any]]:
+    """Chroma `where` filter for a request's document/source/page scope"""
+    return build_scope_filter(
+        document_ids=request.document_ids,
+        sources=request.sources,
+        page_start=request.page_start,
+        page_end=request.page_end
+    )
+
+
+def retrieve_for(request, query_embedding: List[float]) -> Dict[str, Any]:
+    """Retrieve chunks for a question, scoped to the request's notebook and documents/pages"""
+    # Scope retrieval to selected documents/pages (pushed down as a Chroma `where` filter)
+    scope_filter = scope_filter_for(request)
+    
+    if request.notebook_id:
+        # Query specific notebook collection
+        return chroma_service.query_notebook(
+            user_id=request.user_id,
+            notebook_id=request.notebook_id,
+            query_embedding=query_embedding,
+            top_k=request.top_k,
+            filter_metadata=scope_filter
+        )
+    # Query all user documents (backward compatibility)
+    return chroma_service.query(
+        user_id=request.user_id,
+        query_embedding=query_embedding,
+        top_k=request.top_k,
+        filter_metadata=scope_filter
+    )
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def build_source_chunks(results: Dict[str, Any]) -> List[SourceChunk]:
+    """Convert flattened query results to SourceChunks"""
+    return [
+        SourceChunk(
+            id=results["ids"][i],
+            text=results["documents"][i],
+            score=1.0 - results["distances"][i],  # Convert distance to similarity
+            metadata=results["metadatas"][i] if results["metadatas"] else None
+        )
+        for i in range(len(results["documents"]))
+    ]
+
+
+def deadline_answer(results: Dict[str, Any]) -> AskResponse:
+    """Degraded answer when generation did not fit the deadline: the best excerpt instead"""
+    source_chunks = build_source_chunks(results)
+    excerpt = source_chunks[0].text.strip()
+    if len(excerpt) > DEADLINE_EXCERPT_CHARS:
+        excerpt = excerpt[:DEADLINE_EXCERPT_CHARS].rsplit(" ", 1)[0] + "…"
+    return AskResponse(
+        answer=f"{DEADLINE_ANSWER}\n\n{excerpt}",
+        source_chunks=source_chunks,
+        model=llm_wrapper.get_model_name(),
+        degraded=True
+    )
+
+
+def chunk_token_counts(results: Dict[str, Any]) -> List[Optional[int]]:
+    """Per-chunk token counts from ingest metadata (None for chunks ingested before they were stored)"""
+    metadatas = results["metadatas"] or [None] * len(results["documents"])
+    return [(metadata or {}).get("token_count") for metadata in metadatas]
+
+
+async def answer_from_results(
+    question: str,
+    results: Dict[str, Any],
+    use_summary: bool,
+    user_id: Optional[str] = None,
+    priority: str = INTERACTIVE
+) -> AskResponse:
+    """Generate an answer from retrieved chunks"""
+    if not results["documents"]:
+        return AskResponse(
+            answer=NO_DOCUMENTS_ANSWER,
+            source_chunks=[],
+            model=llm_wrapper.get_model_name()
+        )
+    
+    source_chunks = build_source_chunks(results)
+    
+    # Pack chunks into the prompt token budget (token counts were stored at ingest)
+    context_texts = [chunk.text for chunk in source_chunks]
+    prompt = llm_wrapper.build_rag_prompt(
+        question=question,
+        context_chunks=context_texts,
+        token_counts=chunk_token_counts(results)
+    )
+    
+    # Generate answer using LLM
+    answer = await llm_wrapper.aanswer_question(
+        question=question,
+        context_chunks=context_texts,
+        prompt=prompt,
+        priority=priority,
+        user_id=user_id
+    )
+    
+    return AskResponse(
+        answer=answer,
+        source_chunks=source_chunks,
+        used_prompt=prompt if use_summary else None,
+        prompt_tokens=count_tokens(prompt),
+        model=llm_wrapper.get_model_name()
+    )
+
+
+async def extractive_answer(
+    request: AskRequest,
+    query_embedding: List[float],
+    results: Dict[str, Any],
+    cache_variant: str,
+    cache_version: int
+) -> Optional[AskResponse]:
+    """
+    Fast-path answer quoted from the top chunk, or None when retrieval is not confident enough
+    
+    With `continue_generation` the full answer is generated in the background
+    (and cached for the next asker, unless the notebook changed since
+    `cache_version`) under the returned `followup_id`.
+    """
+    source_chunks = build_source_chunks(results)
+    top = source_chunks[0]
+    # The chunk's embedding is already stored: only its sentences need embedding
+    stored = chroma_service.get_chunks(request.user_id, notebook_id=request.notebook_id, include_embeddings=True, ids=[top.id])
+    chunk_embedding = stored["embeddings"][0] if len(stored["embeddings"]) else None
+    span = await asyncio.to_thread(extractive_answerer.extract, query_embedding, top.text, chunk_embedding)
+    if span is None:
+        return None
+    
+    citation = format_citation(top.metadata)
+    followup_id = None
+    if request.continue_generation:
+        followup_id = followup_answers.start(
+            request.user_id,
+            full_answer_followup(request, query_embedding, results, cache_variant, cache_version)
+        )
+    logger.info(f"Extractive answer (sentence similarity {span.score:.3f}) for user {request.user_id}")
+    return AskResponse(
+        answer=f"{span.text} [{citation}]" if citation else span.text,
+        source_chunks=source_chunks,
+        model="extractive",
+        extractive=True,
+        followup_id=followup_id
+    )
+
+
+async def full_answer_followup(
+    request: AskRequest,
+    query_embedding: List[float],
+    results: Dict[str, Any],
+    cache_variant: str,
+    cache_version: int
+) -> AskResponse:
+    """Generated answer for a question that already got an extractive one"""
+    # The user already has an answer to read: don't jump ahead of people still waiting for one
+    response = await answer_from_results(request.question, results, request.use_summary, request.user_id, priority=STANDARD)
+    answer_cache.store(request.user_id, request.notebook_id, query_embedding, response, cache_version, cache_variant)
+    return response
+
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
     collections = chroma_service.list_collections()
+    llm_status = {**await model_residency.status(), **llm_wrapper.llm.health()}
     
     return HealthResponse(
-        status="healthy",
+        status="degraded" if llm_status.get("degraded") else "healthy",
         version="1.0.0",
         embedder_model=embedder.model_name,
         llm_model=llm_wrapper.get_model_name(),
-        chroma_collections=len(collections)
+        chroma_collections=len(collections),
+        llm_status=llm_status
     )
 
 
@@ -63,7 +267,8 @@ async def ingest_document(
         
         # Extract text
         logger.info(f"Extracting text from {filename}")
-        text = extract_text_from_file(filename, content)
+        pages = extract_pages_from_file(filename, content) or []
+        text, page_offsets = join_pages(pages)
         
         if not text or len(text.strip()) < 10:
             raise HTTPException(status_code=400, detail="Could not extract text from file")
@@ -85,16 +290,13 @@ async def ingest_document(
         embeddings = embedder.embed_texts(chunk_texts)
         
         # Prepare metadata
-        metadatas = [
-            {
-                "document_id": document_id,
-                "title": doc_title,
-                "chunk_index": i,
-                "char_start": chunk[1],
-                "char_end": chunk[2]
-            }
-            for i, chunk in enumerate(chunks)
-        ]
+        metadatas = build_chunk_metadatas(
+            document_id=document_id,
+            source=filename,
+            chunks=chunks,
+            page_offsets=page_offsets,
+            title=doc_title
+        )
         
         # Store in ChromaDB
         logger.info(f"Storing {len(chunk_texts)} chunks in ChromaDB for user {user_id}")
@@ -102,8 +304,10 @@ async def ingest_document(
             user_id=user_id,
             documents=chunk_texts,
             metadatas=metadatas,
-            embeddings=embeddings
+            embeddings=embeddings,
+            ids=[f"{document_id}_{i}" for i in range(len(chunk_texts))]
         )
+        answer_cache.invalidate(user_id, None)
         
         return DocumentIngestResponse(
             document_id=document_id,
@@ -137,98 +341,313 @@ async def embed_texts(request: EmbedRequest):
 
 
 @router.post("/ask", response_model=AskResponse)
-async def ask_question(request: AskRequest):
+async def ask_question(request: AskRequest, http_request: Request):
     """
     RAG question answering: embed query → retrieve chunks → generate answer
     """
     try:
-        # Embed question
-        notebook_info = f" in notebook {request.notebook_id}" if request.notebook_id else " across all notebooks"
-        logger.info(f"Processing question from user {request.user_id}{notebook_info}: {request.question}")
-        query_embedding = embedder.embed_query(request.question)
-        
-        # Determine collection name
-        if request.notebook_id:
-            # Query specific notebook collection
-            collection_name = f"clarity_user__{request.user_id.replace('|', '_')}__{request.notebook_id}"
+        # One time budget for embedding, retrieval and generation
+        with deadline(ASK_DEADLINE_SECONDS):
+            # Embed question
+            notebook_info = f" in notebook {request.notebook_id}" if request.notebook_id else " across all notebooks"
+            logger.info(f"Processing question from user {request.user_id}{notebook_info}: {request.question}")
+            query_embedding = embedder.embed_query(request.question)
+        
+            # Serve repeated questions from the semantic cache (same notebook, same retrieval options)
+            cache_variant = ask_cache_variant(request)
+            if request.use_cache:
+                cached = answer_cache.lookup(request.user_id, request.notebook_id, query_embedding, cache_variant)
+                if cached is not None:
+                    return cached.model_copy(update={"cached": True})
+        
+            # Read before retrieval: an answer from documents removed meanwhile must not be cached
+            cache_version = answer_cache.version(request.user_id, request.notebook_id)
+            results = retrieve_for(request, query_embedding)
+        
+            # Definition-style questions are often answered verbatim by the top chunk
+            if request.fast_mode and results["documents"]:
+                fast = await extractive_answer(request, query_embedding, results, cache_variant, cache_version)
+                if fast is not None:
+                    return fast
+        
             try:
-                collection = chroma_service.client.get_collection(name=collection_name)
-                results_raw = collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=request.top_k
+                response = await cancel_on_disconnect(
+                    http_request,
+                    answer_from_results(request.question, results, request.use_summary, request.user_id),
+                    label="answer"
                 )
-                # Convert to expected format
-                results = {
-                    "documents": results_raw["documents"][0] if results_raw["documents"] else [],
-                    "distances": results_raw["distances"][0] if results_raw["distances"] else [],
-                    "ids": results_raw["ids"][0] if results_raw["ids"] else [],
-                    "metadatas": results_raw["metadatas"][0] if results_raw["metadatas"] else []
-                }
-            except Exception as e:
-                logger.warning(f"Collection not found or error: {e}")
-                results = {"documents": [], "distances": [], "ids": [], "metadatas": []}
-        else:
-            # Query all user documents (backward compatibility)
-            results = chroma_service.query(
-                user_id=request.user_id,
-                query_embedding=query_embedding,
-                top_k=request.top_k
-            )
+            except DeadlineExceeded as e:
+                logger.warning(f"{e}; answering with the retrieved excerpts")
+                return deadline_answer(results)
+            if results["documents"]:
+                answer_cache.store(request.user_id, request.notebook_id, query_embedding, response, cache_version, cache_variant)
+            return response
+    
+    except HTTPException:
+        raise
+    except LLMUnavailableError as e:
+        logger.warning(f"Query failed fast: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except DeadlineExceeded as e:
+        logger.warning(f"Query ran out of time: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Query error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/ask/followup/{followup_id}", response_model=AskFollowupResponse)
+async def ask_followup(followup_id: str, user_id: str):
+    """Full answer generated in the background after an extractive /ask answer"""
+    task = followup_answers.get(followup_id, user_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Follow-up not found or expired")
+    if not task.done():
+        return AskFollowupResponse(followup_id=followup_id, status="pending")
+    if task.cancelled() or task.exception() is not None:
+        error = "cancelled" if task.cancelled() else str(task.exception())
+        return AskFollowupResponse(followup_id=followup_id, status="failed", error=error)
+    return AskFollowupResponse(followup_id=followup_id, status="done", answer=task.result())
+
+
+@router.post("/ask/stream")
+async def ask_question_stream(request: AskRequest):
+    """
+    Streaming RAG question answering as server-sent events:
+    `sources` (retrieved chunks) → `token` (answer pieces as the LLM
+    produces them) → `done` (retrieval, time-to-first-token and total latency)
+    
+    The whole stream shares one ASK_DEADLINE_SECONDS budget. When generation
+    runs out of time a `degraded` event follows the tokens sent so far (the
+    best excerpt stands in for the answer if none were sent).
+    """
+    start = time.perf_counter()
+    try:
+        with deadline(ASK_DEADLINE_SECONDS) as scope:
+            notebook_info = f" in notebook {request.notebook_id}" if request.notebook_id else " across all notebooks"
+            logger.info(f"Streaming answer for user {request.user_id}{notebook_info}: {request.question}")
+            query_embedding = embedder.embed_query(request.question)
+            
+            cache_variant = ask_cache_variant(request)
+            cached = answer_cache.lookup(request.user_id, request.notebook_id, query_embedding, cache_variant) if request.use_cache else None
+            cache_version = answer_cache.version(request.user_id, request.notebook_id)
+            results = retrieve_for(request, query_embedding) if cached is None else None
+    except DeadlineExceeded as e:
+        logger.warning(f"Query ran out of time: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Query error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    retrieval_ms = (time.perf_counter() - start) * 1000
+    
+    async def events():
+        if cached is not None:
+            yield sse_event("sources", {
+                "source_chunks": [chunk.model_dump() for chunk in cached.source_chunks],
+                "model": cached.model,
+                "prompt_tokens": cached.prompt_tokens
+            })
+            yield sse_event("token", {"text": cached.answer})
+            yield sse_event("done", {"cached": True, "retrieval_ms": retrieval_ms, "ttft_ms": retrieval_ms, "total_ms": retrieval_ms})
+            return
+        
+        source_chunks = build_source_chunks(results)
+        prompt = llm_wrapper.build_rag_prompt(
+            question=request.question,
+            context_chunks=[chunk.text for chunk in source_chunks],
+            token_counts=chunk_token_counts(results)
+        ) if source_chunks else None
+        prompt_tokens = count_tokens(prompt) if prompt else None
+        
+        # Sources go out before generation starts so the UI can show them immediately
+        yield sse_event("sources", {
+            "source_chunks": [chunk.model_dump() for chunk in source_chunks],
+            "model": llm_wrapper.get_model_name(),
+            "prompt_tokens": prompt_tokens
+        })
         
-        if not results["documents"]:
-            return AskResponse(
-                answer="I don't have any relevant information to answer this question. Please upload some documents first.",
-                source_chunks=[],
+        pieces = []
+        ttft_ms = None
+        degraded = False
+        if not source_chunks:
+            pieces.append(NO_DOCUMENTS_ANSWER)
+            ttft_ms = (time.perf_counter() - start) * 1000
+            yield sse_event("token", {"text": NO_DOCUMENTS_ANSWER})
+        else:
+            try:
+                # Generation gets what is left of the request's budget
+                with deadline(scope.remaining()):
+                    async for piece in llm_wrapper.astream_answer(
+                        question=request.question,
+                        context_chunks=[chunk.text for chunk in source_chunks],
+                        prompt=prompt,
+                        user_id=request.user_id
+                    ):
+                        if ttft_ms is None:
+                            ttft_ms = (time.perf_counter() - start) * 1000
+                        pieces.append(piece)
+                        yield sse_event("token", {"text": piece})
+            except DeadlineExceeded as e:
+                logger.warning(f"{e}; ending the stream degraded")
+                degraded = True
+                if not pieces:
+                    yield sse_event("token", {"text": deadline_answer(results).answer})
+                yield sse_event("degraded", {"detail": str(e)})
+            except Exception as e:
+                logger.error(f"Streaming generation error: {e}", exc_info=True)
+                yield sse_event("error", {"detail": str(e)})
+                return
+        
+        total_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Streamed answer: retrieval {retrieval_ms:.0f} ms, TTFT {ttft_ms or total_ms:.0f} ms, total {total_ms:.0f} ms")
+        
+        if source_chunks and not degraded:
+            response = AskResponse(
+                answer="".join(pieces),
+                source_chunks=source_chunks,
+                used_prompt=prompt if request.use_summary else None,
+                prompt_tokens=prompt_tokens,
                 model=llm_wrapper.get_model_name()
             )
+            answer_cache.store(request.user_id, request.notebook_id, query_embedding, response, cache_version, cache_variant)
         
-        # Build source chunks
-        source_chunks = [
-            SourceChunk(
-                id=results["ids"][i],
-                text=results["documents"][i],
-                score=1.0 - results["distances"][i],  # Convert distance to similarity
-                metadata=results["metadatas"][i] if results["metadatas"] else None
-            )
-            for i in range(len(results["documents"]))
-        ]
-        
-        # Generate answer using LLM
-        context_texts = [chunk.text for chunk in source_chunks]
-        answer = llm_wrapper.answer_question(
-            question=request.question,
-            context_chunks=context_texts
-        )
-        
-        # Build prompt for transparency
-        prompt = llm_wrapper.build_rag_prompt(
-            question=request.question,
-            context_chunks=context_texts,
-            include_instructions=request.use_summary
-        ) if request.use_summary else None
-        
-        return AskResponse(
-            answer=answer,
-            source_chunks=source_chunks,
-            used_prompt=prompt,
-            model=llm_wrapper.get_model_name()
-        )
+        yield sse_event("done", {"cached": False, "degraded": degraded, "retrieval_ms": retrieval_ms, "ttft_ms": ttft_ms, "total_ms": total_ms})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/ask/batch")
+async def ask_batch(request: AskBatchRequest):
+    """
+    Answer several questions: embed them together → one multi-query retrieval →
+    LLM generations with bounded concurrency, streamed back as NDJSON
+    (one AskBatchItem per line, in completion order)
+    
+    The questions are embedded in one /api/embed request only with
+    OLLAMA_EMBED_BATCH enabled; otherwise Ollama is asked once per question.
+    Either way embedding runs off the event loop. Embedding and retrieval
+    share one ASK_DEADLINE_SECONDS budget, and each generation gets its own
+    (a question that runs out of time gets the degraded excerpt answer).
+    """
+    notebook_info = f" in notebook {request.notebook_id}" if request.notebook_id else " across all notebooks"
+    logger.info(f"Processing {len(request.questions)} questions from user {request.user_id}{notebook_info}")
     
+    cache_variant = ask_cache_variant(request)
+    cached_items = []
+    pending = []
+    try:
+        with deadline(ASK_DEADLINE_SECONDS):
+            query_embeddings = await asyncio.to_thread(embedder.embed_texts, request.questions)
+            
+            for index, (question, embedding) in enumerate(zip(request.questions, query_embeddings)):
+                cached = answer_cache.lookup(request.user_id, request.notebook_id, embedding, cache_variant) if request.use_cache else None
+                if cached is not None:
+                    cached_items.append(AskBatchItem(index=index, question=question, response=cached.model_copy(update={"cached": True})))
+                else:
+                    pending.append(index)
+            
+            # One retrieval call for every uncached question
+            cache_version = answer_cache.version(request.user_id, request.notebook_id)
+            all_results = chroma_service.query_batch(
+                user_id=request.user_id,
+                query_embeddings=[query_embeddings[i] for i in pending],
+                top_k=request.top_k,
+                filter_metadata=scope_filter_for(request),
+                notebook_id=request.notebook_id
+            ) if pending else []
+    except DeadlineExceeded as e:
+        logger.warning(f"Batch ran out of time before generation: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        logger.error(f"Query error: {e}", exc_info=True)
+        logger.error(f"Batch embedding error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+    
+    async def answer_one(index: int, results: Dict[str, Any]) -> AskBatchItem:
+        question = request.questions[index]
+        async with semaphore:
+            try:
+                # The budget starts once the question's turn comes, not while it waits behind the others
+                with deadline(ASK_DEADLINE_SECONDS):
+                    response = await answer_from_results(question, results, request.use_summary, request.user_id)
+            except DeadlineExceeded as e:
+                logger.warning(f"Batch question {index}: {e}; answering with the retrieved excerpts")
+                return AskBatchItem(index=index, question=question, response=deadline_answer(results))
+            except Exception as e:
+                logger.error(f"Batch question {index} failed: {e}", exc_info=True)
+                return AskBatchItem(index=index, question=question, error=str(e))
+        if results["documents"]:
+            answer_cache.store(request.user_id, request.notebook_id, query_embeddings[index], response, cache_version, cache_variant)
+        return AskBatchItem(index=index, question=question, response=response)
+    
+    async def stream():
+        for item in cached_items:
+            yield item.model_dump_json() + "\n"
+        
+        tasks = [asyncio.create_task(answer_one(index, results)) for index, results in zip(pending, all_results)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                yield item.model_dump_json() + "\n"
+        finally:
+            # Client went away: cancel the generations still queued or running
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.get("/ask/cache/stats")
+async def ask_cache_stats():
+    """Semantic answer cache hit rate and size"""
+    return answer_cache.stats()
+
+
+@router.get("/ask/extractive/stats")
+async def ask_extractive_stats():
+    """How often the extractive fast path answered /ask, and why it fell back to generation"""
+    return extractive_answerer.stats()
+
+
+@router.get("/llm/cache/stats")
+async def llm_cache_stats():
+    """LLM response cache hit rate, size and generation time saved by hits"""
+    return llm_cache.stats()
+
+
+@router.get("/llm/scheduler/stats")
+async def llm_scheduler_stats():
+    """LLM calls in flight, queued, and queue time per priority class"""
+    return llm_wrapper.scheduler_stats()
+
+
+@router.get("/llm/metrics")
+async def llm_call_metrics(recent: int = 0):
+    """Prompt/output tokens, tokens/s, load and queue time per call site and model tier (rolling window and totals)"""
+    metrics = llm_metrics.summary()
+    metrics["tier_models"] = llm_wrapper.tier_models()
+    if recent > 0:
+        metrics["recent"] = llm_metrics.recent(min(recent, 500))
+    return metrics
+
+
+@router.get("/llm/structured/stats")
+async def llm_structured_stats():
+    """Structured generation repairs, retries and wasted-token rate per task"""
+    return structured_stats.stats()
 
 
 @router.get("/suggest-quiz-topics")
 async def suggest_quiz_topics(user_id: str):
     """Suggest quiz topics from user's documents"""
     try:
-        # Get all documents for user
-        results = chroma_service.query(
-            user_id=user_id,
-            query_embedding=[0.0] * embedder.get_embedding_dimension(),  # Dummy query to get all docs
-            top_k=10
-        )
+        # A sample of the user's chunks (no query needed)
+        results = chroma_service.get_chunks(user_id, limit=10)
         
         if not results["documents"]:
             return {"topics": []}
@@ -242,7 +661,11 @@ Content:
 
 Output ONLY a JSON array of topic strings, like: ["Topic 1", "Topic 2", "Topic 3", "Topic 4", "Topic 5"]"""
         
-        response = llm_wrapper.llm.generate(prompt, max_tokens=200, temperature=0.7)
+        # Low temperature so the cached suggestions are the ones the model would usually give
+        response = await llm_wrapper.agenerate(
+            prompt, max_tokens=200, temperature=0.2, cache=True,
+            priority=STANDARD, user_id=user_id, call_site="quiz-topics"
+        )
         
         # Parse topics
         import json
@@ -261,111 +684,91 @@ Output ONLY a JSON array of topic strings, like: ["Topic 1", "Topic 2", "Topic 3
 
 
 @router.post("/generate-quiz", response_model=GenerateQuizResponse)
-async def generate_quiz(request: GenerateQuizRequest):
+async def generate_quiz(request: GenerateQuizRequest, http_request: Request):
     """Generate quiz questions from user's documents"""
     try:
-        # Get relevant context for the topic
-        notebook_info = f" from notebook {request.notebook_id}" if request.notebook_id else " from all notebooks"
-        logger.info(f"Generating quiz for user {request.user_id}{notebook_info}, topic: {request.topic}")
-        query_embedding = embedder.embed_query(request.topic)
-        
-        # Determine collection to query
-        if request.notebook_id:
-            # Query specific notebook collection
-            collection_name = f"clarity_user__{request.user_id.replace('|', '_')}__{request.notebook_id}"
-            try:
-                collection = chroma_service.client.get_collection(name=collection_name)
-                results_raw = collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=5
-                )
-                # Convert to expected format
-                results = {
-                    "documents": results_raw["documents"][0] if results_raw["documents"] else [],
-                    "distances": results_raw["distances"][0] if results_raw["distances"] else [],
-                    "ids": results_raw["ids"][0] if results_raw["ids"] else [],
-                    "metadatas": results_raw["metadatas"][0] if results_raw["metadatas"] else []
-                }
-            except Exception as e:
-                logger.warning(f"Collection not found or error: {e}")
-                results = {"documents": [], "distances": [], "ids": [], "metadatas": []}
-        else:
-            # Query all user documents (backward compatibility)
-            results = chroma_service.query(
-                user_id=request.user_id,
-                query_embedding=query_embedding,
-                top_k=5
-            )
-        
-        if not results["documents"]:
-            raise HTTPException(
-                status_code=404,
-                detail="No documents found for this topic"
+        # One time budget for retrieval and every shard's generation
+        with deadline(GENERATION_DEADLINE_SECONDS):
+            # Get relevant context for the topic
+            notebook_info = f" from notebook {request.notebook_id}" if request.notebook_id else " from all notebooks"
+            logger.info(f"Generating quiz for user {request.user_id}{notebook_info}, topic: {request.topic}")
+            query_embedding = embedder.embed_query(request.topic)
+        
+            scope_filter = build_scope_filter(
+                document_ids=request.document_ids,
+                sources=request.sources,
+                page_start=request.page_start,
+                page_end=request.page_end
             )
         
-        # Generate quiz
-        logger.info(f"Generating quiz for topic: {request.topic}")
-        quiz_text = llm_wrapper.generate_quiz(
-            topic=request.topic,
-            context_chunks=results["documents"],
-            difficulty=request.difficulty,
-            num_questions=request.num_questions
-        )
-        
-        logger.info(f"LLM returned quiz text (length: {len(quiz_text)} chars)")
-        
-        # Parse JSON response
-        import json
-        import re
+            # Determine collection to query
+            if request.notebook_id:
+                # Query specific notebook collection
+                results = chroma_service.query_notebook(
+                    user_id=request.user_id,
+                    notebook_id=request.notebook_id,
+                    query_embedding=query_embedding,
+                    top_k=quiz_chunks_needed(request.num_questions),
+                    filter_metadata=scope_filter
+                )
+            else:
+                # Query all user documents (backward compatibility)
+                results = chroma_service.query(
+                    user_id=request.user_id,
+                    query_embedding=query_embedding,
+                    top_k=quiz_chunks_needed(request.num_questions),
+                    filter_metadata=scope_filter
+                )
         
-        # Try to extract JSON from response (in case LLM adds markdown)
-        json_match = re.search(r'\{[\s\S]*\}', quiz_text)
-        if json_match:
-            json_str = json_match.group(0)
-        else:
-            json_str = quiz_text
+            if not results["documents"]:
+                raise HTTPException(
+                    status_code=404,
+                    detail="No documents found for this topic"
+                )
         
-        try:
-            quiz_data = json.loads(json_str)
-            questions = []
-            
-            for q_data in quiz_data.get("questions", []):
-                questions.append(
-                    QuizQuestion(
-                        question=q_data["question"],
-                        options=q_data["options"][:4],
-                        correct_answer=q_data.get("correct_answer", 0),
-                        explanation=q_data.get("explanation", "Generated from your documents."),
-                        hint=q_data.get("hint"),
-                        incorrect_explanations=q_data.get("incorrect_explanations")
-                    )
+            # Generate quiz in concurrent shards over different context slices, deduplicated
+            logger.info(f"Generating quiz for topic: {request.topic}")
+            try:
+                quiz_questions = await cancel_on_disconnect(
+                    http_request,
+                    generate_quiz_sharded(
+                        topic=request.topic,
+                        context_chunks=results["documents"],
+                        difficulty=request.difficulty,
+                        num_questions=request.num_questions,
+                        token_counts=chunk_token_counts(results),
+                        embed=embedder.embed_texts,
+                        user_id=request.user_id
+                    ),
+                    label="quiz generation"
+                )
+            except StructuredOutputError as e:
+                logger.error(f"Failed to parse quiz: {e}")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Failed to parse quiz questions from LLM output: {str(e)}"
                 )
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON. Error: {e}")
-            logger.error(f"Quiz text was:\n{quiz_text}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to parse quiz JSON: {str(e)}"
-            )
         
-        # If parsing failed, log the quiz text and return error
-        if not questions:
-            logger.error(f"Failed to parse quiz. Quiz text was:\n{quiz_text}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to parse quiz questions from LLM output. Generated {len(quiz_text)} chars but no questions parsed."
-            )
+            questions = [QuizQuestion(**q.model_dump()) for q in quiz_questions]
         
-        logger.info(f"Successfully parsed {len(questions)} questions")
-        return GenerateQuizResponse(
-            title=f"Quiz: {request.topic}",
-            questions=questions,
-            topic=request.topic,
-            difficulty=request.difficulty
-        )
+            logger.info(f"Successfully parsed {len(questions)} questions")
+            return GenerateQuizResponse(
+                title=f"Quiz: {request.topic}",
+                questions=questions,
+                topic=request.topic,
+                difficulty=request.difficulty,
+                # Fewer questions than asked for when the deadline cut generation short
+                degraded=len(questions) < request.num_questions
+            )
     
     except HTTPException:
         raise
+    except LLMUnavailableError as e:
+        logger.warning(f"Quiz generation failed fast: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except DeadlineExceeded as e:
+        logger.warning(f"Quiz generation ran out of time: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Quiz generation error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -725,7 +1128,10 @@ For example:
 
 Return ONLY the normalized topic name, nothing else."""
 
-        normalized = llm_wrapper.generate_text(prompt).strip()
+        normalized = (await llm_wrapper.agenerate(
+            prompt, max_tokens=50, temperature=0.2, cache=True,
+            priority=STANDARD, user_id=user_id, call_site="normalize-topic"
+        )).strip()
         
         # Cache the mapping
         analytics_crud.get_or_create_topic_mapping(db, user_id, topic, normalized)
@@ -1,7 +1,7 @@
 """
 Flashcard API endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -11,17 +11,16 @@ from ..db.database import get_db
 from ..db import flashcard_crud
 from ..db.flashcard_models import FlashcardDeck, FlashcardCard
 from ..services.llm_wrapper import llm_wrapper
-from ..services.chroma_service import ChromaService
-from ..services.embedder import Embedder
+from ..services.llm_scheduler import BULK
+from ..services.structured_output import StructuredOutputError
+from ..services.chroma_service import chroma_service
+from ..models.schemas import FlashcardsOutput
+from ..utils.disconnect import cancel_on_disconnect
+from ..utils.deadline import GENERATION_DEADLINE_SECONDS, DeadlineExceeded, deadline
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize services
-chroma_service = ChromaService()
-embedder = Embedder()
-
-
 # Pydantic models
 class DeckCreate(BaseModel):
     user_id: str
@@ -63,7 +62,7 @@ async def get_decks(user_id: str, db: Session = Depends(get_db)):
 
 
 @router.post("/flashcard-decks")
-async def create_deck(deck: DeckCreate, db: Session = Depends(get_db)):
+async def create_deck(deck: DeckCreate, request: Request, db: Session = Depends(get_db)):
     """Create a new flashcard deck"""
     try:
         # Create the deck
@@ -77,16 +76,23 @@ async def create_deck(deck: DeckCreate, db: Session = Depends(get_db)):
         
         # Generate cards from notebook if requested
         if deck.generate_from_notebook and deck.notebook_id:
-            await generate_cards_from_notebook(
-                db=db,
-                deck_id=new_deck.id,
-                user_id=deck.user_id,
-                notebook_id=deck.notebook_id
-            )
+            with deadline(GENERATION_DEADLINE_SECONDS):
+                await cancel_on_disconnect(
+                    request,
+                    generate_cards_from_notebook(
+                        db=db,
+                        deck_id=new_deck.id,
+                        user_id=deck.user_id,
+                        notebook_id=deck.notebook_id
+                    ),
+                    label=f"flashcard generation for deck {new_deck.id}"
+                )
             db.refresh(new_deck)
         
         logger.info(f"Created flashcard deck {new_deck.id} for user {deck.user_id}")
         return new_deck.to_dict()
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to create deck: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -181,6 +187,7 @@ async def get_study_cards(
 async def generate_cards_for_deck(
     deck_id: str,
     user_id: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Generate flashcards from the deck's linked notebook"""
@@ -193,13 +200,18 @@ async def generate_cards_for_deck(
         if not deck.notebook_id:
             raise HTTPException(status_code=400, detail="Deck is not linked to a notebook")
         
-        # Generate cards
-        await generate_cards_from_notebook(
-            db=db,
-            deck_id=deck_id,
-            user_id=user_id,
-            notebook_id=deck.notebook_id
-        )
+        # Generate cards (abandoned if the client goes away)
+        with deadline(GENERATION_DEADLINE_SECONDS):
+            await cancel_on_disconnect(
+                request,
+                generate_cards_from_notebook(
+                    db=db,
+                    deck_id=deck_id,
+                    user_id=user_id,
+                    notebook_id=deck.notebook_id
+                ),
+                label=f"flashcard generation for deck {deck_id}"
+            )
         
         # Get updated card count
         cards = flashcard_crud.get_cards_by_deck(db, deck_id, user_id)
@@ -302,15 +314,8 @@ async def generate_cards_from_notebook(
 ):
     """Generate flashcards from notebook content using LLM"""
     try:
-        # Get relevant context from ChromaDB
-        collection_id = f"{user_id.replace('|', '_')}__{notebook_id}"
-        
-        # Query for all documents (using dummy embedding)
-        results = chroma_service.query(
-            user_id=collection_id,
-            query_embedding=[0.0] * 768,  # Dummy query
-            top_k=10
-        )
+        # A sample of the notebook's chunks (no query needed)
+        results = chroma_service.get_chunks(user_id, notebook_id=notebook_id, limit=10)
         
         if not results.get("documents"):
             logger.warning(f"No documents found for notebook {notebook_id}")
@@ -342,30 +347,33 @@ Rules:
 - Cover different topics from the content
 - Output ONLY the JSON, no markdown, no code blocks, no extra text"""
         
-        response = llm_wrapper.llm.generate(prompt, max_tokens=2000, temperature=0.7)
+        try:
+            data = await llm_wrapper.agenerate_structured(
+                prompt,
+                FlashcardsOutput,
+                max_tokens=2000,
+                temperature=0.7,
+                task="flashcards",
+                topup_field="cards",
+                min_items=10,
+                priority=BULK,
+                user_id=user_id
+            )
+        except (StructuredOutputError, DeadlineExceeded) as e:
+            logger.error(f"Flashcard generation failed: {e}")
+            return
         
-        # Parse JSON response
-        import json
-        import re
+        # Create flashcards
+        for card_data in data.cards:
+            flashcard_crud.create_card(
+                db=db,
+                deck_id=deck_id,
+                user_id=user_id,
+                front=card_data.front,
+                back=card_data.back
+            )
         
-        json_match = re.search(r'\{[\s\S]*\}', response)
-        if json_match:
-            json_str = json_match.group(0)
-            data = json.loads(json_str)
-            
-            # Create flashcards
-            for card_data in data.get("cards", []):
-                flashcard_crud.create_card(
-                    db=db,
-                    deck_id=deck_id,
-                    user_id=user_id,
-                    front=card_data["front"],
-                    back=card_data["back"]
-                )
-            
-            logger.info(f"Generated {len(data.get('cards', []))} flashcards for deck {deck_id}")
-        else:
-            logger.error("Failed to parse LLM response for flashcard generation")
+        logger.info(f"Generated {len(data.cards)} flashcards for deck {deck_id}")
             
     except Exception as e:
         logger.error(f"Failed to generate flashcards from notebook: {e}")
@@ -2,26 +2,35 @@
 Mind Map API endpoints
 """
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from pydantic import BaseModel
+import os
+import asyncio
 import logging
-import json
 
-from ..db.database import get_db
+from ..db.database import SessionLocal, get_db
 from ..db import mindmap_crud, crud
 from ..db.mindmap_models import MindMap
 from ..services.llm_wrapper import llm_wrapper
-from ..services.chroma_service import ChromaService
-from ..services.embedder import Embedder
+from ..services.llm_scheduler import BULK, INTERACTIVE
+from ..services.structured_output import StructuredOutputError, parse_structured
+from ..services.chroma_service import chroma_service
+from ..services.embedder import embedder
+from ..services.generation_jobs import Publish, mind_map_jobs, node_details_prefetch_jobs
+from ..services.node_details_cache import node_details_cache, prefetch_order
+from ..services.mind_map_generator import MIN_CHUNKS, generate_mind_map_clustered
+from ..models.schemas import MindMapOutput
+from ..utils.deadline import GENERATION_DEADLINE_SECONDS, DeadlineExceeded, deadline
+from ..utils.mind_map_graph import degree_counts, subtree
+from .endpoints import sse_event
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize services
-chroma_service = ChromaService()
-embedder = Embedder()
-
+# Nodes whose details are prefetched after a map is generated (0 to disable)
+PREFETCH_NODES = int(os.getenv("CLARITY_NODE_DETAILS_PREFETCH", "20"))
 
 # Pydantic models
 class MindMapCreate(BaseModel):
@@ -30,6 +39,7 @@ class MindMapCreate(BaseModel):
     notebook_id: str
     description: Optional[str] = None
     max_depth: int = 3
+    regenerate: bool = False  # Skip the LLM response cache and generate a fresh map
 
 
 class MindMapResponse(BaseModel):
@@ -44,10 +54,33 @@ class MindMapResponse(BaseModel):
     nodes: list
     edges: list
     notebookTitle: Optional[str] = None
+    status: str = "ready"
+    progress: Optional[dict] = None
+    error: Optional[str] = None
     created_at: str
     updated_at: str
 
 
+def serialize_mind_map(mind_map: MindMap) -> dict:
+    return {
+        "id": mind_map.id,
+        "user_id": mind_map.user_id,
+        "notebook_id": mind_map.notebook_id,
+        "title": mind_map.title,
+        "description": mind_map.description,
+        "max_depth": mind_map.max_depth,
+        "node_count": mind_map.node_count,
+        "depth": mind_map.depth,
+        "nodes": mind_map.nodes or [],
+        "edges": mind_map.edges or [],
+        "created_at": mind_map.created_at.isoformat() if mind_map.created_at else None,
+        "updated_at": mind_map.updated_at.isoformat() if mind_map.updated_at else None,
+        "status": mind_map.status or "ready",
+        "progress": mind_map.progress,
+        "error": mind_map.error,
+    }
+
+
 @router.get("/mind-maps")
 async def get_mind_maps(user_id: str, db: Session = Depends(get_db)):
     """Get all mind maps for a user"""
@@ -57,20 +90,7 @@ async def get_mind_maps(user_id: str, db: Session = Depends(get_db)):
         # Enrich with notebook titles
         result = []
         for mind_map in mind_maps:
-            mind_map_dict = {
-                "id": mind_map.id,
-                "user_id": mind_map.user_id,
-                "notebook_id": mind_map.notebook_id,
-                "title": mind_map.title,
-                "description": mind_map.description,
-                "max_depth": mind_map.max_depth,
-                "node_count": mind_map.node_count,
-                "depth": mind_map.depth,
-                "nodes": mind_map.nodes or [],
-                "edges": mind_map.edges or [],
-                "created_at": mind_map.created_at.isoformat() if mind_map.created_at else None,
-                "updated_at": mind_map.updated_at.isoformat() if mind_map.updated_at else None,
-            }
+            mind_map_dict = serialize_mind_map(mind_map)
             
             # Get notebook title if linked
             if mind_map.notebook_id:
@@ -88,7 +108,13 @@ async def get_mind_maps(user_id: str, db: Session = Depends(get_db)):
 
 @router.post("/mind-maps")
 async def create_mind_map(mind_map_data: MindMapCreate, db: Session = Depends(get_db)):
-    """Create a new mind map and generate it from notebook content"""
+    """
+    Create a new mind map and start generating it from notebook content
+    
+    Returns at once with status "generating". Poll GET /mind-maps/{id}
+    (partial nodes are saved as each depth level is reached) or subscribe
+    to GET /mind-maps/{id}/events.
+    """
     try:
         # Verify notebook exists
         notebook = crud.get_notebook(db, mind_map_data.notebook_id, mind_map_data.user_id)
@@ -102,31 +128,21 @@ async def create_mind_map(mind_map_data: MindMapCreate, db: Session = Depends(ge
             title=mind_map_data.title,
             notebook_id=mind_map_data.notebook_id,
             description=mind_map_data.description,
-            max_depth=mind_map_data.max_depth
+            max_depth=mind_map_data.max_depth,
+            status="generating"
         )
         
         logger.info(f"Created mind map {mind_map.id} for user {mind_map_data.user_id}")
         
-        # Generate mind map data from notebook
-        await generate_mind_map_data(db, mind_map.id, mind_map_data.user_id, mind_map_data.notebook_id, mind_map_data.max_depth)
-        
-        # Reload with generated data
-        mind_map = mindmap_crud.get_mind_map(db, mind_map.id, mind_map_data.user_id)
-        
-        return {
-            "id": mind_map.id,
-            "user_id": mind_map.user_id,
-            "notebook_id": mind_map.notebook_id,
-            "title": mind_map.title,
-            "description": mind_map.description,
-            "max_depth": mind_map.max_depth,
-            "node_count": mind_map.node_count,
-            "depth": mind_map.depth,
-            "nodes": mind_map.nodes or [],
-            "edges": mind_map.edges or [],
-            "created_at": mind_map.created_at.isoformat() if mind_map.created_at else None,
-            "updated_at": mind_map.updated_at.isoformat() if mind_map.updated_at else None,
-        }
+        mind_map_id = mind_map.id
+        mind_map_jobs.start(
+            mind_map_id,
+            lambda publish: run_mind_map_job(
+                mind_map_id, mind_map_data.user_id, mind_map_data.notebook_id, mind_map_data.max_depth,
+                mind_map_data.regenerate, publish
+            )
+        )
+        return serialize_mind_map(mind_map)
     except HTTPException:
         raise
     except Exception as e:
@@ -134,6 +150,21 @@ async def create_mind_map(mind_map_data: MindMapCreate, db: Session = Depends(ge
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/mind-maps/jobs/stats")
+async def mind_map_job_stats():
+    """Mind map generation jobs running, queued and finished"""
+    return mind_map_jobs.stats()
+
+
+@router.get("/mind-maps/node-details/stats")
+async def node_details_stats():
+    """Node details cache hit rate and size, and prefetch jobs"""
+    return {
+        "cache": node_details_cache.stats(),
+        "prefetch": node_details_prefetch_jobs.stats(),
+    }
+
+
 @router.get("/mind-maps/{mind_map_id}")
 async def get_mind_map(mind_map_id: str, user_id: str, db: Session = Depends(get_db)):
     """Get a specific mind map"""
@@ -142,20 +173,7 @@ async def get_mind_map(mind_map_id: str, user_id: str, db: Session = Depends(get
         if not mind_map:
             raise HTTPException(status_code=404, detail="Mind map not found")
         
-        return {
-            "id": mind_map.id,
-            "user_id": mind_map.user_id,
-            "notebook_id": mind_map.notebook_id,
-            "title": mind_map.title,
-            "description": mind_map.description,
-            "max_depth": mind_map.max_depth,
-            "node_count": mind_map.node_count,
-            "depth": mind_map.depth,
-            "nodes": mind_map.nodes or [],
-            "edges": mind_map.edges or [],
-            "created_at": mind_map.created_at.isoformat() if mind_map.created_at else None,
-            "updated_at": mind_map.updated_at.isoformat() if mind_map.updated_at else None,
-        }
+        return serialize_mind_map(mind_map)
     except HTTPException:
         raise
     except Exception as e:
@@ -163,6 +181,32 @@ async def get_mind_map(mind_map_id: str, user_id: str, db: Session = Depends(get
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/mind-maps/{mind_map_id}/events")
+async def mind_map_events(mind_map_id: str, user_id: str, db: Session = Depends(get_db)):
+    """
+    Server-sent events while a mind map generates
+    
+    Sends a `progress` event per stage and per new depth level, then one
+    `status` event with the finished mind map (sent at once if generation
+    is already over).
+    """
+    if not mindmap_crud.get_mind_map(db, mind_map_id, user_id):
+        raise HTTPException(status_code=404, detail="Mind map not found")
+    
+    async def stream():
+        async for event in mind_map_jobs.subscribe(mind_map_id):
+            yield sse_event("progress", event)
+        # The request's session is closed once streaming starts
+        final_db = SessionLocal()
+        try:
+            mind_map = mindmap_crud.get_mind_map(final_db, mind_map_id, user_id)
+            yield sse_event("status", serialize_mind_map(mind_map) if mind_map else {"status": "deleted"})
+        finally:
+            final_db.close()
+    
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
 @router.delete("/mind-maps/{mind_map_id}")
 async def delete_mind_map(mind_map_id: str, user_id: str, db: Session = Depends(get_db)):
     """Delete a mind map"""
@@ -170,6 +214,10 @@ async def delete_mind_map(mind_map_id: str, user_id: str, db: Session = Depends(
         success = mindmap_crud.delete_mind_map(db, mind_map_id, user_id)
         if not success:
             raise HTTPException(status_code=404, detail="Mind map not found")
+        # Stop generating a map nobody will see
+        mind_map_jobs.cancel(mind_map_id)
+        node_details_prefetch_jobs.cancel(mind_map_id)
+        node_details_cache.drop_mind_map(mind_map_id)
         
         logger.info(f"Deleted mind map {mind_map_id}")
         return {"status": "success", "message": "Mind map deleted"}
@@ -180,17 +228,192 @@ async def delete_mind_map(mind_map_id: str, user_id: str, db: Session = Depends(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def generate_mind_map_data(db: Session, mind_map_id: str, user_id: str, notebook_id: str, max_depth: int = 3):
-    """Generate mind map nodes and edges using LLM and ChromaDB"""
-    try:
-        # Get collection for notebook
-        collection_name = f"clarity_user__{user_id.replace('|', '_')}__{notebook_id}"
+def build_graph(mind_map_data: MindMapOutput) -> Tuple[List[dict], List[dict]]:
+    """Nodes (with connection counts) and edges of generated output, dropping edges to nodes the model never produced"""
+    nodes = [node.model_dump() for node in mind_map_data.nodes]
+    node_ids = {node['id'] for node in nodes}
+    edges = [
+        edge.model_dump(by_alias=True) for edge in mind_map_data.edges
+        if edge.from_ in node_ids and edge.to in node_ids
+    ]
+    
+    degree = degree_counts(edges)
+    for node in nodes:
+        node['connections'] = degree.get(node['id'], 0)
+    return nodes, edges
+
+
+def depth_counts(nodes: List[dict]) -> Dict[str, int]:
+    """Nodes per depth level (string keys, as stored in the progress JSON)"""
+    counts: Dict[str, int] = {}
+    for node in nodes:
+        depth = str(node.get('depth', 0))
+        counts[depth] = counts.get(depth, 0) + 1
+    return counts
+
+
+class PartialMindMap:
+    """Saves the nodes parsed so far each time the streamed output reaches a new depth level
+    
+    Truncated JSON is salvaged by parse_structured(); the output is only
+    re-parsed every PARSE_EVERY_CHARS characters.
+    """
+    
+    PARSE_EVERY_CHARS = 400
+    
+    def __init__(self, db: Session, mind_map_id: str, on_progress: Callable[[Dict[str, Any]], None]):
+        self.db = db
+        self.mind_map_id = mind_map_id
+        self.on_progress = on_progress
+        self.parsed_chars = 0
+        self.deepest = -1
+    
+    def __call__(self, text: str) -> None:
+        if len(text) - self.parsed_chars < self.PARSE_EVERY_CHARS:
+            return
+        self.parsed_chars = len(text)
+        parsed = parse_structured(text, MindMapOutput)
+        if parsed.value is None or not parsed.value.nodes:
+            return
+        deepest = max(node.depth for node in parsed.value.nodes)
+        if deepest <= self.deepest:
+            return
+        self.deepest = deepest
         
-        # Try to get the collection using the ChromaDB client
-        try:
-            collection = chroma_service.client.get_collection(name=collection_name)
-        except Exception as e:
-            logger.warning(f"No collection found for notebook {notebook_id}: {e}")
+        nodes, edges = build_graph(parsed.value)
+        mindmap_crud.update_mind_map_data(
+            db=self.db,
+            mind_map_id=self.mind_map_id,
+            nodes=nodes,
+            edges=edges,
+            node_count=len(nodes),
+            depth=deepest
+        )
+        self.on_progress({"stage": "generating", "depth": deepest, "nodes": len(nodes), "nodes_per_depth": depth_counts(nodes)})
+
+
+async def run_mind_map_job(
+    mind_map_id: str,
+    user_id: str,
+    notebook_id: str,
+    max_depth: int,
+    bypass_cache: bool,
+    publish: Publish
+) -> None:
+    """Generate a mind map in the background, saving its status and progress as it goes"""
+    db = SessionLocal()
+    
+    def report(progress: Dict[str, Any]) -> None:
+        mindmap_crud.update_mind_map_status(db, mind_map_id, "generating", progress=progress)
+        publish({"status": "generating", **progress})
+    
+    try:
+        with deadline(GENERATION_DEADLINE_SECONDS):
+            await generate_mind_map_data(db, mind_map_id, user_id, notebook_id, max_depth, bypass_cache=bypass_cache, on_progress=report)
+        mind_map = mindmap_crud.get_mind_map(db, mind_map_id, user_id)
+        if mind_map is None:
+            return
+        progress = {"stage": "done", "depth": mind_map.depth, "nodes": mind_map.node_count, "nodes_per_depth": depth_counts(mind_map.nodes or [])}
+        mindmap_crud.update_mind_map_status(db, mind_map_id, "ready", progress=progress)
+        publish({"status": "ready", **progress})
+        if PREFETCH_NODES > 0:
+            node_details_prefetch_jobs.start(mind_map_id, lambda publish: prefetch_node_details(mind_map_id, user_id, publish))
+    except asyncio.CancelledError:
+        # Deleted while generating, or shutting down (marked failed at the next startup)
+        raise
+    except Exception as e:
+        logger.error(f"Mind map {mind_map_id} generation failed: {e}")
+        mindmap_crud.update_mind_map_status(db, mind_map_id, "failed", error=str(e))
+        publish({"status": "failed", "error": str(e)})
+    finally:
+        db.close()
+
+
+async def generate_clustered_mind_map_data(
+    db: Session,
+    mind_map_id: str,
+    user_id: str,
+    chunks: List[str],
+    embeddings: List[List[float]],
+    max_depth: int,
+    bypass_cache: bool,
+    report: Callable[[Dict[str, Any]], None]
+):
+    """Map-reduce generation over every chunk of the notebook, saving the map as each branch finishes"""
+    mind_map = mindmap_crud.get_mind_map(db, mind_map_id, user_id)
+    root_label = mind_map.title if mind_map else "Overview"
+    
+    def save(mind_map_data: MindMapOutput) -> Tuple[List[dict], int]:
+        nodes, edges = build_graph(mind_map_data)
+        depth = max(node['depth'] for node in nodes)
+        mindmap_crud.update_mind_map_data(
+            db=db,
+            mind_map_id=mind_map_id,
+            nodes=nodes,
+            edges=edges,
+            node_count=len(nodes),
+            depth=depth
+        )
+        return nodes, depth
+    
+    def on_branch(merged: MindMapOutput, done: int, total: int) -> None:
+        nodes, depth = save(merged)
+        report({"stage": "generating", "depth": depth, "nodes": len(nodes), "nodes_per_depth": depth_counts(nodes), "branches": done, "branches_total": total})
+    
+    report({"stage": "generating", "depth": None, "nodes": 0})
+    try:
+        mind_map_data = await generate_mind_map_clustered(
+            root_label,
+            chunks,
+            embeddings,
+            max_depth=max_depth,
+            user_id=user_id,
+            bypass_cache=bypass_cache,
+            on_branch=on_branch
+        )
+    except (StructuredOutputError, DeadlineExceeded) as e:
+        logger.error(f"Mind map generation failed: {e}")
+        mindmap_crud.update_mind_map_data(
+            db=db,
+            mind_map_id=mind_map_id,
+            nodes=[{"id": "1", "label": root_label, "content": "Central concept", "depth": 0, "connections": 0}],
+            edges=[],
+            node_count=1,
+            depth=0
+        )
+        return
+    nodes, depth = save(mind_map_data)
+    logger.info(f"Generated mind map with {len(nodes)} nodes from {len(chunks)} chunks, max depth: {depth}/{max_depth}")
+
+
+async def generate_mind_map_data(
+    db: Session,
+    mind_map_id: str,
+    user_id: str,
+    notebook_id: str,
+    max_depth: int = 3,
+    bypass_cache: bool = False,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+):
+    """
+    Generate mind map nodes and edges using LLM and ChromaDB
+    
+    Notebooks of at least MIN_CHUNKS chunks are clustered and mapped one
+    branch per cluster (see mind_map_generator); smaller ones get a single
+    prompt over the top retrieved chunks.
+    
+    With `on_progress`, stage changes are reported and the nodes generated
+    so far are saved as the map grows.
+    """
+    report = on_progress or (lambda progress: None)
+    try:
+        report({"stage": "retrieving"})
+        notebook_chunks = chroma_service.get_notebook_chunks(user_id, notebook_id)
+        chunks = notebook_chunks["documents"]
+        if len(chunks) >= MIN_CHUNKS and len(notebook_chunks["embeddings"]) == len(chunks):
+            await generate_clustered_mind_map_data(
+                db, mind_map_id, user_id, chunks, notebook_chunks["embeddings"], max_depth, bypass_cache, report
+            )
             return
         
         # Generate query embedding using our embedder
@@ -198,17 +421,19 @@ async def generate_mind_map_data(db: Session, mind_map_id: str, user_id: str, no
         query_embedding = embedder.embed_query(query_text)
         
         # Query for main topics using embeddings - get more context for detailed mind maps
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=30
+        results = chroma_service.query_notebook(
+            user_id=user_id,
+            notebook_id=notebook_id,
+            query_embedding=query_embedding,
+            top_k=30
         )
         
-        if not results or not results.get('documents') or not results['documents'][0]:
+        if not results["documents"]:
             logger.warning(f"No documents found in collection for notebook {notebook_id}")
             return
         
         # Prepare context from documents - use more docs for richer content
-        context_docs = results['documents'][0][:25]
+        context_docs = results['documents'][:25]
         context = "\n\n".join(context_docs)
         
         # Generate depth level list for prompt
@@ -304,24 +529,28 @@ ABSOLUTELY CRITICAL:
 - Double-check your JSON includes nodes with "depth": {max_depth} before returning"""
 
         logger.info(f"Generating mind map for notebook {notebook_id} with max_depth={max_depth}")
+        report({"stage": "generating", "depth": None, "nodes": 0})
         
         # Call LLM with more tokens for larger structures and lower temperature for better instruction following
-        response = llm_wrapper.llm.generate(prompt, max_tokens=4000, temperature=0.3, timeout=180)
-        logger.info(f"LLM response length: {len(response)} chars")
-        
-        # Parse JSON response
+        # Schema-constrained output, validated and repaired (truncated JSON is salvaged)
+        partial = PartialMindMap(db, mind_map_id, report) if on_progress else None
         try:
-            # Extract JSON from response
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                mind_map_data = json.loads(json_str)
-            else:
-                raise ValueError("No JSON found in response")
+            mind_map_data = await llm_wrapper.agenerate_structured(
+                prompt,
+                MindMapOutput,
+                max_tokens=4000,
+                temperature=0.3,
+                timeout=180,
+                task="mind_map",
+                call_site="mindmap",
+                cache=True,
+                bypass_cache=bypass_cache,
+                priority=BULK,
+                user_id=user_id,
+                on_partial=partial
+            )
             
-            nodes = mind_map_data.get('nodes', [])
-            edges = mind_map_data.get('edges', [])
+            nodes, edges = build_graph(mind_map_data)
             
             # Validate depth levels were actually generated
             actual_depths = set(node.get('depth', 0) for node in nodes)
@@ -332,19 +561,7 @@ ABSOLUTELY CRITICAL:
                 logger.warning(f"Depth levels present: {sorted(actual_depths)}")
                 logger.warning(f"Missing depth levels: {set(range(max_depth + 1)) - actual_depths}")
             
-            # Count nodes per depth level
-            depth_counts = {}
-            for node in nodes:
-                depth = node.get('depth', 0)
-                depth_counts[depth] = depth_counts.get(depth, 0) + 1
-            
-            logger.info(f"Node distribution by depth: {depth_counts}")
-            
-            # Calculate connections for each node
-            for node in nodes:
-                node_id = node['id']
-                connections = sum(1 for edge in edges if edge['from'] == node_id or edge['to'] == node_id)
-                node['connections'] = connections
+            logger.info(f"Node distribution by depth: {depth_counts(nodes)}")
             
             # Update mind map with generated data
             mindmap_crud.update_mind_map_data(
@@ -358,9 +575,12 @@ ABSOLUTELY CRITICAL:
             
             logger.info(f"Generated mind map with {len(nodes)} nodes, {len(edges)} edges, max depth: {max_node_depth}/{max_depth}")
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse LLM response as JSON: {e}")
-            logger.error(f"Response was: {response}")
+        except (StructuredOutputError, DeadlineExceeded) as e:
+            logger.error(f"Mind map generation failed: {e}")
+            if partial is not None and partial.deepest >= 0:
+                # Keep the levels already saved from the streamed output
+                logger.warning(f"Keeping partial mind map up to depth {partial.deepest}")
+                return
             # Create a fallback simple structure
             fallback_nodes = [
                 {"id": "1", "label": "Main Topic", "content": "Central concept", "depth": 0, "connections": 0}
@@ -380,6 +600,39 @@ ABSOLUTELY CRITICAL:
         raise
 
 
+@router.get("/mind-maps/{mind_map_id}/nodes/{node_id}")
+async def get_mind_map_subtree(
+    mind_map_id: str,
+    node_id: str,
+    user_id: str,
+    depth: int = 1,
+    max_nodes: int = 200,
+    db: Session = Depends(get_db)
+):
+    """
+    A node and the subtree below it, without loading the rest of the map
+    
+    Args:
+        depth: Levels below the node to include (0 for just the node)
+        max_nodes: Most nodes to return; the walk is breadth-first, so the shallowest are kept
+    """
+    graph = mindmap_crud.get_mind_map_graph(db, mind_map_id, user_id)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Mind map not found")
+    _, index = graph
+    
+    node_positions, edge_positions = subtree(index, node_id, max_depth=max(0, depth), max_nodes=max(1, max_nodes))
+    if not node_positions:
+        raise HTTPException(status_code=404, detail="Node not found")
+    nodes, edges = mindmap_crud.get_mind_map_elements(db, mind_map_id, node_positions, edge_positions)
+    return {
+        "node": nodes[0],
+        "parents": index["parents"].get(node_id, []),
+        "nodes": nodes,
+        "edges": edges,
+    }
+
+
 @router.get("/mind-maps/{mind_map_id}/node-details/{node_id}")
 async def get_node_details(
     mind_map_id: str,
@@ -387,25 +640,26 @@ async def get_node_details(
     user_id: str,
     db: Session = Depends(get_db)
 ):
-    """Get detailed content for a specific node from the original document"""
+    """
+    Get detailed content for a specific node from the original document
+    
+    Served from the node details cache when the node was opened (or
+    prefetched after generation) since the notebook's documents last changed.
+    """
     try:
-        # Get mind map
-        mind_map = mindmap_crud.get_mind_map(db, mind_map_id, user_id)
-        if not mind_map:
+        # Look the node up through the graph index instead of loading the map
+        graph = mindmap_crud.get_mind_map_graph(db, mind_map_id, user_id)
+        if graph is None:
             raise HTTPException(status_code=404, detail="Mind map not found")
+        notebook_id, index = graph
         
-        # Find the node
-        node = None
-        for n in mind_map.nodes:
-            if n.get("id") == node_id:
-                node = n
-                break
-        
-        if not node:
+        position = index["positions"].get(node_id)
+        if position is None:
             raise HTTPException(status_code=404, detail="Node not found")
+        node = mindmap_crud.get_mind_map_elements(db, mind_map_id, [position])[0][0]
         
         # If no notebook linked, return just the node content
-        if not mind_map.notebook_id:
+        if not notebook_id:
             return {
                 "node_id": node_id,
                 "label": node.get("label", ""),
@@ -414,94 +668,153 @@ async def get_node_details(
                 "source": "generated"
             }
         
-        # Query ChromaDB for detailed content (use same format as generation and notebooks)
-        collection_name = f"clarity_user__{user_id.replace('|', '_')}__{mind_map.notebook_id}"
+        cached = node_details_cache.get(user_id, notebook_id, mind_map_id, node_id)
+        if cached is not None:
+            return cached
         
-        logger.info(f"Querying collection: {collection_name} for node: {node.get('label')}")
-        
-        try:
-            collection = chroma_service.client.get_collection(name=collection_name)
-            
-            # Create query embedding for the node label
-            query_text = node.get("label", "") + " " + node.get("content", "")
-            query_embedding = embedder.embed_query(query_text)
-            
-            # Query for relevant chunks
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=5  # Get top 5 most relevant chunks
-            )
-            
-            # Generate comprehensive summary using LLM
-            comprehensive_summary = node.get("content", "")
-            if results and results.get('documents') and results['documents'][0]:
-                # Build context from top chunks
-                context = "\n\n".join(results['documents'][0][:3])
-                
-                # Generate expanded summary
-                prompt = f"""Explain {node.get('label', '')} based on this content. Write 3-4 clear sentences covering what it is, how it works, and why it matters. Use concrete examples where possible.
-
-{context[:1500]}"""
-                
-                try:
-                    summary_response = llm_wrapper.llm.generate(prompt, max_tokens=300)
-                    if summary_response and len(summary_response.strip()) > 20:
-                        comprehensive_summary = summary_response.strip()
-                except Exception as llm_error:
-                    logger.warning(f"Could not generate expanded summary: {llm_error}")
-            
-            # Format the details with concise excerpts
-            details = []
-            if results and results.get('documents'):
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i] if results.get('metadatas') else {}
-                    
-                    # Extract most relevant sentence or create concise excerpt (max 200 chars)
-                    content = doc.strip()
-                    if len(content) > 200:
-                        # Find a good breaking point (sentence or phrase)
-                        sentences = content.split('. ')
-                        excerpt = sentences[0]
-                        if len(excerpt) > 200:
-                            excerpt = content[:197] + "..."
-                        else:
-                            # Add more sentences if space allows
-                            for sent in sentences[1:]:
-                                if len(excerpt) + len(sent) + 2 <= 200:
-                                    excerpt += ". " + sent
-                                else:
-                                    break
-                            if not excerpt.endswith('.') and not excerpt.endswith('...'):
-                                excerpt += "..."
-                        content = excerpt
-                    
-                    details.append({
-                        "content": content,
-                        "source": metadata.get("source", "Unknown"),
-                        "page": metadata.get("page"),
-                        "relevance": 1.0 - (results['distances'][0][i] if results.get('distances') else 0)
-                    })
-            
-            return {
-                "node_id": node_id,
-                "label": node.get("label", ""),
-                "summary": comprehensive_summary,
-                "details": details,
-                "source": "document"
-            }
-            
-        except Exception as chroma_error:
-            logger.warning(f"Could not fetch from ChromaDB: {chroma_error}")
-            return {
-                "node_id": node_id,
-                "label": node.get("label", ""),
-                "summary": node.get("content", ""),
-                "details": [],
-                "source": "generated"
-            }
+        version = node_details_cache.version(user_id, notebook_id)
+        details, complete = await build_node_details(user_id, notebook_id, node_id, node)
+        if complete:
+            node_details_cache.store(user_id, notebook_id, mind_map_id, node_id, details, version)
+        return details
             
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Failed to get node details: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def build_node_details(
+    user_id: str,
+    notebook_id: str,
+    node_id: str,
+    node: dict,
+    priority: str = INTERACTIVE
+) -> Tuple[dict, bool]:
+    """
+    Expanded summary and source excerpts for a node, from its notebook's documents
+    
+    Returns:
+        (details, complete); complete is False when retrieval or the LLM
+        failed and the details fell back to the node's own content
+    """
+    logger.info(f"Querying notebook {notebook_id} for node: {node.get('label')}")
+    
+    try:
+        # Create query embedding for the node label
+        query_text = node.get("label", "") + " " + node.get("content", "")
+        query_embedding = await asyncio.to_thread(embedder.embed_query, query_text)
+        
+        # Query for relevant chunks
+        results = chroma_service.query_notebook(
+            user_id=user_id,
+            notebook_id=notebook_id,
+            query_embedding=query_embedding,
+            top_k=5  # Get top 5 most relevant chunks
+        )
+        
+        # Generate comprehensive summary using LLM
+        comprehensive_summary = node.get("content", "")
+        complete = True
+        if results['documents']:
+            # Build context from top chunks
+            context = "\n\n".join(results['documents'][:3])
+            
+            # Generate expanded summary
+            prompt = f"""Explain {node.get('label', '')} based on this content. Write 3-4 clear sentences covering what it is, how it works, and why it matters. Use concrete examples where possible.
+
+{context[:1500]}"""
+            
+            try:
+                # Details are cached, so placeholder output from an unavailable backend must not stand in
+                summary_response = await llm_wrapper.agenerate(
+                    prompt, max_tokens=300, priority=priority, user_id=user_id, call_site="node-details", allow_fallback=False
+                )
+                if summary_response and len(summary_response.strip()) > 20:
+                    comprehensive_summary = summary_response.strip()
+            except Exception as llm_error:
+                logger.warning(f"Could not generate expanded summary: {llm_error}")
+                complete = False
+        
+        # Format the details with concise excerpts
+        details = []
+        if results['documents']:
+            for i, doc in enumerate(results['documents']):
+                metadata = results['metadatas'][i] if results['metadatas'] else {}
+                
+                # Extract most relevant sentence or create concise excerpt (max 200 chars)
+                content = doc.strip()
+                if len(content) > 200:
+                    # Find a good breaking point (sentence or phrase)
+                    sentences = content.split('. ')
+                    excerpt = sentences[0]
+                    if len(excerpt) > 200:
+                        excerpt = content[:197] + "..."
+                    else:
+                        # Add more sentences if space allows
+                        for sent in sentences[1:]:
+                            if len(excerpt) + len(sent) + 2 <= 200:
+                                excerpt += ". " + sent
+                            else:
+                                break
+                        if not excerpt.endswith('.') and not excerpt.endswith('...'):
+                            excerpt += "..."
+                    content = excerpt
+                
+                details.append({
+                    "content": content,
+                    "source": metadata.get("source", "Unknown"),
+                    "page": metadata.get("page"),
+                    "relevance": 1.0 - (results['distances'][i] if results['distances'] else 0)
+                })
+        
+        return {
+            "node_id": node_id,
+            "label": node.get("label", ""),
+            "summary": comprehensive_summary,
+            "details": details,
+            "source": "document"
+        }, complete
+        
+    except Exception as chroma_error:
+        logger.warning(f"Could not fetch from ChromaDB: {chroma_error}")
+        return {
+            "node_id": node_id,
+            "label": node.get("label", ""),
+            "summary": node.get("content", ""),
+            "details": [],
+            "source": "generated"
+        }, False
+
+
+async def prefetch_node_details(mind_map_id: str, user_id: str, publish: Publish) -> None:
+    """
+    Fill the node details cache for a freshly generated map
+    
+    Up to PREFETCH_NODES nodes, shallowest and best-connected first, one at
+    a time at bulk priority so clicks on any map are served ahead of it.
+    Stops if the notebook's documents change.
+    """
+    db = SessionLocal()
+    try:
+        graph = mindmap_crud.get_mind_map_graph(db, mind_map_id, user_id)
+        mind_map = mindmap_crud.get_mind_map(db, mind_map_id, user_id)
+        if graph is None or mind_map is None or not graph[0]:
+            return
+        notebook_id, index = graph
+        nodes = {node["id"]: node for node in mind_map.nodes or []}
+    finally:
+        db.close()
+    
+    version = node_details_cache.version(user_id, notebook_id)
+    order = prefetch_order(list(nodes.values()), index["degree"], PREFETCH_NODES)
+    for done, node_id in enumerate(order, start=1):
+        if node_details_cache.version(user_id, notebook_id) != version:
+            logger.info(f"Notebook {notebook_id} changed, stopping node details prefetch for {mind_map_id}")
+            return
+        if not node_details_cache.contains(user_id, notebook_id, mind_map_id, node_id):
+            details, complete = await build_node_details(user_id, notebook_id, node_id, nodes[node_id], priority=BULK)
+            if complete:
+                node_details_cache.store(user_id, notebook_id, mind_map_id, node_id, details, version)
+        publish({"stage": "prefetching", "done": done, "total": len(order)})
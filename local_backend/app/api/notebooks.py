@@ -8,6 +8,7 @@ import logging
 import os
 import shutil
 import hashlib
+import uuid
 from pathlib import Path
 
 from app.db import get_db, crud
@@ -17,10 +18,12 @@ from app.models.schemas import (
     NotebookResponse,
     DocumentResponse,
 )
-from app.utils.pdf_parser import extract_text_from_file
-from app.utils.chunker import chunk_text
+from app.utils.pdf_parser import extract_pages_from_file
+from app.utils.chunker import chunk_text, join_pages
 from app.services.embedder import embedder
-from app.services.chroma_service import chroma_service
+from app.services.chroma_service import chroma_service, build_chunk_metadatas
+from app.services.answer_cache import answer_cache
+from app.services.node_details_cache import node_details_cache
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -120,11 +123,9 @@ async def delete_notebook(
                 logger.warning(f"Failed to delete file {doc.file_path}: {e}")
     
     # Delete from ChromaDB
-    collection_name = f"clarity_user__{user_id.replace('|', '_')}__{notebook_id}"
-    try:
-        chroma_service.delete_collection(collection_name)
-    except Exception as e:
-        logger.warning(f"Failed to delete ChromaDB collection: {e}")
+    chroma_service.delete_collection(chroma_service.get_notebook_collection_id(user_id, notebook_id))
+    answer_cache.invalidate(user_id, notebook_id)
+    node_details_cache.invalidate(user_id, notebook_id)
     
     # Delete from database (cascades to documents)
     success = crud.delete_notebook(db, notebook_id, user_id)
@@ -186,12 +187,14 @@ async def upload_document(
         logger.info(f"Extracting text from {file.filename}")
         with open(file_path, "rb") as f:
             file_content = f.read()
-        text = extract_text_from_file(file.filename, file_content)
+        pages = extract_pages_from_file(file.filename, file_content)
         
-        if not text:
+        if not pages or not any(page.strip() for page in pages):
             raise HTTPException(status_code=400, detail="Failed to extract text from file")
         
-        logger.info(f"Chunking text (length: {len(text)} chars)")
+        text, page_offsets = join_pages(pages)
+        
+        logger.info(f"Chunking text (length: {len(text)} chars, {len(pages)} pages)")
         chunk_size = int(os.getenv("CLARITY_CHUNK_SIZE", "500"))
         chunk_overlap = int(os.getenv("CLARITY_CHUNK_OVERLAP", "100"))
         chunk_results = chunk_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
@@ -202,20 +205,25 @@ async def upload_document(
         embeddings = embedder.embed_texts(chunks)
         
         # Store in ChromaDB (use notebook-specific collection)
-        collection_id = f"{user_id.replace('|', '_')}__{notebook_id}"
+        document_id = str(uuid.uuid4())
+        collection_id = chroma_service.get_notebook_collection_id(user_id, notebook_id)
         logger.info(f"Storing {len(chunks)} chunks in ChromaDB for user: {collection_id}")
         
         chroma_service.add_documents(
             user_id=collection_id,
             documents=chunks,
             embeddings=embeddings,
-            metadatas=[{
-                "source": file.filename,
-                "chunk_index": i,
-                "notebook_id": notebook_id
-            } for i in range(len(chunks))],
-            ids=[f"{file.filename}_{i}" for i in range(len(chunks))]
+            metadatas=build_chunk_metadatas(
+                document_id=document_id,
+                source=file.filename,
+                chunks=chunk_results,
+                page_offsets=page_offsets,
+                notebook_id=notebook_id
+            ),
+            ids=[f"{document_id}_{i}" for i in range(len(chunks))]
         )
+        answer_cache.invalidate(user_id, notebook_id)
+        node_details_cache.invalidate(user_id, notebook_id)
         
         # Create document record
         document = crud.create_document(
@@ -227,7 +235,8 @@ async def upload_document(
             file_path=str(file_path),
             file_size=file_size,
             chunk_count=len(chunks),
-            content_hash=content_hash
+            content_hash=content_hash,
+            document_id=document_id
         )
         
         logger.info(f"Document {document.id} uploaded successfully")
@@ -260,13 +269,11 @@ async def delete_document(
         except Exception as e:
             logger.warning(f"Failed to delete file {document.file_path}: {e}")
     
-    # Delete from ChromaDB (delete chunks with matching source)
-    collection_name = f"clarity_user__{user_id.replace('|', '_')}__{notebook_id}"
-    try:
-        # This is a simplification - in production you'd want to track chunk IDs
-        logger.info(f"Deleting document chunks from ChromaDB collection: {collection_name}")
-    except Exception as e:
-        logger.warning(f"Failed to delete from ChromaDB: {e}")
+    # Delete from ChromaDB (chunks carry their document_id in metadata)
+    collection_id = chroma_service.get_notebook_collection_id(user_id, notebook_id)
+    chroma_service.delete_document_chunks(collection_id, document_id)
+    answer_cache.invalidate(user_id, notebook_id)
+    node_details_cache.invalidate(user_id, notebook_id)
     
     # Delete from database
     success = crud.delete_document(db, document_id, user_id)
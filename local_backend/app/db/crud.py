@@ -67,11 +67,12 @@ def create_document(
     file_path: Optional[str] = None,
     file_size: Optional[int] = None,
     chunk_count: int = 0,
-    content_hash: Optional[str] = None
+    content_hash: Optional[str] = None,
+    document_id: Optional[str] = None
 ) -> Document:
-    """Create a new document"""
+    """Create a new document (document_id lets callers reuse the ID stored in chunk metadata)"""
     document = Document(
-        id=str(uuid.uuid4()),
+        id=document_id or str(uuid.uuid4()),
         notebook_id=notebook_id,
         user_id=user_id,
         name=name,
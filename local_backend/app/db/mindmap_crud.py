@@ -1,15 +1,16 @@
 """
 CRUD operations for mind maps
 """
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.orm import Session, undefer_group
+from typing import Any, Dict, List, Optional, Tuple
 from .mindmap_models import MindMap
+from ..utils.mind_map_graph import build_index
 import uuid
 
 
 def get_mind_maps(db: Session, user_id: str) -> List[MindMap]:
     """Get all mind maps for a user"""
-    return db.query(MindMap).filter(MindMap.user_id == user_id).all()
+    return db.query(MindMap).options(undefer_group("content")).filter(MindMap.user_id == user_id).all()
 
 
 def get_mind_map(db: Session, mind_map_id: str, user_id: str) -> Optional[MindMap]:
@@ -26,7 +27,8 @@ def create_mind_map(
     title: str,
     notebook_id: str,
     description: Optional[str] = None,
-    max_depth: int = 3
+    max_depth: int = 3,
+    status: str = "ready"
 ) -> MindMap:
     """Create a new mind map"""
     mind_map = MindMap(
@@ -37,7 +39,9 @@ def create_mind_map(
         description=description,
         max_depth=max_depth,
         nodes=[],
-        edges=[]
+        edges=[],
+        graph=build_index([], []),
+        status=status
     )
     db.add(mind_map)
     db.commit()
@@ -53,11 +57,12 @@ def update_mind_map_data(
     node_count: int,
     depth: int
 ) -> Optional[MindMap]:
-    """Update mind map with generated nodes and edges"""
+    """Update mind map with generated nodes and edges (and rebuild its graph index)"""
     mind_map = db.query(MindMap).filter(MindMap.id == mind_map_id).first()
     if mind_map:
         mind_map.nodes = nodes
         mind_map.edges = edges
+        mind_map.graph = build_index(nodes, edges)
         mind_map.node_count = node_count
         mind_map.depth = depth
         db.commit()
@@ -65,6 +70,78 @@ def update_mind_map_data(
     return mind_map
 
 
+def get_mind_map_graph(db: Session, mind_map_id: str, user_id: str) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    A mind map's notebook ID and graph index, without loading its nodes or edges
+
+    Maps saved before the index existed get it built (and saved) on first use.
+    """
+    row = db.query(MindMap.notebook_id, MindMap.graph).filter(
+        MindMap.id == mind_map_id,
+        MindMap.user_id == user_id
+    ).first()
+    if row is None:
+        return None
+    notebook_id, graph = row
+    if graph is None:
+        mind_map = get_mind_map(db, mind_map_id, user_id)
+        graph = build_index(mind_map.nodes or [], mind_map.edges or [])
+        mind_map.graph = graph
+        db.commit()
+    return notebook_id, graph
+
+
+def get_mind_map_elements(
+    db: Session,
+    mind_map_id: str,
+    node_positions: List[int],
+    edge_positions: Optional[List[int]] = None
+) -> Tuple[List[dict], List[dict]]:
+    """
+    Read only the given nodes and edges of a mind map (by position, see get_mind_map_graph)
+
+    The elements are extracted from the JSON columns by the database, so
+    the rest of the map is never sent or deserialised.
+    """
+    edge_positions = edge_positions or []
+    columns = [MindMap.nodes[p] for p in node_positions] + [MindMap.edges[p] for p in edge_positions]
+    if not columns:
+        return [], []
+    row = db.query(*columns).filter(MindMap.id == mind_map_id).first()
+    if row is None:
+        return [], []
+    values = list(row)
+    return values[:len(node_positions)], values[len(node_positions):]
+
+
+def update_mind_map_status(
+    db: Session,
+    mind_map_id: str,
+    status: str,
+    progress: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None
+) -> Optional[MindMap]:
+    """Update a mind map's generation status (and progress, if given)"""
+    mind_map = db.query(MindMap).filter(MindMap.id == mind_map_id).first()
+    if mind_map:
+        mind_map.status = status
+        if progress is not None:
+            mind_map.progress = progress
+        mind_map.error = error
+        db.commit()
+        db.refresh(mind_map)
+    return mind_map
+
+
+def fail_interrupted_mind_maps(db: Session) -> int:
+    """Mark mind maps still generating (from before a restart) as failed; returns how many"""
+    count = db.query(MindMap).filter(MindMap.status == "generating").update(
+        {"status": "failed", "error": "Generation was interrupted by a server restart"}
+    )
+    db.commit()
+    return count
+
+
 def delete_mind_map(db: Session, mind_map_id: str, user_id: str) -> bool:
     """Delete a mind map"""
     mind_map = get_mind_map(db, mind_map_id, user_id)
@@ -2,7 +2,7 @@
 Mind map database models
 """
 from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
 import uuid
 from .database import Base
@@ -19,8 +19,13 @@ class MindMap(Base):
     max_depth = Column(Integer, default=3)
     node_count = Column(Integer, default=0)
     depth = Column(Integer, default=0)
-    nodes = Column(JSON, default=list)  # List of node objects
-    edges = Column(JSON, default=list)  # List of edge objects
+    # Loaded on first access, so lookups through `graph` don't read the full map
+    nodes = deferred(Column(JSON, default=list), group="content")  # List of node objects
+    edges = deferred(Column(JSON, default=list), group="content")  # List of edge objects
+    graph = deferred(Column(JSON, nullable=True))  # Node positions, adjacency lists and degrees (see utils.mind_map_graph)
+    status = Column(String, default="ready")  # generating, ready or failed
+    progress = Column(JSON, nullable=True)  # Generation stage and nodes per depth so far
+    error = Column(Text, nullable=True)  # Why generation failed
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -62,6 +62,11 @@ from .api.flashcards import router as flashcards_router
 from .api.mindmaps import router as mindmaps_router
 from .api.gamification import router as gamification_router
 from .db import init_db
+from .db.database import SessionLocal
+from .db.mindmap_crud import fail_interrupted_mind_maps
+from .services.llm_wrapper import llm_wrapper
+from .services.model_residency import model_residency
+from .services.generation_jobs import mind_map_jobs, node_details_prefetch_jobs
 
 app.include_router(api_router, prefix="/api", tags=["api"])
 app.include_router(notebooks_router, prefix="/api", tags=["notebooks"])
@@ -79,15 +84,34 @@ async def startup_event():
     try:
         init_db()
         logger.info("✅ PostgreSQL database initialized")
+        db = SessionLocal()
+        try:
+            interrupted = fail_interrupted_mind_maps(db)
+        finally:
+            db.close()
+        if interrupted:
+            logger.warning(f"⚠️  Marked {interrupted} interrupted mind map generation(s) as failed")
     except Exception as e:
         logger.error(f"❌ Failed to initialize database: {e}")
         logger.warning("⚠️  Make sure PostgreSQL is running!")
     
     logger.info("📂 ChromaDB initialized")
     logger.info("🤖 LLM wrapper ready")
+    
+    # Load the model in the background so the first question doesn't pay the load time
+    await model_residency.start()
     logger.info("✅ Server is ready!")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled connections on shutdown"""
+    await model_residency.stop()
+    await mind_map_jobs.shutdown()
+    await node_details_prefetch_jobs.shutdown()
+    await llm_wrapper.aclose()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -47,6 +47,13 @@ class AskRequest(BaseModel):
     question: str = Field(..., min_length=1)
     top_k: int = Field(default=4, ge=1, le=20)
     use_summary: bool = Field(default=True)
+    document_ids: Optional[List[str]] = Field(None, description="Only retrieve from these documents")
+    sources: Optional[List[str]] = Field(None, description="Only retrieve from these source filenames")
+    page_start: Optional[int] = Field(None, ge=1, description="First page (1-based) to retrieve from")
+    page_end: Optional[int] = Field(None, ge=1, description="Last page (1-based) to retrieve from")
+    use_cache: bool = Field(default=True, description="Allow answers cached for a near-identical question")
+    fast_mode: bool = Field(default=False, description="Quote the answer from the top chunk when retrieval is confident, skipping generation")
+    continue_generation: bool = Field(default=False, description="With fast_mode, generate the full answer in the background (poll /ask/followup/{followup_id})")
 
 
 class AskResponse(BaseModel):
@@ -54,7 +61,42 @@ class AskResponse(BaseModel):
     answer: str
     source_chunks: List[SourceChunk]
     used_prompt: Optional[str] = None
+    prompt_tokens: Optional[int] = None
     model: Optional[str] = None
+    cached: bool = False
+    degraded: bool = False  # generation ran out of time; the answer is the best excerpt
+    extractive: bool = False  # quoted from the top chunk by the fast path, not generated
+    followup_id: Optional[str] = None  # full answer still being generated in the background
+
+
+class AskFollowupResponse(BaseModel):
+    """Status of a full answer generated after an extractive one"""
+    followup_id: str
+    status: str  # pending, done or failed
+    answer: Optional[AskResponse] = None
+    error: Optional[str] = None
+
+
+class AskBatchRequest(BaseModel):
+    """Request model for answering several questions at once"""
+    user_id: str = Field(..., description="Auth0 user ID")
+    notebook_id: Optional[str] = Field(None, description="Notebook ID to query (if None, queries all notebooks)")
+    questions: List[str] = Field(..., min_length=1, max_length=50)
+    top_k: int = Field(default=4, ge=1, le=20)
+    use_summary: bool = Field(default=True)
+    document_ids: Optional[List[str]] = Field(None, description="Only retrieve from these documents")
+    sources: Optional[List[str]] = Field(None, description="Only retrieve from these source filenames")
+    page_start: Optional[int] = Field(None, ge=1, description="First page (1-based) to retrieve from")
+    page_end: Optional[int] = Field(None, ge=1, description="Last page (1-based) to retrieve from")
+    use_cache: bool = Field(default=True, description="Allow answers cached for a near-identical question")
+
+
+class AskBatchItem(BaseModel):
+    """One streamed result of a batch question request"""
+    index: int
+    question: str
+    response: Optional[AskResponse] = None
+    error: Optional[str] = None
 
 
 class QuizQuestion(BaseModel):
@@ -74,6 +116,10 @@ class GenerateQuizRequest(BaseModel):
     topic: str
     difficulty: str = Field(default="medium", pattern="^(easy|medium|hard)$")
     num_questions: int = Field(default=5, ge=1, le=20)
+    document_ids: Optional[List[str]] = Field(None, description="Only generate from these documents")
+    sources: Optional[List[str]] = Field(None, description="Only generate from these source filenames")
+    page_start: Optional[int] = Field(None, ge=1, description="First page (1-based) to generate from")
+    page_end: Optional[int] = Field(None, ge=1, description="Last page (1-based) to generate from")
 
 
 class GenerateQuizResponse(BaseModel):
@@ -82,6 +128,7 @@ class GenerateQuizResponse(BaseModel):
     questions: List[QuizQuestion]
     topic: str
     difficulty: str
+    degraded: bool = False  # the deadline cut generation short; fewer questions than requested
 
 
 class SyncPushRequest(BaseModel):
@@ -111,6 +158,7 @@ class HealthResponse(BaseModel):
     embedder_model: str
     llm_model: str
     chroma_collections: int
+    llm_status: Optional[Dict[str, Any]] = None
 
 
 class NotebookCreate(BaseModel):
@@ -148,3 +196,77 @@ class DocumentResponse(BaseModel):
     chunkCount: int
     createdAt: Optional[str] = None
     updatedAt: Optional[str] = None
+
+
+# Structured LLM output (JSON schemas passed to the model's `format` option)
+
+def _to_str(value: Any) -> Any:
+    return str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+
+
+class QuizQuestionOutput(BaseModel):
+    """One generated multiple-choice question"""
+    question: str = Field(..., min_length=1)
+    options: List[str] = Field(..., min_length=4, max_length=4)
+    correct_answer: int = Field(..., ge=0, le=3)
+    explanation: str = "Generated from your documents."
+    hint: Optional[str] = None
+    incorrect_explanations: Optional[List[str]] = None
+
+    @field_validator("options", mode="before")
+    @classmethod
+    def keep_four_options(cls, value: Any) -> Any:
+        return value[:4] if isinstance(value, list) else value
+
+    @field_validator("correct_answer", mode="before")
+    @classmethod
+    def letter_to_index(cls, value: Any) -> Any:
+        # Models sometimes answer "B" or "2" instead of 1
+        if isinstance(value, str):
+            value = value.strip().rstrip(")").upper()
+            if len(value) == 1 and value in "ABCD":
+                return "ABCD".index(value)
+        return value
+
+
+class QuizOutput(BaseModel):
+    """Generated quiz"""
+    questions: List[QuizQuestionOutput]
+
+
+class FlashcardOutput(BaseModel):
+    """One generated flashcard"""
+    front: str = Field(..., min_length=1)
+    back: str = Field(..., min_length=1)
+
+
+class FlashcardsOutput(BaseModel):
+    """Generated flashcards"""
+    cards: List[FlashcardOutput]
+
+
+class MindMapNodeOutput(BaseModel):
+    """One generated mind map node"""
+    id: str
+    label: str = Field(..., min_length=1)
+    content: str = ""
+    depth: int = Field(0, ge=0)
+
+    _coerce_id = field_validator("id", mode="before")(_to_str)
+
+
+class MindMapEdgeOutput(BaseModel):
+    """One generated mind map edge"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    from_: str = Field(..., alias="from")
+    to: str
+    label: str = ""
+
+    _coerce_ids = field_validator("from_", "to", mode="before")(_to_str)
+
+
+class MindMapOutput(BaseModel):
+    """Generated mind map"""
+    nodes: List[MindMapNodeOutput]
+    edges: List[MindMapEdgeOutput] = []
@@ -0,0 +1,199 @@
+"""
+Semantic answer cache for /ask, scoped per notebook
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """Cache of answers keyed by question embedding
+
+    A lookup hits when a cached question in the same notebook (and with the
+    same retrieval options) has cosine similarity >= threshold with the new
+    question. Each notebook holds at most `max_entries` answers, evicted
+    least-recently-used first; entries older than `ttl_seconds` are ignored
+    and dropped. Adding or removing documents invalidates the notebook, and
+    an answer generated from retrieval that started before the invalidation
+    is not stored.
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_notebooks: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        self.threshold = threshold if threshold is not None else float(os.getenv("CLARITY_ANSWER_CACHE_THRESHOLD", "0.95"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("CLARITY_ANSWER_CACHE_TTL", "3600"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("CLARITY_ANSWER_CACHE_MAX_ENTRIES", "256"))
+        self.max_notebooks = max_notebooks if max_notebooks is not None else int(os.getenv("CLARITY_ANSWER_CACHE_MAX_NOTEBOOKS", "64"))
+        self.enabled = enabled if enabled is not None else os.getenv("CLARITY_ANSWER_CACHE_ENABLED", "true").lower() == "true"
+
+        # notebook key -> OrderedDict(entry id -> entry), most recently used last
+        self._buckets: "OrderedDict[Tuple[str, str], OrderedDict]" = OrderedDict()
+        self._next_id = 0
+        # notebook key -> number of invalidations so far
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "stale_stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def _notebook_key(user_id: str, notebook_id: Optional[str]) -> Tuple[str, str]:
+        return (user_id, notebook_id or "__all__")
+
+    def version(self, user_id: str, notebook_id: Optional[str]) -> int:
+        """Current version of a notebook's documents; read it before retrieval and pass it to store()"""
+        with self._lock:
+            return self._versions.get(self._notebook_key(user_id, notebook_id), 0)
+
+    def lookup(
+        self,
+        user_id: str,
+        notebook_id: Optional[str],
+        query_embedding: List[float],
+        variant: str = ""
+    ) -> Optional[Any]:
+        """
+        Find a cached answer for a semantically equivalent question
+
+        Args:
+            user_id: Auth0 user ID
+            notebook_id: Notebook ID (None for the cross-notebook collection)
+            query_embedding: Embedding of the new question
+            variant: Retrieval options that must match exactly (top_k, scope, ...)
+
+        Returns:
+            Cached response, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        query = _unit(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(self._notebook_key(user_id, notebook_id))
+            if not bucket:
+                self._stats["misses"] += 1
+                return None
+
+            expired = [entry_id for entry_id, entry in bucket.items() if now - entry["created_at"] > self.ttl_seconds]
+            for entry_id in expired:
+                del bucket[entry_id]
+            self._stats["expirations"] += len(expired)
+
+            candidates = [(entry_id, entry) for entry_id, entry in bucket.items() if entry["variant"] == variant]
+            if not candidates:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = np.stack([entry["embedding"] for _, entry in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self._stats["misses"] += 1
+                return None
+
+            entry_id, entry = candidates[best]
+            bucket.move_to_end(entry_id)
+            self._buckets.move_to_end(self._notebook_key(user_id, notebook_id))
+            self._stats["hits"] += 1
+            logger.info(f"Answer cache hit (similarity {similarities[best]:.3f}) for notebook {notebook_id}")
+            return entry["response"]
+
+    def store(
+        self,
+        user_id: str,
+        notebook_id: Optional[str],
+        query_embedding: List[float],
+        response: Any,
+        version: int,
+        variant: str = ""
+    ) -> bool:
+        """
+        Cache a response for a question embedding
+
+        Args:
+            version: Notebook version read (via version()) before retrieval
+            variant: Retrieval options the response was generated with
+
+        Returns:
+            False if not stored because the notebook changed in the meantime
+        """
+        if not self.enabled:
+            return False
+
+        key = self._notebook_key(user_id, notebook_id)
+        with self._lock:
+            if self._versions.get(key, 0) != version:
+                self._stats["stale_stores"] += 1
+                return False
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = OrderedDict()
+                if len(self._buckets) > self.max_notebooks:
+                    _, evicted = self._buckets.popitem(last=False)
+                    self._stats["evictions"] += len(evicted)
+            self._buckets.move_to_end(key)
+
+            self._next_id += 1
+            bucket[self._next_id] = {
+                "embedding": _unit(query_embedding),
+                "response": response,
+                "variant": variant,
+                "created_at": time.monotonic(),
+            }
+            self._stats["stores"] += 1
+            while len(bucket) > self.max_entries:
+                bucket.popitem(last=False)
+                self._stats["evictions"] += 1
+            return True
+
+    def invalidate(self, user_id: str, notebook_id: Optional[str]) -> int:
+        """
+        Drop all cached answers for a notebook (call when its documents change)
+
+        Returns:
+            Number of entries dropped
+        """
+        key = self._notebook_key(user_id, notebook_id)
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            bucket = self._buckets.pop(key, None)
+            dropped = len(bucket) if bucket else 0
+            if dropped:
+                self._stats["invalidations"] += 1
+                logger.info(f"Invalidated {dropped} cached answers for notebook {notebook_id}")
+            return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, hit rate and current size"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": sum(len(bucket) for bucket in self._buckets.values()),
+                "notebooks": len(self._buckets),
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+# Global instance
+answer_cache = SemanticAnswerCache()
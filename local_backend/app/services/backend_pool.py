@@ -0,0 +1,266 @@
+"""
+Pool of Ollama endpoints: health, in-flight tracking and least-loaded routing
+"""
+import os
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set
+import logging
+
+import httpx
+import requests
+
+from .circuit_breaker import CircuitBreaker, LLMUnavailableError, PROBE, REJECT, CLOSED, counts_as_failure
+
+logger = logging.getLogger(__name__)
+
+
+def parse_endpoints(value: str) -> List[str]:
+    """Split a comma-separated endpoint list, dropping blanks and trailing slashes"""
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+
+class BackendNode:
+    """One Ollama endpoint: its circuit breaker, in-flight count and installed models"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.breaker = CircuitBreaker(name=url)
+        self.in_flight = 0
+        self.calls = 0
+        self.models: Optional[Set[str]] = None  # None until /api/tags has answered
+        self.models_checked_at = 0.0
+
+    def serves(self, model: str) -> bool:
+        """Whether `model` is installed here (assumed until the node has been checked)"""
+        if self.models is None:
+            return True
+        return model in self.models or f"{model}:latest" in self.models
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "state": self.breaker.state,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "models": sorted(self.models) if self.models is not None else None,
+            "circuit": self.breaker.status(),
+        }
+
+
+class BackendPool:
+    """Routes each call to the least-loaded healthy endpoint that has the model
+
+    Endpoints come from OLLAMA_BASE_URLS (comma-separated), falling back to
+    OLLAMA_BASE_URL. Every endpoint has its own circuit breaker. Installed
+    models are read from /api/tags and re-checked every `models_ttl`
+    seconds; the same request doubles as the half-open health probe. Ties
+    on in-flight count are broken round-robin.
+    """
+
+    def __init__(self, urls: Sequence[str], models_ttl: Optional[float] = None, max_connections: Optional[int] = None):
+        if not urls:
+            raise ValueError("Backend pool needs at least one endpoint")
+        self.nodes = [BackendNode(url) for url in urls]
+        self.models_ttl = models_ttl if models_ttl is not None else float(os.getenv("OLLAMA_MODELS_TTL", "60"))
+        self.max_connections = max_connections if max_connections is not None else int(os.getenv("OLLAMA_MAX_CONNECTIONS", "10"))
+        self._lock = threading.Lock()
+        self._turn = 0
+
+        # Shared keep-alive pool for async calls (bound to the event loop that created it)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_client_loop = None
+
+    @classmethod
+    def from_env(cls) -> "BackendPool":
+        urls = parse_endpoints(os.getenv("OLLAMA_BASE_URLS", "")) or [os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")]
+        return cls(urls)
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            connections = self.max_connections * len(self.nodes)
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+            )
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    # Model availability ------------------------------------------------
+
+    def _record_tags(self, node: BackendNode, tags: Optional[Dict[str, Any]]) -> bool:
+        node.models_checked_at = time.monotonic()
+        if tags is None:
+            return False
+        node.models = {m.get("name") for m in tags.get("models", [])} | {m.get("model") for m in tags.get("models", [])}
+        node.models.discard(None)
+        return True
+
+    def _fetch_tags(self, node: BackendNode) -> Optional[Dict[str, Any]]:
+        try:
+            response = requests.get(f"{node.url}/api/tags", timeout=2)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.debug(f"{node.url} /api/tags failed: {e}")
+            return None
+
+    async def _afetch_tags(self, node: BackendNode) -> Optional[Dict[str, Any]]:
+        try:
+            response = await self.get_async_client().get(f"{node.url}/api/tags", timeout=2)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.debug(f"{node.url} /api/tags failed: {e}")
+            return None
+
+    def refresh(self) -> int:
+        """Check every endpoint now; opens the circuit of those that don't answer. Returns the healthy count"""
+        healthy = 0
+        for node in self.nodes:
+            if self._record_tags(node, self._fetch_tags(node)):
+                healthy += 1
+                if node.breaker.state != CLOSED:
+                    node.breaker.probe_result(True)
+            else:
+                node.breaker.force_open("not responding to /api/tags")
+        return healthy
+
+    # Routing -----------------------------------------------------------
+
+    def _candidates(self, model: Optional[str], exclude: Sequence[BackendNode], only: Optional[BackendNode] = None) -> List[BackendNode]:
+        """Nodes that may serve `model`, least in-flight first (round-robin among ties)"""
+        if only is not None:
+            return [only] if only not in exclude and (model is None or only.serves(model)) else []
+        with self._lock:
+            self._turn += 1
+            count = len(self.nodes)
+            rotated = [self.nodes[(self._turn + i) % count] for i in range(count)]
+            nodes = [n for n in rotated if n not in exclude and (model is None or n.serves(model))]
+            return sorted(nodes, key=lambda n: n.in_flight)
+
+    def _needs_check(self, node: BackendNode, decision: str) -> bool:
+        return decision == PROBE or time.monotonic() - node.models_checked_at >= self.models_ttl
+
+    def _after_check(self, node: BackendNode, decision: str, tags: Optional[Dict[str, Any]], model: Optional[str]) -> bool:
+        """Apply a tags check; True if the node can take the call"""
+        ok = self._record_tags(node, tags)
+        if decision == PROBE:
+            node.breaker.probe_result(ok, None if ok else "health probe failed")
+        elif not ok:
+            node.breaker.record_failure(ConnectionError(f"{node.url} not responding to /api/tags"))
+        return ok and (model is None or node.serves(model))
+
+    def _claim(self, node: BackendNode) -> BackendNode:
+        with self._lock:
+            node.in_flight += 1
+            node.calls += 1
+        return node
+
+    def _release(self, node: BackendNode, error: Optional[BaseException]) -> None:
+        with self._lock:
+            node.in_flight -= 1
+        if error is None:
+            node.breaker.record_success()
+        elif isinstance(error, Exception) and counts_as_failure(error):
+            # Cancellation and early-closed streams say nothing about the endpoint
+            node.breaker.record_failure(error)
+
+    def _unavailable(self, model: Optional[str]) -> LLMUnavailableError:
+        if model and not any(n.serves(model) for n in self.nodes):
+            return LLMUnavailableError(f"Model {model} is not installed on any Ollama endpoint")
+        errors = "; ".join(f"{n.url}: {n.breaker.state}" for n in self.nodes)
+        return LLMUnavailableError(f"No healthy Ollama endpoint for {model or 'request'} ({errors})")
+
+    def _acquire(self, model: Optional[str], exclude: Sequence[BackendNode], only: Optional[BackendNode] = None) -> BackendNode:
+        for node in self._candidates(model, exclude, only):
+            decision = node.breaker.admit()
+            if decision == REJECT:
+                continue
+            if self._needs_check(node, decision) and not self._after_check(node, decision, self._fetch_tags(node), model):
+                continue
+            return self._claim(node)
+        raise self._unavailable(model)
+
+    async def _aacquire(self, model: Optional[str], exclude: Sequence[BackendNode], only: Optional[BackendNode] = None) -> BackendNode:
+        for node in self._candidates(model, exclude, only):
+            decision = node.breaker.admit()
+            if decision == REJECT:
+                continue
+            if self._needs_check(node, decision) and not self._after_check(node, decision, await self._afetch_tags(node), model):
+                continue
+            return self._claim(node)
+        raise self._unavailable(model)
+
+    @contextmanager
+    def lease(
+        self,
+        model: Optional[str] = None,
+        exclude: Sequence[BackendNode] = (),
+        only: Optional[BackendNode] = None
+    ) -> Iterator[BackendNode]:
+        """
+        Hold the least-loaded healthy endpoint serving `model` for one call
+
+        The call's outcome feeds the endpoint's circuit breaker: leaving the
+        block normally counts as a success, an exception as a failure.
+
+        Args:
+            model: Model the call needs (None for any endpoint)
+            exclude: Endpoints already tried for this call
+            only: Use this endpoint (if it can take the call) instead of choosing
+
+        Raises:
+            LLMUnavailableError: If no endpoint can take the call
+        """
+        node = self._acquire(model, exclude, only)
+        error = None
+        try:
+            yield node
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release(node, error)
+
+    @asynccontextmanager
+    async def alease(
+        self,
+        model: Optional[str] = None,
+        exclude: Sequence[BackendNode] = (),
+        only: Optional[BackendNode] = None
+    ) -> AsyncIterator[BackendNode]:
+        """Async variant of lease()"""
+        node = await self._aacquire(model, exclude, only)
+        error = None
+        try:
+            yield node
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release(node, error)
+
+    def serving(self, model: str) -> List[BackendNode]:
+        """Endpoints with `model` installed whose circuit is closed"""
+        return [n for n in self.nodes if n.breaker.state == CLOSED and n.serves(model)]
+
+    def status(self) -> Dict[str, Any]:
+        """Per-endpoint health, load and models (for /health)"""
+        nodes = [n.status() for n in self.nodes]
+        return {
+            "endpoints": nodes,
+            "healthy": sum(1 for n in self.nodes if n.breaker.state == CLOSED),
+            "in_flight": sum(n.in_flight for n in self.nodes),
+        }
+
+
+# Global instance, shared by generation and embeddings so load on each box is counted once
+ollama_pool = BackendPool.from_env()
@@ -2,39 +2,119 @@
 ChromaDB service for vector storage and retrieval
 """
 import os
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+import bisect
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
+from .vector_store import VectorStore, create_vector_store
+from ..utils.chunker import count_tokens
+from ..utils.deadline import check_deadline
+
 logger = logging.getLogger(__name__)
 
+EMPTY_RESULTS = {"documents": [], "distances": [], "metadatas": [], "ids": []}
+
+
+def build_chunk_metadatas(
+    document_id: str,
+    source: str,
+    chunks: List[Tuple[str, int, int]],
+    page_offsets: Optional[List[int]] = None,
+    **extra: Any
+) -> List[Dict[str, Any]]:
+    """
+    Build metadata dicts for a document's chunks
+
+    Every ingest path writes the same keys with the same types so that
+    `where` filters on document_id, source and page hit Chroma's metadata
+    index instead of silently matching nothing.
+
+    Args:
+        document_id: ID of the document the chunks belong to
+        source: Original filename (or title) of the document
+        chunks: Chunker output as (text, char_start, char_end) tuples
+        page_offsets: Character offset at which each page starts (from chunker.join_pages)
+        **extra: Additional metadata copied onto every chunk (e.g. notebook_id)
+
+    Returns:
+        List of metadata dicts, one per chunk
+    """
+    metadatas = []
+    for i, (text, char_start, char_end) in enumerate(chunks):
+        metadata = {
+            "document_id": document_id,
+            "source": source,
+            "chunk_index": i,
+            "char_start": char_start,
+            "char_end": char_end,
+            "token_count": count_tokens(text),
+        }
+        if page_offsets:
+            # Pages are 1-based; a chunk may straddle a page break
+            metadata["page"] = bisect.bisect_right(page_offsets, char_start)
+            metadata["page_end"] = bisect.bisect_right(page_offsets, max(char_start, char_end - 1))
+        metadata.update(extra)
+        metadatas.append(metadata)
+    return metadatas
+
+
+def build_scope_filter(
+    document_ids: Optional[List[str]] = None,
+    sources: Optional[List[str]] = None,
+    page_start: Optional[int] = None,
+    page_end: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Build a Chroma `where` filter that scopes retrieval to part of a notebook
+
+    Args:
+        document_ids: Only match chunks from these documents
+        sources: Only match chunks from these source filenames
+        page_start: Only match chunks that end on or after this page (1-based)
+        page_end: Only match chunks that start on or before this page (1-based)
+
+    Returns:
+        A `where` dict, or None when no scope was requested
+    """
+    conditions = []
+    if document_ids:
+        conditions.append({"document_id": {"$in": list(document_ids)}})
+    if sources:
+        conditions.append({"source": {"$in": list(sources)}})
+    if page_start is not None:
+        conditions.append({"page_end": {"$gte": page_start}})
+    if page_end is not None:
+        conditions.append({"page": {"$lte": page_end}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
 
 class ChromaService:
-    """Service for managing ChromaDB collections and queries"""
+    """Service for managing vector collections and queries
+    
+    Storage is delegated to a VectorStore backend selected by
+    CLARITY_VECTOR_BACKEND ("chroma" by default, or "numpy").
+    """
     
-    def __init__(self, base_dir: Optional[str] = None):
+    def __init__(self, base_dir: Optional[str] = None, backend: Optional[str] = None):
         """
-        Initialize ChromaDB client
+        Initialize the vector store backend
         
         Args:
-            base_dir: Base directory for ChromaDB persistence (default: ~/.clarity/chroma/)
+            base_dir: Base directory for persistence (default: ~/.clarity/)
+            backend: Vector store backend (default from env: chroma)
         """
         if base_dir is None:
             base_dir = os.path.expanduser(os.getenv("CLARITY_BASE_DIR", "~/.clarity"))
+        if backend is None:
+            backend = os.getenv("CLARITY_VECTOR_BACKEND", "chroma")
         
-        self.chroma_dir = os.path.join(base_dir, "chroma")
-        os.makedirs(self.chroma_dir, exist_ok=True)
-        
-        logger.info(f"Initializing ChromaDB at: {self.chroma_dir}")
-        
-        self.client = chromadb.PersistentClient(
-            path=self.chroma_dir,
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            )
-        )
+        self.base_dir = base_dir
+        self.store: VectorStore = create_vector_store(backend, base_dir)
     
     def get_collection_name(self, user_id: str) -> str:
         """
@@ -50,21 +130,14 @@ class ChromaService:
         safe_user_id = user_id.replace("|", "_").replace("@", "_")
         return f"clarity_user__{safe_user_id}"
     
-    def get_or_create_collection(self, user_id: str):
-        """Get or create a collection for a user"""
-        collection_name = self.get_collection_name(user_id)
-        
-        try:
-            collection = self.client.get_collection(name=collection_name)
-            logger.info(f"Using existing collection: {collection_name}")
-        except Exception:
-            collection = self.client.create_collection(
-                name=collection_name,
-                metadata={"user_id": user_id}
-            )
-            logger.info(f"Created new collection: {collection_name}")
+    def get_notebook_collection_id(self, user_id: str, notebook_id: str) -> str:
+        """
+        Generate the collection key for a notebook
         
-        return collection
+        The result is passed wherever a `user_id` is expected, so that
+        notebook collections are named clarity_user__<user>__<notebook>.
+        """
+        return f"{user_id.replace('|', '_')}__{notebook_id}"
     
     def add_documents(
         self,
@@ -87,28 +160,54 @@ class ChromaService:
         Returns:
             Status dict with count
         """
-        collection = self.get_or_create_collection(user_id)
+        collection_name = self.get_collection_name(user_id)
         
         if ids is None:
             # Generate IDs
-            existing_count = collection.count()
+            existing_count = self.store.count(collection_name)
             ids = [f"doc_{existing_count + i}" for i in range(len(documents))]
         
-        collection.add(
+        self.store.add(
+            collection_name,
+            ids=ids,
+            embeddings=embeddings,
             documents=documents,
             metadatas=metadatas,
-            embeddings=embeddings,
-            ids=ids
+            collection_metadata={"user_id": user_id}
         )
         
-        logger.info(f"Added {len(documents)} documents to collection {collection.name}")
+        logger.info(f"Added {len(documents)} documents to collection {collection_name}")
         
         return {
             "status": "success",
             "count": len(documents),
-            "collection": collection.name
+            "collection": collection_name
         }
     
+    def _query_many(
+        self,
+        collection_name: str,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        filter_metadata: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Run one store query for several embeddings and split the results per query"""
+        results = self.store.query(
+            collection_name,
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            where=filter_metadata
+        )
+        return [
+            {
+                "documents": results["documents"][i] if results["documents"] else [],
+                "distances": results["distances"][i] if results["distances"] else [],
+                "metadatas": results["metadatas"][i] if results["metadatas"] else [],
+                "ids": results["ids"][i] if results["ids"] else []
+            }
+            for i in range(len(query_embeddings))
+        ]
+    
     def query(
         self,
         user_id: str,
@@ -128,36 +227,123 @@ class ChromaService:
         Returns:
             Query results with documents, distances, metadatas
         """
+        # Embedded Chroma has no query timeout: don't start a query the request has no time for
+        check_deadline("retrieval")
         try:
-            collection = self.get_or_create_collection(user_id)
+            return self._query_many(self.get_collection_name(user_id), [query_embedding], top_k, filter_metadata)[0]
+        except Exception as e:
+            logger.error(f"Query error: {e}")
+            return dict(EMPTY_RESULTS)
+    
+    def query_notebook(
+        self,
+        user_id: str,
+        notebook_id: str,
+        query_embedding: List[float],
+        top_k: int = 4,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Query a notebook's collection without creating it if missing
+        
+        Args:
+            user_id: Auth0 user ID
+            notebook_id: Notebook ID
+            query_embedding: Query vector
+            top_k: Number of results to return
+            filter_metadata: Optional `where` filter (see build_scope_filter)
             
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                where=filter_metadata
-            )
+        Returns:
+            Query results with documents, distances, metadatas, ids
+        """
+        return self.query_batch(user_id, [query_embedding], top_k, filter_metadata, notebook_id=notebook_id)[0]
+    
+    def query_batch(
+        self,
+        user_id: str,
+        query_embeddings: List[List[float]],
+        top_k: int = 4,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        notebook_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Query a user's (or notebook's) collection with several embeddings at once
+        
+        Args:
+            user_id: Auth0 user ID
+            query_embeddings: Query vectors
+            top_k: Number of results per query
+            filter_metadata: Optional `where` filter applied to every query
+            notebook_id: Query this notebook's collection instead of the user's
             
-            return {
-                "documents": results["documents"][0] if results["documents"] else [],
-                "distances": results["distances"][0] if results["distances"] else [],
-                "metadatas": results["metadatas"][0] if results["metadatas"] else [],
-                "ids": results["ids"][0] if results["ids"] else []
-            }
+        Returns:
+            One results dict (documents, distances, metadatas, ids) per query embedding
+        """
+        collection_id = self.get_notebook_collection_id(user_id, notebook_id) if notebook_id else user_id
+        check_deadline("retrieval")
+        try:
+            return self._query_many(self.get_collection_name(collection_id), query_embeddings, top_k, filter_metadata)
+        except Exception as e:
+            logger.warning(f"Collection not found or error: {e}")
+            return [dict(EMPTY_RESULTS) for _ in query_embeddings]
+    
+    def get_chunks(
+        self,
+        user_id: str,
+        notebook_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        include_embeddings: bool = False,
+        ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Chunks stored in a user's (or notebook's) collection, without a query
+
+        Args:
+            user_id: Auth0 user ID
+            notebook_id: Read this notebook's collection instead of the user's
+            limit: Most chunks to return (all if None)
+            include_embeddings: Also return the stored embedding of each chunk
+            ids: Only return these chunks
+
+        Returns:
+            Dict with ids, documents, metadatas and embeddings (empty if the collection is missing)
+        """
+        collection_id = self.get_notebook_collection_id(user_id, notebook_id) if notebook_id else user_id
+        try:
+            return self.store.get(self.get_collection_name(collection_id), include_embeddings=include_embeddings, limit=limit, ids=ids)
+        except Exception as e:
+            logger.warning(f"Collection not found or error: {e}")
+            return {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+
+    def get_notebook_chunks(self, user_id: str, notebook_id: str, include_embeddings: bool = True) -> Dict[str, Any]:
+        """Every chunk in a notebook's collection, with embeddings by default (see get_chunks)"""
+        return self.get_chunks(user_id, notebook_id=notebook_id, include_embeddings=include_embeddings)
+
+    def delete_document_chunks(self, user_id: str, document_id: str) -> bool:
+        """
+        Delete all chunks belonging to a document
         
+        Args:
+            user_id: Collection key (user ID or notebook collection ID)
+            document_id: Document ID stored in chunk metadata
+            
+        Returns:
+            True if the delete was issued
+        """
+        collection_name = self.get_collection_name(user_id)
+        try:
+            self.store.delete(collection_name, where={"document_id": document_id})
+            logger.info(f"Deleted chunks of document {document_id} from {collection_name}")
+            return True
         except Exception as e:
-            logger.error(f"Query error: {e}")
-            return {
-                "documents": [],
-                "distances": [],
-                "metadatas": [],
-                "ids": []
-            }
+            logger.warning(f"Failed to delete chunks of document {document_id}: {e}")
+            return False
     
     def delete_collection(self, user_id: str) -> bool:
         """Delete a user's collection"""
         collection_name = self.get_collection_name(user_id)
         try:
-            self.client.delete_collection(name=collection_name)
+            self.store.delete_collection(collection_name)
             logger.info(f"Deleted collection: {collection_name}")
             return True
         except Exception as e:
@@ -166,16 +352,11 @@ class ChromaService:
     
     def list_collections(self) -> List[str]:
         """List all collections"""
-        collections = self.client.list_collections()
-        return [col.name for col in collections]
+        return self.store.list_collections()
     
     def get_collection_count(self, user_id: str) -> int:
         """Get document count in user's collection"""
-        try:
-            collection = self.get_or_create_collection(user_id)
-            return collection.count()
-        except Exception:
-            return 0
+        return self.store.count(self.get_collection_name(user_id))
 
 
 # Global instance
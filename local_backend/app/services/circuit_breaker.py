@@ -0,0 +1,143 @@
+"""
+Circuit breaker for LLM backends: fail fast while a backend is down
+"""
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import logging
+
+from ..utils.deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"        # calls go through
+OPEN = "open"            # calls fail fast until the reset timeout passes
+HALF_OPEN = "half_open"  # one health probe decides whether to close again
+
+# admit() decisions
+CALL = "call"
+PROBE = "probe"
+REJECT = "reject"
+
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when the LLM backend is unavailable and fallback output is disabled"""
+
+
+def counts_as_failure(error: BaseException) -> bool:
+    """Transport errors, timeouts and 5xx responses trip the breaker; 4xx (bad request, unknown model) don't"""
+    if isinstance(error, DeadlineExceeded):
+        # The request ran out of time, not the backend
+        return False
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status >= 500
+
+
+class CircuitBreaker:
+    """Tracks backend failures and stops sending calls to a backend that is down
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are rejected immediately. Once `reset_timeout` seconds have passed,
+    the next call is admitted as a health probe (half-open): if the probe
+    succeeds the circuit closes, otherwise it stays open for another
+    `reset_timeout`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold if failure_threshold is not None else int(os.getenv("CLARITY_LLM_BREAKER_FAILURES", "3"))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv("CLARITY_LLM_BREAKER_RESET", "30"))
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.transitions: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self._lock = threading.Lock()
+        self._stats = {"successes": 0, "failures": 0, "rejected": 0, "probes": 0}
+
+    def admit(self) -> str:
+        """
+        Decide what to do with a call
+
+        Returns:
+            CALL to go ahead, PROBE to run a health probe first (the circuit
+            is now half-open), or REJECT to fail fast
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return CALL
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN, "reset timeout elapsed, probing")
+                self._stats["probes"] += 1
+                return PROBE
+            # Open, or another call is already probing
+            self._stats["rejected"] += 1
+            return REJECT
+
+    def probe_result(self, healthy: bool, error: Optional[str] = None) -> None:
+        """Close or re-open the circuit after a half-open probe"""
+        with self._lock:
+            if healthy:
+                self.consecutive_failures = 0
+                self._transition(CLOSED, "probe succeeded")
+            else:
+                self.last_error = error or self.last_error
+                self._open("probe failed")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._stats["successes"] += 1
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                self._transition(CLOSED, "call succeeded")
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error) or type(error).__name__
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self._open(f"{self.consecutive_failures} consecutive failures")
+
+    def force_open(self, reason: str) -> None:
+        """Open the circuit without waiting for failures (e.g. startup probe failed)"""
+        with self._lock:
+            self.last_error = reason
+            self._open(reason)
+
+    def _open(self, reason: str) -> None:
+        self.opened_at = time.monotonic()
+        self._transition(OPEN, reason)
+
+    def _transition(self, state: str, reason: str) -> None:
+        if state == self.state and state != OPEN:
+            return
+        log = logger.info if state == CLOSED else logger.warning
+        log(f"LLM circuit {self.name}: {self.state} -> {state} ({reason})")
+        self.transitions.append({"at": time.time(), "from": self.state, "to": state, "reason": reason})
+        self.state = state
+
+    def status(self) -> Dict[str, Any]:
+        """State, failure counters and recent transitions (for /health)"""
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "retry_in_seconds": retry_in,
+                "last_error": self.last_error,
+                "transitions": list(self.transitions),
+                **self._stats,
+            }
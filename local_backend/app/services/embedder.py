@@ -6,29 +6,27 @@ from typing import List
 import logging
 import requests
 
+from .backend_pool import ollama_pool
+from ..utils.deadline import DeadlineExceeded, check_deadline, stage_timeout
+
 logger = logging.getLogger(__name__)
 
 # Configuration
 EMBEDDER_TYPE = None
 EMBEDDER_MODEL = None
 EMBEDDING_DIM = 0
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
 
 # Try Ollama first if using nomic-embed-text
 if EMBEDDING_MODEL == "nomic-embed-text":
-    try:
-        # Test Ollama connection
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=2)
-        if response.status_code == 200:
-            EMBEDDER_TYPE = "ollama"
-            EMBEDDER_MODEL = "nomic-embed-text"
-            EMBEDDING_DIM = 768
-            logger.info(f"✅ Using Ollama for embeddings: {EMBEDDER_MODEL} (768-dim)")
-        else:
-            raise ConnectionError("Ollama not responding")
-    except Exception as e:
-        logger.warning(f"Ollama not available ({e}), falling back to sentence-transformers")
+    # Test Ollama endpoints
+    if ollama_pool.refresh():
+        EMBEDDER_TYPE = "ollama"
+        EMBEDDER_MODEL = "nomic-embed-text"
+        EMBEDDING_DIM = 768
+        logger.info(f"✅ Using Ollama for embeddings: {EMBEDDER_MODEL} (768-dim) on {len(ollama_pool.serving(EMBEDDER_MODEL))} endpoints")
+    else:
+        logger.warning("Ollama not available, falling back to sentence-transformers")
         EMBEDDER_TYPE = None
 
 # Fallback to sentence-transformers
@@ -62,7 +60,37 @@ class Embedder:
     def __init__(self):
         self.type = EMBEDDER_TYPE
         self.model_name = EMBEDDER_MODEL
-        self.ollama_url = OLLAMA_BASE_URL
+        # Requests go to the least-loaded healthy Ollama endpoint that has the model
+        self.pool = ollama_pool
+        # Off by default: /api/embed returns L2-normalised vectors, which Chroma's L2
+        # distance would rank differently against collections ingested with the
+        # unnormalised per-text /api/embeddings. Enable only for freshly ingested data.
+        self.ollama_batch = os.getenv("OLLAMA_EMBED_BATCH", "false").lower() == "true"
+    
+    def _post_ollama(self, path: str, payload: dict, default_timeout: float) -> dict:
+        """POST to the least-loaded Ollama endpoint, with the timeout shrunk to the request deadline"""
+        timeout = stage_timeout(default_timeout, "embedding")
+        with self.pool.lease(self.model_name) as node:
+            try:
+                response = requests.post(f"{node.url}{path}", json=payload, timeout=timeout)
+            except requests.Timeout as e:
+                if timeout < default_timeout:
+                    # Cut short by the deadline, not the endpoint's fault
+                    raise DeadlineExceeded("Request deadline exceeded during embedding") from e
+                raise
+            response.raise_for_status()
+            return response.json()
+    
+    def _embed_batch_ollama(self, texts: List[str]) -> List[List[float]]:
+        """Embed several texts in one Ollama /api/embed request"""
+        return self._post_ollama(
+            "/api/embed",
+            {
+                "model": self.model_name,
+                "input": texts
+            },
+            30 + 2 * len(texts)
+        )["embeddings"]
         
     def embed_texts(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
         """
@@ -79,28 +107,40 @@ class Embedder:
             return []
         
         if self.type == "ollama":
-            # Use Ollama API for nomic-embed-text
+            # Use Ollama's batch endpoint; older servers only have per-text /api/embeddings
             embeddings = []
-            for text in texts:
-                try:
-                    response = requests.post(
-                        f"{self.ollama_url}/api/embeddings",
-                        json={
-                            "model": self.model_name,
-                            "prompt": text
-                        },
-                        timeout=30
-                    )
-                    response.raise_for_status()
-                    embedding = response.json()["embedding"]
-                    embeddings.append(embedding)
-                except Exception as e:
-                    logger.error(f"Ollama embedding failed: {e}")
-                    raise
+            for i in range(0, len(texts), batch_size):
+                batch = texts[i:i + batch_size]
+                if self.ollama_batch:
+                    try:
+                        embeddings.extend(self._embed_batch_ollama(batch))
+                        continue
+                    except requests.HTTPError as e:
+                        if e.response is None or e.response.status_code != 404:
+                            logger.error(f"Ollama embedding failed: {e}")
+                            raise
+                        logger.info("Ollama /api/embed not available, embedding one text per request")
+                        self.ollama_batch = False
+                
+                for text in batch:
+                    try:
+                        embedding = self._post_ollama(
+                            "/api/embeddings",
+                            {
+                                "model": self.model_name,
+                                "prompt": text
+                            },
+                            30
+                        )["embedding"]
+                        embeddings.append(embedding)
+                    except Exception as e:
+                        logger.error(f"Ollama embedding failed: {e}")
+                        raise
             
             return embeddings
         
         elif self.type == "sentence-transformers":
+            check_deadline("embedding")
             model = get_model()
             
             # Process in batches
@@ -0,0 +1,200 @@
+"""
+Extractive fast-path answers: quote the retrieved sentences that answer the question
+"""
+import os
+import re
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+import logging
+
+import numpy as np
+
+from .embedder import embedder
+
+logger = logging.getLogger(__name__)
+
+# Sentence boundary: end punctuation followed by whitespace, or a blank line
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+# Fragments shorter than this (headings, list markers) are not answer candidates
+MIN_SENTENCE_CHARS = 20
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split a chunk into sentences, dropping fragments too short to answer anything"""
+    sentences = [" ".join(part.split()) for part in _SENTENCE_BREAK.split(text)]
+    return [s for s in sentences if len(s) >= MIN_SENTENCE_CHARS]
+
+
+def format_citation(metadata: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Human-readable source for a chunk, e.g. "notes.pdf, p. 3" (None without a source)"""
+    metadata = metadata or {}
+    source = metadata.get("title") or metadata.get("source")
+    if not source:
+        return None
+    page = metadata.get("page")
+    return f"{source}, p. {page}" if page else source
+
+
+def cosine(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Cosine similarity of `query` to each row of `vectors` (0 for zero vectors)"""
+    norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+    return (vectors @ query) / np.where(norms > 0, norms, 1.0)
+
+
+class ExtractiveSpan(NamedTuple):
+    text: str
+    score: float  # similarity of the best sentence to the question
+
+
+class ExtractiveAnswerer:
+    """Finds an answer span in the top retrieved chunk without calling the LLM
+
+    Only applies when the top chunk's cosine similarity to the question is
+    at least `min_chunk_score`. That similarity is computed from the chunk's
+    stored embedding rather than trusting the retrieval score, which is a
+    squared L2 distance on the chroma backend and so means something
+    different per backend. Only the sentences are embedded, in one call, and
+    only once the chunk passes. The best sentence must reach `min_sentence_score`; following
+    sentences that also pass are kept (up to `max_sentences`) so a
+    definition that runs over two sentences stays whole.
+    """
+
+    def __init__(
+        self,
+        min_chunk_score: Optional[float] = None,
+        min_sentence_score: Optional[float] = None,
+        max_sentences: Optional[int] = None,
+        embed_texts: Optional[Callable[[List[str]], List[List[float]]]] = None
+    ):
+        self.min_chunk_score = min_chunk_score if min_chunk_score is not None else float(os.getenv("CLARITY_EXTRACTIVE_MIN_SCORE", "0.75"))
+        self.min_sentence_score = min_sentence_score if min_sentence_score is not None else float(os.getenv("CLARITY_EXTRACTIVE_MIN_SENTENCE_SCORE", "0.7"))
+        self.max_sentences = max_sentences if max_sentences is not None else int(os.getenv("CLARITY_EXTRACTIVE_MAX_SENTENCES", "2"))
+        self.embed_texts = embed_texts or embedder.embed_texts
+        self._stats = {"attempts": 0, "answered": 0, "low_chunk_score": 0, "no_span": 0}
+        self._lock = threading.Lock()
+
+    def extract(
+        self,
+        question_embedding: List[float],
+        chunk_text: str,
+        chunk_embedding: Optional[List[float]] = None
+    ) -> Optional[ExtractiveSpan]:
+        """
+        Find the sentences of a chunk that answer the question
+
+        Blocks on the embedder: call it off the event loop.
+
+        Args:
+            question_embedding: Embedding of the question
+            chunk_text: Text of the top retrieved chunk
+            chunk_embedding: The chunk's stored embedding (embedded with the sentences if None)
+
+        Returns:
+            The answer span, or None when retrieval is not confident enough
+        """
+        self._count("attempts")
+        sentences = split_sentences(chunk_text)
+        if not sentences:
+            self._count("no_span")
+            return None
+
+        query = np.asarray(question_embedding, dtype=np.float32)
+        if chunk_embedding is None:
+            vectors = self.embed_texts([chunk_text] + sentences)
+            chunk_embedding, sentence_vectors = vectors[0], vectors[1:]
+        else:
+            sentence_vectors = None
+        if cosine(query, np.asarray([chunk_embedding], dtype=np.float32))[0] < self.min_chunk_score:
+            self._count("low_chunk_score")
+            return None
+
+        if sentence_vectors is None:
+            sentence_vectors = self.embed_texts(sentences)
+        scores = cosine(query, np.asarray(sentence_vectors, dtype=np.float32))
+        best = int(np.argmax(scores))
+        if scores[best] < self.min_sentence_score:
+            self._count("no_span")
+            return None
+
+        end = best + 1
+        while end < len(sentences) and end - best < self.max_sentences and scores[end] >= self.min_sentence_score:
+            end += 1
+        self._count("answered")
+        return ExtractiveSpan(" ".join(sentences[best:end]), float(scores[best]))
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """How often the fast path answered, and why it didn't"""
+        with self._lock:
+            return {
+                **self._stats,
+                "answer_rate": self._stats["answered"] / self._stats["attempts"] if self._stats["attempts"] else 0.0,
+                "min_chunk_score": self.min_chunk_score,
+                "min_sentence_score": self.min_sentence_score,
+            }
+
+
+class FollowupAnswers:
+    """Full answers still being generated after an extractive answer was returned
+
+    Holds at most `max_entries` follow-ups; the oldest are dropped (and
+    cancelled if still running) beyond that, and finished ones expire after
+    `ttl_seconds`.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("CLARITY_FOLLOWUP_MAX_ENTRIES", "256"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("CLARITY_FOLLOWUP_TTL", "600"))
+        # followup id -> {"user_id", "task", "created_at"}, oldest first
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def start(self, user_id: str, work: Awaitable[Any]) -> str:
+        """Run `work` in the background; returns the follow-up ID to poll"""
+        self._expire()
+        followup_id = str(uuid.uuid4())
+        task = asyncio.ensure_future(work)
+        task.add_done_callback(_log_failure)
+        self._entries[followup_id] = {
+            "user_id": user_id,
+            "task": task,
+            "created_at": time.monotonic(),
+        }
+        while len(self._entries) > self.max_entries:
+            _, dropped = self._entries.popitem(last=False)
+            dropped["task"].cancel()
+        return followup_id
+
+    def get(self, followup_id: str, user_id: str) -> Optional[asyncio.Future]:
+        """The follow-up's task, or None if unknown, expired or another user's"""
+        self._expire()
+        entry = self._entries.get(followup_id)
+        if entry is None or entry["user_id"] != user_id:
+            return None
+        return entry["task"]
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        expired = [
+            followup_id for followup_id, entry in self._entries.items()
+            if entry["task"].done() and now - entry["created_at"] > self.ttl_seconds
+        ]
+        for followup_id in expired:
+            del self._entries[followup_id]
+
+
+def _log_failure(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Background full answer failed: {task.exception()}")
+
+
+# Global instances
+extractive_answerer = ExtractiveAnswerer()
+followup_answers = FollowupAnswers()
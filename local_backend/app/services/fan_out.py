@@ -0,0 +1,76 @@
+"""
+Concurrent LLM shards merged as they finish (sharded quizzes, mind map branches)
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Generic, List, Optional, TypeVar
+import logging
+
+from .structured_output import StructuredOutputError
+from ..utils.deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class FanOut(Generic[T]):
+    """Run shards concurrently and iterate over their results in completion order
+
+    A shard that raises counts as failed and is skipped, whatever the
+    error, so one bad shard never discards what the others produced.
+    Leaving the `async with` block cancels the shards still running and
+    waits for them, so they leave the scheduler queue and close their
+    Ollama streams.
+
+        async with FanOut("Quiz shard", [run_shard(s) for s in slices]) as shards:
+            async for result in shards:
+                ...
+        if nothing_kept:
+            shards.raise_failure("No valid quiz questions were generated")
+    """
+
+    def __init__(self, label: str, work: List[Awaitable[T]]):
+        self.label = label
+        self.total = len(work)
+        self.failures = 0
+        self.timed_out: Optional[DeadlineExceeded] = None
+        self.error: Optional[Exception] = None
+        self._work = work
+        self._tasks: List[asyncio.Future] = []
+
+    async def __aenter__(self) -> "FanOut[T]":
+        self._tasks = [asyncio.ensure_future(work) for work in self._work]
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        for next_done in asyncio.as_completed(self._tasks):
+            try:
+                yield await next_done
+            except DeadlineExceeded as e:
+                # Keep what the finished shards produced
+                self.failures += 1
+                self.timed_out = e
+            except Exception as e:
+                self.failures += 1
+                self.error = e
+                logger.warning(f"{self.label} failed: {e}")
+
+    def raise_failure(self, message: str) -> None:
+        """
+        Raise for a fan-out that produced nothing usable
+
+        Raises:
+            DeadlineExceeded: If a shard ran out of time
+            Exception: The last shard error, unless it was a StructuredOutputError
+            StructuredOutputError: Otherwise, with `message`
+        """
+        if self.timed_out is not None:
+            raise self.timed_out
+        if self.error is not None and not isinstance(self.error, StructuredOutputError):
+            raise self.error
+        raise StructuredOutputError(message)
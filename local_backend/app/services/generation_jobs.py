@@ -0,0 +1,122 @@
+"""
+Background generation jobs with a concurrency limit and progress subscribers
+"""
+import os
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Receives each progress event a job publishes
+Publish = Callable[[Dict[str, Any]], None]
+
+
+class GenerationJobs:
+    """Runs long generations in the background, at most `max_concurrent` at a time
+
+    Jobs started beyond the limit wait their turn. A job publishes progress
+    events as it goes; subscribers first receive the latest event, then
+    every event published after they subscribed, and their stream ends when
+    the job finishes.
+    """
+
+    def __init__(self, name: str, max_concurrent: Optional[int] = None):
+        self.name = name
+        self.max_concurrent = max_concurrent if max_concurrent is not None else 2
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._stats = {"started": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    def start(self, job_id: str, work: Callable[[Publish], Awaitable[None]]) -> None:
+        """
+        Run `work(publish)` in the background once a slot is free
+
+        Args:
+            job_id: ID of what is being generated (e.g. the mind map ID)
+            work: Coroutine function doing the generation; reports progress via publish()
+        """
+        if job_id in self._tasks:
+            raise ValueError(f"{self.name} job {job_id} is already running")
+
+        async def run():
+            if self._slots.locked():
+                self.publish(job_id, {"stage": "queued"})
+            async with self._slots:
+                await work(lambda event: self.publish(job_id, event))
+
+        task = asyncio.create_task(run())
+        self._tasks[job_id] = task
+        self._stats["started"] += 1
+        task.add_done_callback(lambda done: self._finished(job_id, done))
+
+    def _finished(self, job_id: str, task: asyncio.Task) -> None:
+        self._tasks.pop(job_id, None)
+        self._latest.pop(job_id, None)
+        if task.cancelled():
+            self._stats["cancelled"] += 1
+        elif task.exception() is not None:
+            self._stats["failed"] += 1
+            logger.error(f"{self.name} job {job_id} failed: {task.exception()}")
+        else:
+            self._stats["completed"] += 1
+        # End every subscriber's stream
+        for queue in self._subscribers.pop(job_id, []):
+            queue.put_nowait(None)
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        """Send a progress event to the job's subscribers"""
+        self._latest[job_id] = event
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait(event)
+
+    def running(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job; False if it isn't running"""
+        task = self._tasks.get(job_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Progress events of a running job, until it finishes (ends at once if it isn't running)"""
+        if job_id not in self._tasks:
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        if job_id in self._latest:
+            queue.put_nowait(self._latest[job_id])
+        self._subscribers.setdefault(job_id, []).append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            queues = self._subscribers.get(job_id)
+            if queues and queue in queues:
+                queues.remove(queue)
+
+    async def shutdown(self) -> None:
+        """Cancel every running job (on app shutdown)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "running": len(self._tasks),
+            "max_concurrent": self.max_concurrent,
+        }
+
+
+# Global instances
+mind_map_jobs = GenerationJobs("mind map", max_concurrent=int(os.getenv("CLARITY_MINDMAP_MAX_CONCURRENT", "2")))
+node_details_prefetch_jobs = GenerationJobs("node details prefetch", max_concurrent=int(os.getenv("CLARITY_NODE_DETAILS_PREFETCH_CONCURRENT", "1")))
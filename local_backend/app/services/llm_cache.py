@@ -0,0 +1,155 @@
+"""
+Persistent LLM response cache for deterministic (low-temperature) prompts
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def llm_cache_key(
+    model: str,
+    prompt: str,
+    temperature: float,
+    max_tokens: int,
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """Hash of everything that determines a generation"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "options": options or {},
+        },
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite-backed response cache with size-bounded LRU eviction
+
+    Entries survive restarts. Each entry records how long the original
+    generation took, so hits can report the generation time they saved.
+    Call sites opt in per call (see LLMWrapper.agenerate).
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        if path is None:
+            base_dir = Path(os.getenv("CLARITY_BASE_DIR", "~/.clarity")).expanduser()
+            path = str(base_dir / "llm_cache.sqlite3")
+        self.path = path
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("CLARITY_LLM_CACHE_MAX_ENTRIES", "2000"))
+        self.enabled = enabled if enabled is not None else os.getenv("CLARITY_LLM_CACHE_ENABLED", "true").lower() == "true"
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "saved_seconds": 0.0}
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so importing the module never touches the disk
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT,"
+                " response TEXT NOT NULL,"
+                " generation_ms REAL NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response
+
+        Args:
+            key: Key from llm_cache_key()
+
+        Returns:
+            Cached response text, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT response, generation_ms FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += row[1] / 1000
+            logger.info(f"LLM cache hit (saved {row[1] / 1000:.1f}s of generation)")
+            return row[0]
+
+    def put(self, key: str, response: str, generation_ms: float, model: Optional[str] = None) -> None:
+        """Store a response and evict least-recently-used entries beyond max_entries"""
+        if not self.enabled:
+            return
+
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, generation_ms, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, generation_ms, now, now)
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._stats["evictions"] += excess
+            conn.commit()
+            self._stats["stores"] += 1
+
+    def clear(self) -> int:
+        """Drop every cached response; returns the number dropped"""
+        with self._lock:
+            conn = self._connection()
+            dropped = conn.execute("DELETE FROM responses").rowcount
+            conn.commit()
+            return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, generation time saved by hits and current size"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            entries = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0] if self.enabled else 0
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "enabled": self.enabled,
+            }
+
+
+# Global instance
+llm_cache = LLMResponseCache()
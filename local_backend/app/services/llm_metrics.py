@@ -0,0 +1,262 @@
+"""
+Per-call LLM token and latency accounting, labelled by call site
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Usage reported by the provider for the call in progress (see report_usage)
+_current_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_call_usage", default=None)
+
+# Ollama reports durations in nanoseconds
+_NS_PER_MS = 1_000_000
+
+
+def report_usage(data: Dict[str, Any]) -> None:
+    """
+    Attach provider usage to the LLM call being measured (no-op outside one)
+
+    Args:
+        data: Final Ollama response object (prompt_eval_count, eval_count,
+            load_duration, prompt_eval_duration, eval_duration)
+    """
+    usage = _current_usage.get()
+    if usage is None:
+        return
+    for field in ("prompt_eval_count", "eval_count"):
+        if data.get(field) is not None:
+            usage[field] = usage.get(field, 0) + data[field]
+    for field in ("load_duration", "prompt_eval_duration", "eval_duration"):
+        if data.get(field) is not None:
+            usage[field] = usage.get(field, 0) + data[field] / _NS_PER_MS
+
+
+def report_cancelled(output_tokens: int) -> None:
+    """Record that the call being measured was cancelled after producing `output_tokens` tokens"""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage["cancelled_tokens"] = usage.get("cancelled_tokens", 0) + output_tokens
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMMetrics:
+    """Records every LLM call and summarises usage per call site
+
+    Each record holds prompt and output tokens, load, prompt-eval and eval
+    time as reported by the provider, plus queue time in the scheduler and
+    total wall time. Calls cancelled part-way (client disconnected) are
+    counted separately from errors, with the tokens generated before the
+    cancel. Totals are kept since startup; the rolling summary covers the
+    last `window_seconds`, per call site and per model tier.
+    """
+
+    def __init__(self, window_seconds: Optional[float] = None, max_records: int = 5000):
+        self.window_seconds = window_seconds if window_seconds is not None else float(os.getenv("CLARITY_LLM_METRICS_WINDOW", "3600"))
+        self._records: Deque[Dict[str, Any]] = deque(maxlen=max_records)
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, call_site: str, model: str, queue_ms: float = 0.0, tier: str = "quality") -> Iterator[Dict[str, Any]]:
+        """
+        Measure one LLM call; providers report token counts via report_usage()
+
+        Args:
+            call_site: Feature making the call (ask, quiz, flashcards, ...)
+            model: Model name
+            queue_ms: Time spent waiting for a scheduler slot
+            tier: Model tier the call was routed to (quality, fast)
+        """
+        usage: Dict[str, Any] = {}
+        token = _current_usage.set(usage)
+        start = time.perf_counter()
+        error = cancelled = False
+        try:
+            yield usage
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled = True
+            raise
+        except BaseException:
+            error = True
+            raise
+        finally:
+            try:
+                _current_usage.reset(token)
+            except ValueError:
+                # Async generator finalised from another context
+                pass
+            self.record(call_site, model, usage, queue_ms, (time.perf_counter() - start) * 1000, error, cancelled, tier)
+
+    def record(
+        self,
+        call_site: str,
+        model: str,
+        usage: Dict[str, Any],
+        queue_ms: float,
+        total_ms: float,
+        error: bool = False,
+        cancelled: bool = False,
+        tier: str = "quality"
+    ) -> None:
+        eval_ms = usage.get("eval_duration")
+        output_tokens = usage.get("eval_count")
+        record = {
+            "timestamp": time.time(),
+            "call_site": call_site,
+            "model": model,
+            "tier": tier,
+            "prompt_tokens": usage.get("prompt_eval_count"),
+            "output_tokens": output_tokens,
+            "load_ms": usage.get("load_duration"),
+            "prompt_eval_ms": usage.get("prompt_eval_duration"),
+            "eval_ms": eval_ms,
+            "tokens_per_s": output_tokens / (eval_ms / 1000) if output_tokens and eval_ms else None,
+            "queue_ms": queue_ms,
+            "total_ms": total_ms,
+            "error": error,
+            "cancelled": cancelled,
+            "cancelled_tokens": usage.get("cancelled_tokens", 0),
+        }
+        with self._lock:
+            self._records.append(record)
+            totals = self._totals.setdefault(call_site, {
+                "calls": 0, "errors": 0, "cancelled": 0, "cancelled_tokens": 0, "prompt_tokens": 0, "output_tokens": 0,
+                "load_ms": 0.0, "eval_ms": 0.0, "queue_ms": 0.0, "total_ms": 0.0
+            })
+            totals["calls"] += 1
+            totals["errors"] += int(error)
+            totals["cancelled"] += int(cancelled)
+            totals["cancelled_tokens"] += record["cancelled_tokens"]
+            totals["prompt_tokens"] += record["prompt_tokens"] or 0
+            totals["output_tokens"] += output_tokens or 0
+            totals["load_ms"] += record["load_ms"] or 0.0
+            totals["eval_ms"] += (record["prompt_eval_ms"] or 0.0) + (eval_ms or 0.0)
+            totals["queue_ms"] += queue_ms
+            totals["total_ms"] += total_ms
+
+    def tokens_per_second(self, model: str, sample: int = 20) -> Optional[float]:
+        """Median generation speed of `model` over its last `sample` measured calls (None if unmeasured)"""
+        with self._lock:
+            speeds = [r["tokens_per_s"] for r in reversed(self._records) if r["model"] == model and r["tokens_per_s"]][:sample]
+        return _percentile(speeds, 0.5) if speeds else None
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent call records, newest first"""
+        with self._lock:
+            return list(self._records)[-limit:][::-1]
+
+    def summary(self, baseline_tier: str = "quality") -> Dict[str, Any]:
+        """
+        Rolling per-call-site and per-tier summary over the window, plus totals since startup
+
+        Args:
+            baseline_tier: Tier the others' savings are measured against
+        """
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            records = [r for r in self._records if r["timestamp"] >= cutoff]
+            totals = {site: dict(stats) for site, stats in self._totals.items()}
+
+        by_site: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_site.setdefault(record["call_site"], []).append(record)
+
+        # Share of inference time (prompt eval + generation) spent on each call site
+        inference_ms = {
+            site: sum((r["prompt_eval_ms"] or 0.0) + (r["eval_ms"] or 0.0) for r in site_records)
+            for site, site_records in by_site.items()
+        }
+        all_inference_ms = sum(inference_ms.values())
+
+        window = {}
+        for site, site_records in by_site.items():
+            output_tokens = sum(r["output_tokens"] or 0 for r in site_records)
+            eval_ms = sum(r["eval_ms"] or 0.0 for r in site_records if r["output_tokens"])
+            queue = [r["queue_ms"] for r in site_records]
+            total = [r["total_ms"] for r in site_records]
+            window[site] = {
+                "calls": len(site_records),
+                "errors": sum(r["error"] for r in site_records),
+                "cancelled": sum(r["cancelled"] for r in site_records),
+                "cancelled_tokens": sum(r["cancelled_tokens"] for r in site_records),
+                "prompt_tokens": sum(r["prompt_tokens"] or 0 for r in site_records),
+                "output_tokens": output_tokens,
+                "tokens_per_s": output_tokens / (eval_ms / 1000) if eval_ms else None,
+                "load_ms_total": sum(r["load_ms"] or 0.0 for r in site_records),
+                "queue_ms_avg": sum(queue) / len(queue),
+                "queue_ms_p95": _percentile(queue, 0.95),
+                "total_ms_avg": sum(total) / len(total),
+                "total_ms_p95": _percentile(total, 0.95),
+                "inference_share": inference_ms[site] / all_inference_ms if all_inference_ms else 0.0,
+            }
+
+        return {
+            "window_seconds": self.window_seconds,
+            "window": window,
+            "tiers": self._tier_summary(records, baseline_tier),
+            "totals": totals,
+        }
+
+    def _tier_summary(self, records: List[Dict[str, Any]], baseline_tier: str) -> Dict[str, Any]:
+        """
+        Calls, tokens and latency per tier
+
+        `estimated_ms_saved` is the inference time each non-baseline tier's
+        calls would have taken at the baseline tier's measured prompt-eval and
+        generation speeds, minus the time they actually took (None until the
+        baseline has been measured).
+        """
+        by_tier: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_tier.setdefault(record.get("tier", "quality"), []).append(record)
+
+        def rate(tier_records: List[Dict[str, Any]], tokens: str, ms: str) -> Optional[float]:
+            """Tokens per millisecond over records that report both fields"""
+            measured = [r for r in tier_records if r[tokens] and r[ms]]
+            total_ms = sum(r[ms] for r in measured)
+            return sum(r[tokens] for r in measured) / total_ms if total_ms else None
+
+        baseline = by_tier.get(baseline_tier, [])
+        baseline_prompt_rate = rate(baseline, "prompt_tokens", "prompt_eval_ms")
+        baseline_eval_rate = rate(baseline, "output_tokens", "eval_ms")
+
+        tiers = {}
+        for tier, tier_records in by_tier.items():
+            total = [r["total_ms"] for r in tier_records]
+            eval_rate = rate(tier_records, "output_tokens", "eval_ms")
+            saved = None
+            if tier != baseline_tier and baseline_prompt_rate and baseline_eval_rate:
+                saved = sum(
+                    (r["prompt_tokens"] or 0) / baseline_prompt_rate + (r["output_tokens"] or 0) / baseline_eval_rate
+                    - (r["prompt_eval_ms"] or 0.0) - (r["eval_ms"] or 0.0)
+                    for r in tier_records if r["eval_ms"]
+                )
+            tiers[tier] = {
+                "models": sorted({r["model"] for r in tier_records}),
+                "calls": len(tier_records),
+                "prompt_tokens": sum(r["prompt_tokens"] or 0 for r in tier_records),
+                "output_tokens": sum(r["output_tokens"] or 0 for r in tier_records),
+                "tokens_per_s": eval_rate * 1000 if eval_rate else None,
+                "total_ms_avg": sum(total) / len(total),
+                "total_ms_p95": _percentile(total, 0.95),
+                "estimated_ms_saved": saved,
+            }
+        return tiers
+
+
+# Global instance
+llm_metrics = LLMMetrics()
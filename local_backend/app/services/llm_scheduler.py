@@ -0,0 +1,147 @@
+"""
+Priority scheduler and concurrency governor for LLM calls
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"  # a user is waiting on the answer (/ask, node details)
+STANDARD = "standard"        # short helper calls (topic suggestions, normalisation)
+BULK = "bulk"                # long generations (quizzes, mind maps, flashcards)
+PRIORITIES = (INTERACTIVE, STANDARD, BULK)
+
+
+class LLMScheduler:
+    """Admit at most `max_in_flight` LLM calls per backend node at once
+
+    Waiting calls are served strictly by priority class. Within a class,
+    users are served round-robin (one call per user per turn), so one user's
+    burst of requests cannot starve everyone else.
+    """
+
+    def __init__(self, name: str = "default", max_in_flight: Optional[int] = None, nodes: int = 1):
+        """
+        Args:
+            name: Model (or backend) name, for stats
+            max_in_flight: Calls admitted per node (default from env: 1)
+            nodes: Backend nodes serving the model; the limit scales with them
+        """
+        self.name = name
+        self.nodes = max(1, nodes)
+        per_node = max_in_flight if max_in_flight is not None else int(os.getenv("CLARITY_LLM_MAX_IN_FLIGHT", "1"))
+        self.max_in_flight = per_node * self.nodes
+        self.in_flight = 0
+
+        # priority -> OrderedDict(user_id -> deque of waiting futures), next user to serve first
+        self._queues: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._stats = {
+            p: {"calls": 0, "queued": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+            for p in PRIORITIES
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE, user_id: Optional[str] = None) -> AsyncIterator[float]:
+        """
+        Hold one in-flight slot for the duration of an LLM call
+
+        Args:
+            priority: One of PRIORITIES
+            user_id: Caller, for per-user fairness within a priority class
+
+        Yields:
+            Time spent waiting for the slot, in milliseconds
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown LLM priority: {priority}")
+
+        start = time.perf_counter()
+        await self._acquire(priority, user_id or "anonymous")
+        wait_ms = (time.perf_counter() - start) * 1000
+        self._record_wait(priority, wait_ms)
+        try:
+            yield wait_ms
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: str, user_id: str) -> None:
+        if self.in_flight < self.max_in_flight and not self.queued():
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._stats[priority]["queued"] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted as we were cancelled: hand it on
+                self._release()
+            else:
+                self._remove_waiter(priority, user_id, waiter)
+            raise
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        while self.in_flight < self.max_in_flight:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            if users:
+                user_id, waiters = next(iter(users.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                return waiter
+        return None
+
+    def _remove_waiter(self, priority: str, user_id: str, waiter: asyncio.Future) -> None:
+        waiters = self._queues[priority].get(user_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._queues[priority][user_id]
+
+    def _record_wait(self, priority: str, wait_ms: float) -> None:
+        stats = self._stats[priority]
+        stats["calls"] += 1
+        stats["wait_ms_total"] += wait_ms
+        stats["wait_ms_max"] = max(stats["wait_ms_max"], wait_ms)
+
+    def queued(self) -> int:
+        """Number of calls waiting for a slot"""
+        return sum(len(waiters) for users in self._queues.values() for waiters in users.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """In-flight and queued counts plus queue-time metrics per priority class"""
+        return {
+            "backend": self.name,
+            "max_in_flight": self.max_in_flight,
+            "nodes": self.nodes,
+            "in_flight": self.in_flight,
+            "queued": self.queued(),
+            "priorities": {
+                priority: {
+                    **stats,
+                    "waiting": sum(len(w) for w in self._queues[priority].values()),
+                    "wait_ms_avg": stats["wait_ms_total"] / stats["calls"] if stats["calls"] else 0.0,
+                }
+                for priority, stats in self._stats.items()
+            },
+        }
@@ -1,13 +1,92 @@
 """
-LLM Wrapper with multiple provider support (mock, gpt-oss, gemini, openai)
+LLM Wrapper with multiple provider support (mock, gpt-oss, openai-compatible, gemini, openai)
 """
 import os
-from typing import List, Dict, Any, Optional
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterator, Optional, Tuple, Type
 from abc import ABC, abstractmethod
 import logging
 
+import httpx
+from pydantic import BaseModel
+
+from ..utils.chunker import count_tokens
+from ..utils.context_packer import PROMPT_TOKEN_BUDGET, pack_context
+from ..utils.deadline import DeadlineExceeded, fit_max_tokens, remaining
+from .backend_pool import BackendPool, ollama_pool
+from .circuit_breaker import CircuitBreaker, LLMUnavailableError, CLOSED, PROBE, REJECT, counts_as_failure
+from .llm_cache import llm_cache, llm_cache_key
+from .llm_metrics import llm_metrics, report_cancelled, report_usage
+from .llm_scheduler import LLMScheduler, INTERACTIVE, BULK
+from .structured_output import (
+    StructuredOutputError,
+    build_repair_prompt,
+    build_topup_prompt,
+    item_tokens,
+    parse_structured,
+    structured_stats,
+)
+from ..models.schemas import QuizOutput
+
 logger = logging.getLogger(__name__)
 
+# Prompt tokens each packed chunk costs besides its text (label + separator, +1 for rounding)
+EXCERPT_OVERHEAD_TOKENS = count_tokens("\n\n[Excerpt 10]:\n") + 1
+QUIZ_CHUNK_OVERHEAD_TOKENS = count_tokens("\n\n") + 1
+
+# llama.cpp reports timings in milliseconds; usage is recorded in Ollama's nanoseconds
+NS_PER_MS = 1_000_000
+
+# LLM_PROVIDER values served by OpenAICompatibleAdapter
+OPENAI_COMPATIBLE_PROVIDERS = ("openai-compatible", "llamacpp", "vllm")
+
+# Model tiers
+QUALITY = "quality"  # LLM_MODEL: answers and long generations
+FAST = "fast"        # LLM_FAST_MODEL: short auxiliary prompts (classification, short summaries)
+
+# Call sites sent to the fast tier unless CLARITY_LLM_TIERS overrides them
+DEFAULT_CALL_SITE_TIERS = {
+    "normalize-topic": FAST,
+    "quiz-topics": FAST,
+    "node-details": FAST,
+}
+
+
+def parse_tier_map(value: str) -> Dict[str, str]:
+    """Parse "call_site=tier" pairs (comma-separated), skipping malformed entries"""
+    tiers = {}
+    for entry in value.split(","):
+        call_site, _, tier = entry.partition("=")
+        if call_site.strip() and tier.strip():
+            tiers[call_site.strip()] = tier.strip().lower()
+    return tiers
+
+
+def fallback_or_raise(error: BaseException, model_name: str, fallback: str, allow_fallback: bool = True) -> None:
+    """
+    Handle a call a local backend could not serve: return to serve mock output instead
+    
+    Args:
+        error: What went wrong
+        model_name: Model the call was for
+        fallback: CLARITY_LLM_FALLBACK setting ("mock" or "error")
+        allow_fallback: False for calls whose output must be real (e.g. cached ones)
+    
+    Raises:
+        LLMUnavailableError (or the original error) when fallback is disabled
+    """
+    if isinstance(error, DeadlineExceeded):
+        # Out of time: placeholder output would not be a useful degraded result
+        raise error
+    if allow_fallback and fallback == "mock":
+        return
+    if isinstance(error, LLMUnavailableError) or not counts_as_failure(error):
+        raise error
+    raise LLMUnavailableError(f"LLM backend {model_name} failed: {error}") from error
+
 
 class LLMInterface(ABC):
     """Abstract base class for LLM providers"""
@@ -23,6 +102,76 @@ class LLMInterface(ABC):
         """Generate text from prompt"""
         pass
     
+    def stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> Iterator[str]:
+        """Generate text from prompt, yielding pieces as they are produced"""
+        # Providers without streaming return the whole answer as one piece
+        yield self.generate(prompt, max_tokens, temperature, **kwargs)
+    
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> str:
+        """Generate text from prompt without blocking the event loop"""
+        # Providers without an async client run the blocking call in a worker thread
+        return await asyncio.to_thread(self.generate, prompt, max_tokens, temperature, **kwargs)
+    
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Async variant of stream()"""
+        yield await self.agenerate(prompt, max_tokens, temperature, **kwargs)
+    
+    async def agenerate_batch(
+        self,
+        prompts: List[str],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> List[str]:
+        """Generate one completion per prompt, in prompt order"""
+        # Providers without batched requests send the prompts concurrently
+        return list(await asyncio.gather(*(self.agenerate(p, max_tokens, temperature, **kwargs) for p in prompts)))
+    
+    async def agenerate_choices(
+        self,
+        prompt: str,
+        n: int,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> List[str]:
+        """Generate `n` independent completions of one prompt"""
+        return await self.agenerate_batch([prompt] * n, max_tokens, temperature, **kwargs)
+    
+    async def aclose(self) -> None:
+        """Release pooled connections"""
+        pass
+    
+    async def apreload(self) -> bool:
+        """Load the model into memory and reset its keep-alive timer (False if there is nothing to load)"""
+        return False
+    
+    async def aresident(self) -> Optional[bool]:
+        """Whether the model is currently loaded (None if unknown for this provider)"""
+        return None
+    
+    def health(self) -> Dict[str, Any]:
+        """Backend availability details for /health"""
+        return {}
+    
     @abstractmethod
     def get_model_name(self) -> str:
         """Get model name"""
@@ -85,33 +234,123 @@ D) Model evaluation"""
                 "Please configure a real LLM provider (gpt-oss, gemini, or openai) for production use."
             )
     
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> str:
+        return self.generate(prompt, max_tokens, temperature, **kwargs)
+    
     def get_model_name(self) -> str:
         return "mock-llm-v1"
 
 
 class GPTOSSAdapter(LLMInterface):
-    """Adapter for gpt-oss via Ollama (local inference)"""
+    """Adapter for gpt-oss via Ollama (local inference)
+    
+    Each call goes to the least-loaded healthy endpoint of the Ollama pool
+    that has the model installed, failing over to the next endpoint if it
+    errors. Endpoints have their own circuit breakers: while every endpoint
+    is down, calls fail fast (in milliseconds) instead of each waiting out
+    the request timeout, and either fall back to mock output or raise
+    LLMUnavailableError, depending on CLARITY_LLM_FALLBACK ("mock" or "error").
+    """
     
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, pool: Optional[BackendPool] = None):
         # Get model name from env if not provided
         if model_name is None:
             model_name = os.getenv("LLM_MODEL", "gpt-oss:20b")
         self.model_name = model_name
-        self.ollama_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        self.pool = pool or ollama_pool
+        # A backend that doesn't accept the connection quickly is down; don't wait the full read timeout
+        self.connect_timeout = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))
+        # How long Ollama keeps the model loaded after each request (e.g. "30m", "-1" = forever)
+        self.keep_alive = os.getenv("CLARITY_LLM_KEEP_ALIVE", "30m")
+        # What to return while the backend is unavailable: "mock" output or "error" (LLMUnavailableError)
+        self.fallback = os.getenv("CLARITY_LLM_FALLBACK", "mock").lower()
+        self.mock = MockLLM()
         
-        # Test Ollama connection
-        try:
-            import requests
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=2)
-            if response.status_code == 200:
-                self.use_ollama = True
-                logger.info(f"✅ Using Ollama for LLM: {self.model_name}")
-            else:
-                raise ConnectionError("Ollama not responding")
-        except Exception as e:
-            logger.warning(f"Ollama not available ({e}), falling back to mock")
-            self.use_ollama = False
-            self.mock = MockLLM()
+        # Test Ollama endpoints; those that are down start with the circuit open and are probed again later
+        healthy = self.pool.refresh()
+        serving = self.pool.serving(self.model_name)
+        if serving:
+            logger.info(f"✅ Using Ollama for LLM: {self.model_name} on {len(serving)}/{len(self.pool.nodes)} endpoints")
+        elif healthy:
+            logger.warning(f"{self.model_name} is not installed on any healthy Ollama endpoint")
+        else:
+            logger.warning("Ollama not available, failing over until an endpoint responds")
+    
+    def _fallback_or_raise(self, error: BaseException, allow_fallback: bool = True) -> None:
+        """
+        Handle a call Ollama could not serve: return to serve mock output instead
+        
+        Raises:
+            LLMUnavailableError (or the original error) when fallback is disabled
+        """
+        fallback_or_raise(error, self.model_name, self.fallback, allow_fallback)
+    
+    def _timeout(self, kwargs: Dict[str, Any]) -> httpx.Timeout:
+        return httpx.Timeout(kwargs.get('timeout', 120), connect=self.connect_timeout)
+    
+    def _post(self, path: str, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """POST to the least-loaded endpoint, failing over to the others on backend errors"""
+        import requests
+        tried = []
+        while True:
+            try:
+                with self.pool.lease(self.model_name, exclude=tried) as node:
+                    tried.append(node)
+                    response = requests.post(f"{node.url}{path}", json=payload, timeout=(self.connect_timeout, timeout))
+                    response.raise_for_status()
+                    return response.json()
+            except LLMUnavailableError:
+                raise
+            except Exception as e:
+                if not counts_as_failure(e) or len(tried) == len(self.pool.nodes):
+                    raise
+                logger.warning(f"Ollama endpoint {tried[-1].url} failed ({e}), trying another")
+    
+    async def _astream_lines(self, payload: Dict[str, Any], timeout: httpx.Timeout) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a generation from the least-loaded endpoint, yielding Ollama's JSON lines
+        
+        Fails over to another endpoint on backend errors until the first line
+        arrives. Closing the generator (or cancelling its task) closes the
+        HTTP stream, which makes Ollama stop generating.
+        """
+        tried = []
+        while True:
+            received = False
+            try:
+                async with self.pool.alease(self.model_name, exclude=tried) as node:
+                    tried.append(node)
+                    client = self.pool.get_async_client()
+                    request = client.build_request("POST", f"{node.url}/api/generate", json=payload, timeout=timeout)
+                    response = await client.send(request, stream=True)
+                    try:
+                        response.raise_for_status()
+                        # Ollama streams one JSON object per line
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            data = json.loads(line)
+                            if data.get("error"):
+                                raise RuntimeError(data["error"])
+                            received = True
+                            yield data
+                            if data.get("done"):
+                                break
+                    finally:
+                        await response.aclose()
+                    return
+            except LLMUnavailableError:
+                raise
+            except Exception as e:
+                if received or not counts_as_failure(e) or len(tried) == len(self.pool.nodes):
+                    raise
+                logger.warning(f"Ollama endpoint {tried[-1].url} failed ({e}), trying another")
     
     def generate(
         self,
@@ -120,38 +359,569 @@ class GPTOSSAdapter(LLMInterface):
         temperature: float = 0.7,
         **kwargs
     ) -> str:
-        if not self.use_ollama:
-            return self.mock.generate(prompt, max_tokens, temperature, **kwargs)
-        
         # Use Ollama API
         try:
-            import requests
             # Use longer timeout for longer generations
-            timeout = kwargs.get('timeout', 120)
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model_name,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": temperature,
-                        "num_predict": max_tokens
-                    }
-                },
-                timeout=timeout
+            data = self._post(
+                "/api/generate",
+                self._generate_payload(prompt, max_tokens, temperature, stream=False, **kwargs),
+                kwargs.get('timeout', 120)
             )
-            response.raise_for_status()
-            return response.json()["response"]
         except Exception as e:
             logger.error(f"Ollama generation failed: {e}")
-            # Fallback to mock
-            if not hasattr(self, 'mock'):
-                self.mock = MockLLM()
+            self._fallback_or_raise(e, kwargs.get('allow_fallback', True))
+            return self.mock.generate(prompt, max_tokens, temperature, **kwargs)
+        report_usage(data)
+        return data["response"]
+    
+    def stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> Iterator[str]:
+        import requests
+        timeout = kwargs.get('timeout', 120)
+        connected = False
+        try:
+            with self.pool.lease(self.model_name) as node:
+                response = requests.post(
+                    f"{node.url}/api/generate",
+                    json=self._generate_payload(prompt, max_tokens, temperature, stream=True, **kwargs),
+                    stream=True,
+                    timeout=(self.connect_timeout, timeout)
+                )
+                response.raise_for_status()
+                connected = True
+                
+                # Ollama streams one JSON object per line
+                with response:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        if data.get("error"):
+                            raise RuntimeError(data["error"])
+                        if data.get("response"):
+                            yield data["response"]
+                        if data.get("done"):
+                            report_usage(data)
+                            break
+                return
+        except Exception as e:
+            if connected:
+                raise
+            logger.error(f"Ollama streaming failed: {e}")
+            self._fallback_or_raise(e, kwargs.get('allow_fallback', True))
+        yield from self.mock.stream(prompt, max_tokens, temperature, **kwargs)
+    
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> str:
+        # Streamed internally so a cancelled call stops Ollama and we know how many tokens it had produced
+        pieces = []
+        try:
+            async for data in self._astream_lines(
+                self._generate_payload(prompt, max_tokens, temperature, stream=True, **kwargs),
+                self._timeout(kwargs)
+            ):
+                if data.get("response"):
+                    pieces.append(data["response"])
+                if data.get("done"):
+                    report_usage(data)
+        except asyncio.CancelledError:
+            report_cancelled(len(pieces))
+            raise
+        except Exception as e:
+            logger.error(f"Ollama generation failed: {e}")
+            self._fallback_or_raise(e, kwargs.get('allow_fallback', True))
+            return await self.mock.agenerate(prompt, max_tokens, temperature, **kwargs)
+        return "".join(pieces)
+    
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        pieces = 0
+        try:
+            async for data in self._astream_lines(
+                self._generate_payload(prompt, max_tokens, temperature, stream=True, **kwargs),
+                self._timeout(kwargs)
+            ):
+                if data.get("response"):
+                    pieces += 1
+                    yield data["response"]
+                if data.get("done"):
+                    report_usage(data)
+            return
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away mid-answer
+            report_cancelled(pieces)
+            raise
+        except Exception as e:
+            if pieces:
+                raise
+            logger.error(f"Ollama streaming failed: {e}")
+            self._fallback_or_raise(e, kwargs.get('allow_fallback', True))
+        async for piece in self.mock.astream(prompt, max_tokens, temperature, **kwargs):
+            yield piece
+    
+    async def apreload(self) -> bool:
+        """Load the model on every endpoint that has it, so any of them can answer without a load"""
+        
+        async def preload_on(node):
+            # An empty prompt loads the model without generating anything
+            async with self.pool.alease(self.model_name, only=node):
+                response = await self.pool.get_async_client().post(
+                    f"{node.url}/api/generate",
+                    json={"model": self.model_name, "prompt": "", "keep_alive": self.keep_alive},
+                    timeout=httpx.Timeout(300, connect=self.connect_timeout)
+                )
+                response.raise_for_status()
+        
+        results = await asyncio.gather(*(preload_on(node) for node in self.pool.nodes), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if len(errors) == len(results):
+            raise errors[0]
+        return True
+    
+    async def aresident(self) -> Optional[bool]:
+        name = self.model_name if ":" in self.model_name else f"{self.model_name}:latest"
+        for node in self.pool.serving(self.model_name):
+            try:
+                response = await self.pool.get_async_client().get(f"{node.url}/api/ps", timeout=2)
+                response.raise_for_status()
+            except Exception as e:
+                logger.debug(f"Residency check on {node.url} failed: {e}")
+                continue
+            if any(name in (m.get("name"), m.get("model")) for m in response.json().get("models", [])):
+                return True
+        return False
+    
+    async def aclose(self) -> None:
+        await self.pool.aclose()
+    
+    def _generate_payload(self, prompt: str, max_tokens: int, temperature: float, stream: bool, **kwargs) -> Dict[str, Any]:
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": temperature,
+                # Capped to what fits the request deadline at the measured generation speed
+                "num_predict": fit_max_tokens(max_tokens, llm_metrics.tokens_per_second(self.model_name))
+            }
+        }
+        if kwargs.get("format") is not None:
+            # JSON schema (or "json") constraining the output
+            payload["format"] = kwargs["format"]
+        return payload
+    
+    def get_model_name(self) -> str:
+        return self.model_name
+    
+    def health(self) -> Dict[str, Any]:
+        backends = self.pool.status()
+        return {
+            "backends": backends,
+            "fallback": self.fallback,
+            "degraded": backends["healthy"] < len(self.pool.nodes),
+        }
+
+
+class OpenAICompatibleAdapter(LLMInterface):
+    """Adapter for local servers with an OpenAI-compatible API (llama.cpp server, vLLM, ...)
+    
+    Calls /chat/completions, so the server applies the model's chat
+    template, or raw /completions with OPENAI_COMPAT_API=completions, which
+    also takes a whole batch of prompts in one request. Connections are
+    pooled and kept alive. As with Ollama, async calls stream internally so
+    a cancelled call stops the server generating, and a circuit breaker
+    makes calls fail fast while the server is down (then fall back to mock
+    output or raise, per CLARITY_LLM_FALLBACK).
+    """
+    
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api: Optional[str] = None,
+        max_connections: Optional[int] = None
+    ):
+        self.model_name = model_name or os.getenv("LLM_MODEL", "gpt-oss:20b")
+        self.base_url = (base_url or os.getenv("OPENAI_COMPAT_BASE_URL", "http://localhost:8000/v1")).rstrip("/")
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_COMPAT_API_KEY", "")
+        self.api = (api or os.getenv("OPENAI_COMPAT_API", "chat")).lower()
+        if self.api not in ("chat", "completions"):
+            raise ValueError(f"OPENAI_COMPAT_API must be chat or completions, not {self.api}")
+        self.max_connections = max_connections if max_connections is not None else int(os.getenv("OPENAI_COMPAT_MAX_CONNECTIONS", "10"))
+        self.connect_timeout = float(os.getenv("OPENAI_COMPAT_CONNECT_TIMEOUT", "3"))
+        self.fallback = os.getenv("CLARITY_LLM_FALLBACK", "mock").lower()
+        self.mock = MockLLM()
+        self.breaker = CircuitBreaker(name=self.base_url)
+        
+        # Keep-alive pools: requests for blocking calls, httpx for async ones (bound to the event loop that created it)
+        self._session = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_client_loop = None
+        logger.info(f"Using OpenAI-compatible server {self.base_url} for LLM: {self.model_name} ({self.api} API)")
+    
+    def _url(self) -> str:
+        return f"{self.base_url}/chat/completions" if self.api == "chat" else f"{self.base_url}/completions"
+    
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+    
+    def _timeout(self, kwargs: Dict[str, Any]) -> httpx.Timeout:
+        return httpx.Timeout(kwargs.get('timeout', 120), connect=self.connect_timeout)
+    
+    def _get_session(self):
+        import requests
+        if self._session is None:
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+        return self._session
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            )
+            self._async_client_loop = loop
+        return self._async_client
+    
+    # Circuit breaker -----------------------------------------------------
+    
+    def _rejected(self) -> LLMUnavailableError:
+        return LLMUnavailableError(f"LLM server {self.base_url} is unavailable ({self.breaker.last_error})")
+    
+    def _record(self, error: Optional[BaseException]) -> None:
+        if error is None:
+            self.breaker.record_success()
+        elif isinstance(error, Exception) and counts_as_failure(error):
+            # Cancellation and early-closed streams say nothing about the server
+            self.breaker.record_failure(error)
+    
+    @contextmanager
+    def _call(self) -> Iterator[None]:
+        """One blocking call through the circuit breaker (a half-open circuit is probed via /models first)"""
+        decision = self.breaker.admit()
+        if decision == PROBE:
+            try:
+                self._get_session().get(f"{self.base_url}/models", headers=self._headers(), timeout=2).raise_for_status()
+                self.breaker.probe_result(True)
+            except Exception as e:
+                self.breaker.probe_result(False, str(e))
+                raise self._rejected() from e
+        elif decision == REJECT:
+            raise self._rejected()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._record(error)
+    
+    @asynccontextmanager
+    async def _acall(self) -> AsyncIterator[None]:
+        """Async variant of _call()"""
+        decision = self.breaker.admit()
+        if decision == PROBE:
+            try:
+                response = await self._get_async_client().get(f"{self.base_url}/models", headers=self._headers(), timeout=2)
+                response.raise_for_status()
+                self.breaker.probe_result(True)
+            except Exception as e:
+                self.breaker.probe_result(False, str(e))
+                raise self._rejected() from e
+        elif decision == REJECT:
+            raise self._rejected()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._record(error)
+    
+    # Requests ------------------------------------------------------------
+    
+    def _payload(
+        self,
+        prompt: Any,
+        max_tokens: int,
+        temperature: float,
+        stream: bool,
+        n: int = 1,
+        **kwargs
+    ) -> Dict[str, Any]:
+        payload = {
+            "model": self.model_name,
+            "temperature": temperature,
+            # Capped to what fits the request deadline at the measured generation speed
+            "max_tokens": fit_max_tokens(max_tokens, llm_metrics.tokens_per_second(self.model_name)),
+            "stream": stream,
+        }
+        if self.api == "chat":
+            payload["messages"] = [{"role": "user", "content": prompt}]
+        else:
+            # A list of prompts is one batched request
+            payload["prompt"] = prompt
+        if n > 1:
+            payload["n"] = n
+        if stream:
+            # Final chunk carries token usage
+            payload["stream_options"] = {"include_usage": True}
+        output_format = kwargs.get("format")
+        if output_format == "json":
+            payload["response_format"] = {"type": "json_object"}
+        elif output_format is not None:
+            payload["response_format"] = {"type": "json_schema", "json_schema": {"name": "output", "schema": output_format}}
+        return payload
+    
+    def _choice_text(self, choice: Dict[str, Any]) -> str:
+        """Text of a choice in a full response or a stream chunk"""
+        if self.api == "completions":
+            return choice.get("text") or ""
+        message = choice.get("message") or choice.get("delta") or {}
+        return message.get("content") or ""
+    
+    def _report_usage(
+        self,
+        data: Dict[str, Any],
+        pieces: int,
+        started_at: float,
+        first_piece_at: Optional[float]
+    ) -> None:
+        """
+        Report OpenAI-style usage as the Ollama fields llm_metrics reads
+        
+        llama.cpp's `timings` give prompt and generation time; otherwise the
+        time to the first streamed piece stands in for prompt processing.
+        """
+        usage = data.get("usage") or {}
+        timings = data.get("timings") or {}
+        report = {
+            "prompt_eval_count": usage.get("prompt_tokens"),
+            # Each streamed piece is about one token when the server sends no usage
+            "eval_count": usage.get("completion_tokens", pieces or None),
+        }
+        if timings.get("predicted_ms") is not None:
+            report["prompt_eval_duration"] = timings.get("prompt_ms", 0) * NS_PER_MS
+            report["eval_duration"] = timings["predicted_ms"] * NS_PER_MS
+        elif first_piece_at is not None:
+            report["prompt_eval_duration"] = (first_piece_at - started_at) * 1e9
+            report["eval_duration"] = (time.perf_counter() - first_piece_at) * 1e9
+        report_usage(report)
+    
+    async def _apost(self, payload: Dict[str, Any], timeout: httpx.Timeout) -> Dict[str, Any]:
+        """One non-streamed request; its usage is reported"""
+        start = time.perf_counter()
+        async with self._acall():
+            response = await self._get_async_client().post(self._url(), json=payload, headers=self._headers(), timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        # Without streaming, prompt processing can't be told apart from generation
+        self._report_usage(data, 0, start, start)
+        return data
+    
+    async def _astream_chunks(self, payload: Dict[str, Any], timeout: httpx.Timeout) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a generation, yielding the server-sent JSON chunks
+        
+        Closing the generator (or cancelling its task) closes the HTTP
+        stream, which makes the server stop generating.
+        """
+        async with self._acall():
+            client = self._get_async_client()
+            request = client.build_request("POST", self._url(), json=payload, headers=self._headers(), timeout=timeout)
+            response = await client.send(request, stream=True)
+            try:
+                response.raise_for_status()
+                # Server-sent events: "data: {...}" lines, ending with "data: [DONE]"
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    yield chunk
+            finally:
+                await response.aclose()
+    
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> str:
+        start = time.perf_counter()
+        try:
+            with self._call():
+                response = self._get_session().post(
+                    self._url(),
+                    json=self._payload(prompt, max_tokens, temperature, stream=False, **kwargs),
+                    headers=self._headers(),
+                    timeout=(self.connect_timeout, kwargs.get('timeout', 120))
+                )
+                response.raise_for_status()
+                data = response.json()
+        except Exception as e:
+            logger.error(f"OpenAI-compatible generation failed: {e}")
+            fallback_or_raise(e, self.model_name, self.fallback, kwargs.get('allow_fallback', True))
             return self.mock.generate(prompt, max_tokens, temperature, **kwargs)
+        self._report_usage(data, 0, start, start)
+        return self._choice_text(data["choices"][0])
+    
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> str:
+        # Streamed internally so a cancelled call stops the server and we know how many tokens it had produced
+        pieces = []
+        final: Dict[str, Any] = {}
+        start = time.perf_counter()
+        first_piece_at = None
+        try:
+            async for chunk in self._astream_chunks(
+                self._payload(prompt, max_tokens, temperature, stream=True, **kwargs),
+                self._timeout(kwargs)
+            ):
+                for choice in chunk.get("choices") or []:
+                    text = self._choice_text(choice)
+                    if text:
+                        first_piece_at = first_piece_at or time.perf_counter()
+                        pieces.append(text)
+                if chunk.get("usage") or chunk.get("timings"):
+                    final = chunk
+        except asyncio.CancelledError:
+            report_cancelled(len(pieces))
+            raise
+        except Exception as e:
+            logger.error(f"OpenAI-compatible generation failed: {e}")
+            fallback_or_raise(e, self.model_name, self.fallback, kwargs.get('allow_fallback', True))
+            return await self.mock.agenerate(prompt, max_tokens, temperature, **kwargs)
+        self._report_usage(final, len(pieces), start, first_piece_at)
+        return "".join(pieces)
+    
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        pieces = 0
+        final: Dict[str, Any] = {}
+        start = time.perf_counter()
+        first_piece_at = None
+        try:
+            async for chunk in self._astream_chunks(
+                self._payload(prompt, max_tokens, temperature, stream=True, **kwargs),
+                self._timeout(kwargs)
+            ):
+                for choice in chunk.get("choices") or []:
+                    text = self._choice_text(choice)
+                    if text:
+                        first_piece_at = first_piece_at or time.perf_counter()
+                        pieces += 1
+                        yield text
+                if chunk.get("usage") or chunk.get("timings"):
+                    final = chunk
+            self._report_usage(final, pieces, start, first_piece_at)
+            return
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away mid-answer
+            report_cancelled(pieces)
+            raise
+        except Exception as e:
+            if pieces:
+                raise
+            logger.error(f"OpenAI-compatible streaming failed: {e}")
+            fallback_or_raise(e, self.model_name, self.fallback, kwargs.get('allow_fallback', True))
+        async for piece in self.mock.astream(prompt, max_tokens, temperature, **kwargs):
+            yield piece
+    
+    async def agenerate_batch(
+        self,
+        prompts: List[str],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> List[str]:
+        """One /completions request for all prompts (concurrent requests on the chat API)"""
+        if self.api != "completions" or len(prompts) < 2:
+            return await super().agenerate_batch(prompts, max_tokens, temperature, **kwargs)
+        try:
+            data = await self._apost(self._payload(prompts, max_tokens, temperature, stream=False, **kwargs), self._timeout(kwargs))
+        except Exception as e:
+            logger.error(f"OpenAI-compatible batch generation failed: {e}")
+            fallback_or_raise(e, self.model_name, self.fallback, kwargs.get('allow_fallback', True))
+            return [self.mock.generate(p, max_tokens, temperature, **kwargs) for p in prompts]
+        # With n=1, choice i answers prompt i
+        texts = [""] * len(prompts)
+        for choice in data["choices"]:
+            texts[choice["index"]] = self._choice_text(choice)
+        return texts
+    
+    async def agenerate_choices(
+        self,
+        prompt: str,
+        n: int,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> List[str]:
+        """`n` completions from one request (the prompt is processed once)"""
+        try:
+            data = await self._apost(self._payload(prompt, max_tokens, temperature, stream=False, n=n, **kwargs), self._timeout(kwargs))
+        except Exception as e:
+            logger.error(f"OpenAI-compatible generation failed: {e}")
+            fallback_or_raise(e, self.model_name, self.fallback, kwargs.get('allow_fallback', True))
+            return [self.mock.generate(prompt, max_tokens, temperature, **kwargs)] * n
+        choices = sorted(data["choices"], key=lambda choice: choice["index"])
+        return [self._choice_text(choice) for choice in choices]
+    
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
     
     def get_model_name(self) -> str:
         return self.model_name
+    
+    def health(self) -> Dict[str, Any]:
+        return {
+            "backends": {"endpoints": [{"url": self.base_url, "state": self.breaker.state, "circuit": self.breaker.status()}]},
+            "fallback": self.fallback,
+            "degraded": self.breaker.state != CLOSED,
+        }
 
 
 class GeminiAdapter(LLMInterface):
@@ -201,6 +971,12 @@ class OpenAIAdapter(LLMInterface):
         return self.model
 
 
+def scheduler_for(llm: LLMInterface) -> LLMScheduler:
+    """Scheduler for a provider, admitting CLARITY_LLM_MAX_IN_FLIGHT calls per node of its backend pool"""
+    pool = getattr(llm, "pool", None)
+    return LLMScheduler(name=llm.get_model_name(), nodes=len(pool.nodes) if pool is not None else 1)
+
+
 class LLMWrapper:
     """Unified LLM wrapper that selects provider based on config"""
     
@@ -214,27 +990,70 @@ class LLMWrapper:
             self.llm = GPTOSSAdapter(model_name=model_name)
         elif provider == "gemini":
             self.llm = GeminiAdapter()
+        elif provider in OPENAI_COMPATIBLE_PROVIDERS:
+            self.llm = OpenAICompatibleAdapter(model_name=model_name)
         elif provider == "openai":
             self.llm = OpenAIAdapter(model=model_name)
         else:
             logger.warning(f"Unknown LLM provider: {provider}, using mock")
             self.llm = MockLLM()
         
+        # Tiers other than quality, by name; a tier without a model of its own uses self.llm
+        self.tiers: Dict[str, LLMInterface] = {}
+        fast_model = os.getenv("LLM_FAST_MODEL", "").strip()
+        if fast_model and fast_model != model_name:
+            if provider in ["gpt-oss", "ollama"]:
+                self.tiers[FAST] = GPTOSSAdapter(model_name=fast_model)
+            elif provider in OPENAI_COMPATIBLE_PROVIDERS:
+                self.tiers[FAST] = OpenAICompatibleAdapter(model_name=fast_model)
+            elif provider == "openai":
+                self.tiers[FAST] = OpenAIAdapter(model=fast_model)
+        self.call_site_tiers = {**DEFAULT_CALL_SITE_TIERS, **parse_tier_map(os.getenv("CLARITY_LLM_TIERS", ""))}
+        
+        self.prompt_token_budget = PROMPT_TOKEN_BUDGET
+        self.structured_max_retries = int(os.getenv("CLARITY_STRUCTURED_MAX_RETRIES", "1"))
+        # One local model serves everything: admit a few calls per backend node at a time, interactive first
+        self.scheduler = scheduler_for(self.llm)
+        # Each smaller tier model runs beside it with its own queue, so short prompts don't wait behind long generations
+        self.tier_schedulers = {tier: scheduler_for(llm) for tier, llm in self.tiers.items()}
         logger.info(f"Initialized LLM: {self.llm.get_model_name()}")
+        for tier, llm in self.tiers.items():
+            logger.info(f"Initialized {tier} tier LLM: {llm.get_model_name()}")
     
     def build_rag_prompt(
         self,
         question: str,
         context_chunks: List[str],
-        include_instructions: bool = True
+        include_instructions: bool = True,
+        token_counts: Optional[List[Optional[int]]] = None
     ) -> str:
-        """Build RAG prompt with context"""
+        """
+        Build RAG prompt with as much context as fits the prompt token budget
+        
+        Args:
+            question: User question
+            context_chunks: Retrieved chunk texts, most relevant first
+            include_instructions: Use the full instruction template
+            token_counts: Per-chunk token counts stored at ingest (optional)
+        """
+        template_tokens = count_tokens(self._format_rag_prompt(question, "", include_instructions))
+        packed = pack_context(
+            context_chunks,
+            budget=self.prompt_token_budget - template_tokens,
+            token_counts=token_counts,
+            overhead_tokens=EXCERPT_OVERHEAD_TOKENS
+        )
         
         context = "\n\n".join([
             f"[Excerpt {i+1}]:\n{chunk}"
-            for i, chunk in enumerate(context_chunks)
+            for i, chunk in enumerate(packed)
         ])
         
+        prompt = self._format_rag_prompt(question, context, include_instructions)
+        logger.info(f"RAG prompt: {count_tokens(prompt)} tokens ({len(packed)}/{len(context_chunks)} excerpts)")
+        return prompt
+    
+    def _format_rag_prompt(self, question: str, context: str, include_instructions: bool) -> str:
         if include_instructions:
             prompt = f"""SYSTEM: You are Clarity, an educational assistant. Use the provided document excerpts to answer concisely. If unsure, say "I don't know" and suggest searching or uploading more material.
 
@@ -257,25 +1076,138 @@ INSTRUCTIONS:
         question: str,
         context_chunks: List[str],
         max_tokens: int = 1024,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        token_counts: Optional[List[Optional[int]]] = None,
+        prompt: Optional[str] = None
     ) -> str:
-        """Generate answer using RAG prompt"""
+        """Generate answer using RAG prompt (pass `prompt` to reuse one already built)"""
         
-        prompt = self.build_rag_prompt(question, context_chunks)
+        if prompt is None:
+            prompt = self.build_rag_prompt(question, context_chunks, token_counts=token_counts)
         return self.llm.generate(prompt, max_tokens, temperature)
     
+    def stream_answer(
+        self,
+        question: str,
+        context_chunks: List[str],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        token_counts: Optional[List[Optional[int]]] = None,
+        prompt: Optional[str] = None
+    ) -> Iterator[str]:
+        """Stream an answer using RAG prompt, yielding text pieces as the LLM produces them"""
+        
+        if prompt is None:
+            prompt = self.build_rag_prompt(question, context_chunks, token_counts=token_counts)
+        return self.llm.stream(prompt, max_tokens, temperature)
+    
+    async def aanswer_question(
+        self,
+        question: str,
+        context_chunks: List[str],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        token_counts: Optional[List[Optional[int]]] = None,
+        prompt: Optional[str] = None,
+        priority: str = INTERACTIVE,
+        user_id: Optional[str] = None,
+        call_site: str = "ask"
+    ) -> str:
+        """Async variant of answer_question(), scheduled as `priority` for `user_id`"""
+        
+        if prompt is None:
+            prompt = self.build_rag_prompt(question, context_chunks, token_counts=token_counts)
+        async with self.call_slot(call_site, priority, user_id) as llm:
+            return await llm.agenerate(prompt, max_tokens, temperature)
+    
+    async def astream_answer(
+        self,
+        question: str,
+        context_chunks: List[str],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        token_counts: Optional[List[Optional[int]]] = None,
+        prompt: Optional[str] = None,
+        priority: str = INTERACTIVE,
+        user_id: Optional[str] = None,
+        call_site: str = "ask"
+    ) -> AsyncIterator[str]:
+        """Async variant of stream_answer(); holds a scheduler slot until the stream ends"""
+        
+        if prompt is None:
+            prompt = self.build_rag_prompt(question, context_chunks, token_counts=token_counts)
+        # A stream is bounded by max_tokens (fitted to the deadline), not cut off mid-answer
+        async with self.call_slot(call_site, priority, user_id, enforce_deadline=False) as llm:
+            async for piece in llm.astream(prompt, max_tokens, temperature):
+                yield piece
+    
     def generate_quiz(
         self,
         topic: str,
         context_chunks: List[str],
         difficulty: str = "medium",
-        num_questions: int = 5
+        num_questions: int = 5,
+        token_counts: Optional[List[Optional[int]]] = None
+    ) -> str:
+        """Generate quiz questions from as much context as fits the prompt token budget"""
+        
+        prompt = self.build_quiz_prompt(topic, context_chunks, difficulty, num_questions, token_counts)
+        return self.llm.generate(prompt, max_tokens=3000, temperature=0.7)
+    
+    async def agenerate_quiz(
+        self,
+        topic: str,
+        context_chunks: List[str],
+        difficulty: str = "medium",
+        num_questions: int = 5,
+        token_counts: Optional[List[Optional[int]]] = None,
+        priority: str = BULK,
+        user_id: Optional[str] = None
+    ) -> QuizOutput:
+        """
+        Async variant of generate_quiz() returning validated questions
+        
+        Raises:
+            StructuredOutputError: If no valid quiz could be produced
+        """
+        
+        prompt = self.build_quiz_prompt(topic, context_chunks, difficulty, num_questions, token_counts)
+        return await self.agenerate_structured(
+            prompt,
+            QuizOutput,
+            max_tokens=3000,
+            temperature=0.7,
+            task="quiz",
+            topup_field="questions",
+            min_items=num_questions,
+            priority=priority,
+            user_id=user_id
+        )
+    
+    def build_quiz_prompt(
+        self,
+        topic: str,
+        context_chunks: List[str],
+        difficulty: str = "medium",
+        num_questions: int = 5,
+        token_counts: Optional[List[Optional[int]]] = None
     ) -> str:
-        """Generate quiz questions from context"""
+        """Build quiz prompt with as much context as fits the prompt token budget"""
         
-        context = "\n\n".join(context_chunks[:3])  # Limit context for quiz gen
+        template_tokens = count_tokens(self._format_quiz_prompt(topic, "", difficulty, num_questions))
+        packed = pack_context(
+            context_chunks,
+            budget=self.prompt_token_budget - template_tokens,
+            token_counts=token_counts,
+            overhead_tokens=QUIZ_CHUNK_OVERHEAD_TOKENS
+        )
         
-        prompt = f"""You are a quiz generator. Generate {num_questions} multiple-choice questions about {topic} based on the provided content.
+        prompt = self._format_quiz_prompt(topic, "\n\n".join(packed), difficulty, num_questions)
+        logger.info(f"Quiz prompt: {count_tokens(prompt)} tokens ({len(packed)}/{len(context_chunks)} chunks)")
+        return prompt
+    
+    def _format_quiz_prompt(self, topic: str, context: str, difficulty: str, num_questions: int) -> str:
+        return f"""You are a quiz generator. Generate {num_questions} multiple-choice questions about {topic} based on the provided content.
 
 Difficulty level: {difficulty}
 
@@ -308,8 +1240,231 @@ Rules:
 - Provide a helpful hint that guides without revealing the answer
 - For incorrect_explanations, explain why each incorrect option is wrong, leave correct answer's explanation empty
 - Output ONLY the JSON, no markdown, no code blocks, no extra text"""
+    
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        cache: bool = False,
+        bypass_cache: bool = False,
+        priority: str = INTERACTIVE,
+        user_id: Optional[str] = None,
+        call_site: str = "other",
+        on_partial: Optional[Callable[[str], None]] = None,
+        **kwargs
+    ) -> str:
+        """
+        Generate text from a free-form prompt without blocking the event loop
         
-        return self.llm.generate(prompt, max_tokens=3000, temperature=0.7)
+        Args:
+            prompt: Prompt text
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature
+            cache: Serve repeated prompts from the persistent LLM response cache
+                (opt in where a repeated prompt should get the same answer)
+            bypass_cache: Skip the cache lookup but store the fresh response
+            priority: Scheduler priority class (interactive, standard or bulk)
+            user_id: Caller, for per-user fairness in the scheduler queue
+            call_site: Feature making the call, for usage metrics and model tier routing
+            on_partial: Called with the text so far as it is generated (streams the call)
+        """
+        if not cache:
+            async with self.call_slot(call_site, priority, user_id) as llm:
+                return await self._complete(llm, prompt, max_tokens, temperature, on_partial, **kwargs)
+        
+        model = self.route(call_site)[1].get_model_name()
+        options = {k: v for k, v in kwargs.items() if k != "timeout"}
+        key = llm_cache_key(model, prompt, temperature, max_tokens, options)
+        if not bypass_cache:
+            cached = llm_cache.get(key)
+            if cached is not None:
+                return cached
+        
+        # Cached calls raise instead of falling back to mock output, so a fallback is never persisted
+        async with self.call_slot(call_site, priority, user_id) as llm:
+            start = time.perf_counter()
+            response = await self._complete(llm, prompt, max_tokens, temperature, on_partial, allow_fallback=False, **kwargs)
+        llm_cache.put(key, response, (time.perf_counter() - start) * 1000, model=model)
+        return response
+    
+    async def agenerate_structured(
+        self,
+        prompt: str,
+        schema: Type[BaseModel],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        task: str = "structured",
+        topup_field: Optional[str] = None,
+        min_items: int = 0,
+        cache: bool = False,
+        bypass_cache: bool = False,
+        priority: str = INTERACTIVE,
+        user_id: Optional[str] = None,
+        call_site: Optional[str] = None,
+        on_partial: Optional[Callable[[str], None]] = None,
+        **kwargs
+    ) -> BaseModel:
+        """
+        Generate JSON constrained to `schema` and return it validated
+        
+        The schema is passed to the model's `format` option. Output is
+        repaired locally where possible and invalid list items are dropped.
+        Retries are targeted (up to CLARITY_STRUCTURED_MAX_RETRIES): unusable
+        JSON is sent back to the model to fix, and a short list is topped up
+        with only the missing items.
+        
+        Args:
+            prompt: Prompt text
+            schema: Pydantic model of the expected JSON
+            task: Name for wasted-token accounting (quiz, flashcards, mind_map)
+            topup_field: List field that should hold at least `min_items` items
+            min_items: Items wanted in `topup_field`
+            cache, bypass_cache, priority, user_id: As for agenerate()
+            call_site: Label for usage metrics (defaults to `task`)
+            on_partial: Called with the first generation's text so far as it
+                streams (not for repair or top-up calls)
+        
+        Raises:
+            StructuredOutputError: If no valid output could be produced
+        """
+        json_schema = schema.model_json_schema()
+        model = self.route(call_site or task)[1].get_model_name()
+        key = None
+        if cache:
+            options = {k: v for k, v in kwargs.items() if k != "timeout"}
+            key = llm_cache_key(model, prompt, temperature, max_tokens, {**options, "format": json_schema})
+            if not bypass_cache:
+                cached = llm_cache.get(key)
+                if cached is not None:
+                    return schema.model_validate_json(cached)
+        
+        async def generate(text_prompt: str, text_temperature: float, partial: Optional[Callable[[str], None]] = None):
+            text = await self.agenerate(
+                text_prompt, max_tokens, text_temperature,
+                format=json_schema, priority=priority, user_id=user_id,
+                call_site=call_site or task, on_partial=partial, **kwargs
+            )
+            parsed = parse_structured(text, schema)
+            structured_stats.record(
+                task,
+                generations=1,
+                output_tokens=count_tokens(text),
+                wasted_tokens=item_tokens(parsed.dropped),
+                local_repairs=int(parsed.repaired)
+            )
+            return text, parsed
+        
+        start = time.perf_counter()
+        text, parsed = await generate(prompt, temperature, on_partial)
+        
+        for _ in range(self.structured_max_retries):
+            if parsed.value is None:
+                # Have the model fix its own output instead of regenerating from the source context
+                logger.warning(f"Structured {task} output invalid ({parsed.error}); asking the model to repair it")
+                structured_stats.record(task, wasted_tokens=count_tokens(text), retries=1)
+                text, parsed = await generate(build_repair_prompt(text, parsed.error, schema), 0.0)
+            elif topup_field and len(getattr(parsed.value, topup_field)) < min_items:
+                items = getattr(parsed.value, topup_field)
+                existing = [item.model_dump(by_alias=True) for item in items]
+                missing = min_items - len(items)
+                logger.info(f"Structured {task} output has {len(items)}/{min_items} {topup_field}; requesting {missing} more")
+                structured_stats.record(task, retries=1)
+                more_text, more = await generate(build_topup_prompt(prompt, topup_field, existing, missing), temperature)
+                if more.value is None:
+                    structured_stats.record(task, wasted_tokens=count_tokens(more_text))
+                    continue
+                new_items = [item for item in getattr(more.value, topup_field) if item.model_dump(by_alias=True) not in existing]
+                parsed = parsed._replace(value=parsed.value.model_copy(update={topup_field: items + new_items[:missing]}))
+            else:
+                break
+        
+        if parsed.value is None:
+            structured_stats.record(task, wasted_tokens=count_tokens(text), failures=1)
+            raise StructuredOutputError(f"Could not parse {task} output: {parsed.error}")
+        
+        if key:
+            llm_cache.put(key, parsed.value.model_dump_json(by_alias=True), (time.perf_counter() - start) * 1000, model=model)
+        return parsed.value
+    
+    async def _complete(
+        self,
+        llm: LLMInterface,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        on_partial: Optional[Callable[[str], None]] = None,
+        **kwargs
+    ) -> str:
+        """One completion from `llm`; with `on_partial`, streamed and reported as it grows"""
+        if on_partial is None:
+            return await llm.agenerate(prompt, max_tokens, temperature, **kwargs)
+        text = ""
+        async for piece in llm.astream(prompt, max_tokens, temperature, **kwargs):
+            text += piece
+            on_partial(text)
+        return text
+    
+    def route(self, call_site: str) -> Tuple[str, LLMInterface]:
+        """Model tier and provider serving `call_site` (quality unless mapped to a configured tier)"""
+        tier = self.call_site_tiers.get(call_site, QUALITY)
+        llm = self.tiers.get(tier)
+        if llm is None:
+            return QUALITY, self.llm
+        return tier, llm
+    
+    @asynccontextmanager
+    async def call_slot(
+        self,
+        call_site: str,
+        priority: str = INTERACTIVE,
+        user_id: Optional[str] = None,
+        enforce_deadline: bool = True
+    ) -> AsyncIterator[LLMInterface]:
+        """
+        Scheduler slot for one LLM call, with its tokens and latency recorded under `call_site`
+        
+        Under a request deadline (see app.utils.deadline) the call, including
+        its wait in the queue, is cancelled when the deadline passes.
+        
+        Yields:
+            Provider for the call site's model tier
+        
+        Raises:
+            DeadlineExceeded: If the deadline passed before the call finished
+        """
+        tier, llm = self.route(call_site)
+        scheduler = self.tier_schedulers.get(tier, self.scheduler)
+        left = remaining() if enforce_deadline else None
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"Request deadline exceeded before {call_site} generation")
+        timeout = asyncio.timeout(left)
+        try:
+            async with timeout:
+                async with scheduler.slot(priority, user_id) as queue_ms:
+                    with llm_metrics.measure(call_site, llm.get_model_name(), queue_ms, tier=tier):
+                        yield llm
+        except TimeoutError as e:
+            if not timeout.expired() or isinstance(e, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded(f"Request deadline exceeded during {call_site} generation") from e
+    
+    async def aclose(self) -> None:
+        """Close the providers' pooled connections (on app shutdown)"""
+        await self.llm.aclose()
+        for llm in self.tiers.values():
+            await llm.aclose()
+    
+    def scheduler_stats(self) -> Dict[str, Any]:
+        """Quality-tier scheduler stats, with the other tiers' schedulers under `tiers`"""
+        return {
+            **self.scheduler.stats(),
+            "tiers": {tier: scheduler.stats() for tier, scheduler in self.tier_schedulers.items()},
+        }
+    
+    def tier_models(self) -> Dict[str, str]:
+        """Model serving each tier"""
+        return {QUALITY: self.get_model_name(), **{tier: llm.get_model_name() for tier, llm in self.tiers.items()}}
     
     def get_model_name(self) -> str:
         """Get current model name"""
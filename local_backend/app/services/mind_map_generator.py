@@ -0,0 +1,216 @@
+"""
+Map-reduce mind map generation: cluster the notebook, generate a branch per cluster, merge under a root
+"""
+import os
+import math
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from .llm_wrapper import llm_wrapper
+from .llm_scheduler import BULK
+from .fan_out import FanOut
+from ..models.schemas import MindMapEdgeOutput, MindMapNodeOutput, MindMapOutput
+
+logger = logging.getLogger(__name__)
+
+# Most branches (clusters) a map is split into; they are generated concurrently
+MAX_CLUSTERS = int(os.getenv("CLARITY_MINDMAP_CLUSTERS", "6"))
+# Chunks closest to its centroid that each branch prompt sees
+CHUNKS_PER_CLUSTER = int(os.getenv("CLARITY_MINDMAP_CHUNKS_PER_CLUSTER", "6"))
+# Notebooks with fewer chunks than this are mapped with a single prompt
+MIN_CHUNKS = int(os.getenv("CLARITY_MINDMAP_MIN_CHUNKS", "12"))
+# Output tokens allowed per depth level of a branch
+TOKENS_PER_LEVEL = 350
+
+
+def cluster_count(num_chunks: int) -> int:
+    """Branches for a notebook of `num_chunks` chunks (at least 2 chunks per cluster, at most MAX_CLUSTERS)"""
+    return max(1, min(MAX_CLUSTERS, num_chunks // 2, round(math.sqrt(num_chunks / 2))))
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 25, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cosine k-means over row vectors (k-means++ seeding, all distances computed as one matrix product)
+
+    Args:
+        vectors: (n, dim) embeddings
+        k: Number of clusters (at most n)
+        iterations: Upper bound on Lloyd iterations; stops early once assignments settle
+        seed: Seed for the k-means++ draws, so the same notebook clusters the same way
+
+    Returns:
+        (labels of shape (n,), unit-length centroids of shape (k, dim))
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    n = len(vectors)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+
+    # k-means++: each next centroid drawn with probability proportional to its distance from the chosen ones
+    centroids = [vectors[rng.integers(n)]]
+    distance = 1.0 - vectors @ centroids[0]
+    for _ in range(1, k):
+        weights = np.maximum(distance, 0.0)
+        total = weights.sum()
+        index = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centroids.append(vectors[index])
+        distance = np.minimum(distance, 1.0 - vectors @ vectors[index])
+    centroids = np.stack(centroids)
+
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # An emptied cluster keeps its previous centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    return labels, centroids
+
+
+def representative_chunks(vectors: np.ndarray, labels: np.ndarray, centroids: np.ndarray, per_cluster: int) -> List[List[int]]:
+    """Indices of the chunks closest to each centroid, per non-empty cluster, largest cluster first"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scores = np.sum(vectors * centroids[labels], axis=1)
+    clusters = []
+    for cluster in range(len(centroids)):
+        members = np.flatnonzero(labels == cluster)
+        if len(members):
+            closest = members[np.argsort(-scores[members], kind="stable")[:per_cluster]]
+            clusters.append((len(members), closest.tolist()))
+    clusters.sort(key=lambda cluster: -cluster[0])
+    return [indices for _, indices in clusters]
+
+
+def build_branch_prompt(chunks: List[str], max_depth: int) -> str:
+    """Prompt for one branch: a subtree of depths 0..max_depth-1 whose root is the cluster's theme"""
+    context = "\n\n".join(chunks)
+    levels = max(1, max_depth)
+    return f"""The following excerpts come from one part of a larger set of notes. Build the branch of a mind map that covers them.
+
+Content:
+{context}
+
+Requirements:
+1. Exactly one node with "depth": 0 naming the theme these excerpts share (2-5 words)
+2. Nodes for EVERY depth from 0 to {levels - 1}: depth 1 holds 3-5 subtopics, each deeper level 1-3 details per node above it
+3. Every node has a unique numeric ID (as a string), a concise label (2-5 words) and one sentence of content
+4. Every node except the depth 0 node has exactly one incoming edge from a node one level up
+5. Every edge has a descriptive label, e.g. "includes", "causes", "is a type of", "leads to"
+
+Return ONLY a valid JSON object:
+{{
+  "nodes": [{{"id": "1", "label": "Theme", "content": "What the excerpts are about", "depth": 0}}, {{"id": "2", "label": "Subtopic", "content": "Key idea", "depth": 1}}],
+  "edges": [{{"from": "1", "to": "2", "label": "includes"}}]
+}}"""
+
+
+def merge_branches(root_label: str, branches: List[MindMapOutput]) -> MindMapOutput:
+    """
+    Combine branch subtrees under one root
+
+    Node IDs are renumbered so branches don't collide, depths shift down one
+    level, and each branch's depth-0 node becomes a child of the root.
+    """
+    nodes = [MindMapNodeOutput(id="1", label=root_label or "Overview", content=f"{len(branches)} main themes", depth=0)]
+    edges: List[MindMapEdgeOutput] = []
+    for branch in branches:
+        ids: Dict[str, str] = {}
+        for node in branch.nodes:
+            if node.id in ids:
+                continue
+            ids[node.id] = str(len(nodes) + 1)
+            nodes.append(MindMapNodeOutput(id=ids[node.id], label=node.label, content=node.content, depth=node.depth + 1))
+            if node.depth == 0:
+                edges.append(MindMapEdgeOutput(from_="1", to=ids[node.id], label="includes"))
+        for edge in branch.edges:
+            if edge.from_ in ids and edge.to in ids:
+                edges.append(MindMapEdgeOutput(from_=ids[edge.from_], to=ids[edge.to], label=edge.label))
+    return MindMapOutput(nodes=nodes, edges=edges)
+
+
+async def generate_mind_map_clustered(
+    root_label: str,
+    chunks: List[str],
+    embeddings: List[List[float]],
+    max_depth: int = 3,
+    user_id: Optional[str] = None,
+    bypass_cache: bool = False,
+    on_branch: Optional[Callable[[MindMapOutput, int, int], None]] = None,
+    priority: str = BULK
+) -> MindMapOutput:
+    """
+    Generate a mind map over a whole notebook as concurrent branches
+
+    The chunk embeddings are clustered with k-means; each cluster's most
+    central chunks go to its own, small, branch prompt, and the branches run
+    concurrently through the LLM scheduler. Prompt size and the number of
+    calls are bounded, so wall-clock time stays roughly flat as the notebook
+    grows. Branches that fail are left out, like failed quiz shards.
+
+    Args:
+        root_label: Label of the root node (the mind map title)
+        chunks: Text of every chunk in the notebook
+        embeddings: Stored embedding of each chunk
+        max_depth: Deepest level of the merged map
+        user_id: Caller, for scheduler fairness
+        bypass_cache: Skip the LLM response cache
+        on_branch: Called with the map merged so far, branches done and branches total, as each branch finishes
+
+    Returns:
+        The merged mind map
+
+    Raises:
+        StructuredOutputError: If no branch produced a valid subtree
+        DeadlineExceeded: If the request deadline passed before any branch finished
+        LLMUnavailableError: If every branch failed because the LLM was unavailable
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    labels, centroids = await asyncio.to_thread(kmeans, vectors, cluster_count(len(chunks)))
+    clusters = representative_chunks(vectors, labels, centroids, CHUNKS_PER_CLUSTER)
+    branch_depth = max(1, max_depth)
+
+    async def run_branch(position: int, indices: List[int]) -> Tuple[int, MindMapOutput]:
+        return position, await llm_wrapper.agenerate_structured(
+            build_branch_prompt([chunks[i] for i in indices], max_depth),
+            MindMapOutput,
+            max_tokens=TOKENS_PER_LEVEL * branch_depth + 200,
+            temperature=0.3,
+            task="mind_map",
+            call_site="mindmap",
+            cache=True,
+            bypass_cache=bypass_cache,
+            priority=priority,
+            user_id=user_id
+        )
+
+    def merged() -> MindMapOutput:
+        # Largest cluster first, whatever order the branches finished in
+        return merge_branches(root_label, [kept[position] for position in sorted(kept)])
+
+    logger.info(f"Generating mind map over {len(chunks)} chunks as {len(clusters)} branches")
+    kept: Dict[int, MindMapOutput] = {}
+    empty = 0
+    async with FanOut("Mind map branch", [run_branch(position, indices) for position, indices in enumerate(clusters)]) as branches:
+        async for position, branch in branches:
+            # Deeper levels than asked for would overflow the merged map's depth
+            branch.nodes = [node for node in branch.nodes if node.depth < branch_depth]
+            if not branch.nodes:
+                empty += 1
+                continue
+            kept[position] = branch
+            if on_branch is not None:
+                on_branch(merged(), len(kept) + branches.failures + empty, branches.total)
+
+    logger.info(f"Mind map branches: {len(kept)} kept, {branches.failures + empty} failed")
+    if not kept:
+        branches.raise_failure("No valid mind map branches were generated")
+    return merged()
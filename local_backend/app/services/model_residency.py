@@ -0,0 +1,173 @@
+"""
+Keeps the local LLMs loaded: preload at startup, keep_alive and periodic keepalive pings
+"""
+import os
+import time
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+from .llm_wrapper import llm_wrapper
+
+logger = logging.getLogger(__name__)
+
+
+def parse_active_hours(value: str) -> Optional[Tuple[int, int]]:
+    """Parse "7-23" into (7, 23); empty means always active"""
+    if not value.strip():
+        return None
+    start, end = value.split("-", 1)
+    return int(start), int(end)
+
+
+class ModelResidencyManager:
+    """Preloads the configured models and keeps them resident during active hours
+
+    Every generation already asks Ollama to keep its model loaded for
+    CLARITY_LLM_KEEP_ALIVE. On top of that, the quality model and every
+    tier model (see LLMWrapper.tiers) are loaded at startup, and during
+    active hours a no-op load request is sent to each every
+    `keepalive_interval` seconds so the first call after idle doesn't pay
+    the load time. The top-level state tracks the quality model; tier
+    models report theirs under `tiers`.
+    """
+
+    def __init__(
+        self,
+        wrapper,
+        keepalive_interval: Optional[float] = None,
+        active_hours: Optional[str] = None
+    ):
+        self.wrapper = wrapper
+        self.keepalive_interval = keepalive_interval if keepalive_interval is not None else float(os.getenv("CLARITY_LLM_KEEPALIVE_INTERVAL", "600"))
+        self.active_hours = parse_active_hours(active_hours if active_hours is not None else os.getenv("CLARITY_LLM_ACTIVE_HOURS", "7-23"))
+
+        self.state = "cold"  # cold | loading | warm | error | not_applicable
+        self.last_load_ms: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.last_keepalive: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # tier -> state (same values as `state`) and last preload error of that tier's model
+        self.tier_states: Dict[str, str] = {}
+        self.tier_errors: Dict[str, Optional[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def in_active_hours(self, now: Optional[datetime] = None) -> bool:
+        if self.active_hours is None:
+            return True
+        hour = (now or datetime.now()).hour
+        start, end = self.active_hours
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    async def preload(self) -> None:
+        """Load the quality and tier models now, concurrently (also used for keepalive pings)"""
+        await asyncio.gather(
+            self._preload_quality(),
+            *(self._preload_tier(tier, llm) for tier, llm in self.wrapper.tiers.items())
+        )
+
+    async def _preload_tier(self, tier: str, llm) -> None:
+        try:
+            loaded = await llm.apreload()
+        except Exception as e:
+            self.tier_states[tier] = "error"
+            self.tier_errors[tier] = str(e)
+            logger.warning(f"Could not preload {tier} tier model {llm.get_model_name()}: {e}")
+            return
+        if loaded and self.tier_states.get(tier) != "warm":
+            logger.info(f"Loaded {tier} tier model {llm.get_model_name()}")
+        self.tier_states[tier] = "warm" if loaded else "not_applicable"
+        self.tier_errors[tier] = None
+
+    async def _preload_quality(self) -> None:
+        if self.state != "warm":
+            self.state = "loading"
+        start = time.perf_counter()
+        try:
+            loaded = await self.wrapper.llm.apreload()
+        except Exception as e:
+            self.state = "error"
+            self.last_error = str(e)
+            logger.warning(f"Could not preload {self.wrapper.get_model_name()}: {e}")
+            return
+
+        if not loaded:
+            self.state = "not_applicable"
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if self.state != "warm":
+            logger.info(f"Loaded {self.wrapper.get_model_name()} in {elapsed_ms / 1000:.1f}s")
+            self.last_load_ms = elapsed_ms
+            self.loaded_at = time.time()
+        self.state = "warm"
+        self.last_error = None
+
+    async def start(self) -> None:
+        """Preload in the background and start keepalive pings"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        await self.preload()
+        if self.state == "not_applicable":
+            return
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if self.in_active_hours():
+                await self.preload()
+                self.last_keepalive = time.time()
+
+    async def status(self) -> Dict[str, Any]:
+        """Load/warm status for /health (asks the backend whether the model is still resident)"""
+        resident = None
+        if self.state in ("warm", "cold", "error"):
+            try:
+                resident = await self.wrapper.llm.aresident()
+            except Exception as e:
+                logger.debug(f"Residency check failed: {e}")
+            if resident is False and self.state == "warm":
+                # Evicted (idle past keep_alive or displaced by another model)
+                self.state = "cold"
+            elif resident and self.state == "cold":
+                self.state = "warm"
+
+        tiers = {}
+        for tier, llm in self.wrapper.tiers.items():
+            tier_resident = None
+            try:
+                tier_resident = await llm.aresident()
+            except Exception as e:
+                logger.debug(f"Residency check of {tier} tier failed: {e}")
+            tiers[tier] = {
+                "model": llm.get_model_name(),
+                "state": self.tier_states.get(tier, "cold"),
+                "resident": tier_resident,
+                "error": self.tier_errors.get(tier),
+            }
+
+        return {
+            "model": self.wrapper.get_model_name(),
+            "state": self.state,
+            "resident": resident,
+            "keep_alive": getattr(self.wrapper.llm, "keep_alive", None),
+            "last_load_ms": self.last_load_ms,
+            "loaded_at": self.loaded_at,
+            "last_keepalive": self.last_keepalive,
+            "active_hours": "-".join(map(str, self.active_hours)) if self.active_hours else None,
+            "error": self.last_error,
+            "tiers": tiers,
+        }
+
+
+# Global instance
+model_residency = ModelResidencyManager(llm_wrapper)
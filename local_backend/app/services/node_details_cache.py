@@ -0,0 +1,170 @@
+"""
+Cache of mind map node details, scoped per notebook
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def prefetch_order(nodes: List[Dict[str, Any]], degree: Dict[str, int], limit: Optional[int] = None) -> List[str]:
+    """
+    Node IDs in the order their details should be prefetched
+
+    Shallow nodes first (the ones a user sees and clicks before expanding
+    anything), and within a level the best-connected ones.
+    """
+    ranked = sorted(nodes, key=lambda node: (node.get("depth", 0), -degree.get(node["id"], 0)))
+    ids = [node["id"] for node in ranked]
+    return ids[:limit] if limit is not None else ids
+
+
+class NodeDetailsCache:
+    """Node details keyed by (mind map, node), grouped by the notebook they were built from
+
+    Each notebook holds at most `max_entries` entries, evicted
+    least-recently-used first; entries older than `ttl_seconds` are
+    ignored and dropped. Adding or removing documents invalidates the
+    notebook, and bumps its version so details computed from the old
+    documents (e.g. by a prefetch still running) are not stored.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_notebooks: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("CLARITY_NODE_DETAILS_CACHE_TTL", "86400"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("CLARITY_NODE_DETAILS_CACHE_MAX_ENTRIES", "512"))
+        self.max_notebooks = max_notebooks if max_notebooks is not None else int(os.getenv("CLARITY_NODE_DETAILS_CACHE_MAX_NOTEBOOKS", "32"))
+        self.enabled = enabled if enabled is not None else os.getenv("CLARITY_NODE_DETAILS_CACHE_ENABLED", "true").lower() == "true"
+
+        # notebook key -> OrderedDict((mind map ID, node ID) -> entry), most recently used last
+        self._buckets: "OrderedDict[Tuple[str, str], OrderedDict]" = OrderedDict()
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "stale_stores": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _notebook_key(user_id: str, notebook_id: Optional[str]) -> Tuple[str, str]:
+        return (user_id, notebook_id or "__none__")
+
+    def version(self, user_id: str, notebook_id: Optional[str]) -> int:
+        """Current version of a notebook's documents; pass it to store()"""
+        with self._lock:
+            return self._versions.get(self._notebook_key(user_id, notebook_id), 0)
+
+    def get(self, user_id: str, notebook_id: Optional[str], mind_map_id: str, node_id: str) -> Optional[Dict[str, Any]]:
+        """Cached details of a node, or None on a miss"""
+        if not self.enabled:
+            return None
+        key = self._notebook_key(user_id, notebook_id)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            entry = bucket.get((mind_map_id, node_id)) if bucket else None
+            if entry is None or time.monotonic() - entry["created_at"] > self.ttl_seconds:
+                if entry is not None:
+                    del bucket[(mind_map_id, node_id)]
+                self._stats["misses"] += 1
+                return None
+            bucket.move_to_end((mind_map_id, node_id))
+            self._buckets.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry["details"]
+
+    def contains(self, user_id: str, notebook_id: Optional[str], mind_map_id: str, node_id: str) -> bool:
+        """Whether a node's details are cached (without counting a hit or miss)"""
+        with self._lock:
+            bucket = self._buckets.get(self._notebook_key(user_id, notebook_id))
+            return bool(bucket) and (mind_map_id, node_id) in bucket
+
+    def store(
+        self,
+        user_id: str,
+        notebook_id: Optional[str],
+        mind_map_id: str,
+        node_id: str,
+        details: Dict[str, Any],
+        version: int
+    ) -> bool:
+        """
+        Cache a node's details
+
+        Args:
+            version: Notebook version read (via version()) before the details were computed
+
+        Returns:
+            False if not stored because the notebook changed in the meantime
+        """
+        if not self.enabled:
+            return False
+        key = self._notebook_key(user_id, notebook_id)
+        with self._lock:
+            if self._versions.get(key, 0) != version:
+                self._stats["stale_stores"] += 1
+                return False
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = OrderedDict()
+                if len(self._buckets) > self.max_notebooks:
+                    _, evicted = self._buckets.popitem(last=False)
+                    self._stats["evictions"] += len(evicted)
+            self._buckets.move_to_end(key)
+            bucket[(mind_map_id, node_id)] = {"details": details, "created_at": time.monotonic()}
+            bucket.move_to_end((mind_map_id, node_id))
+            self._stats["stores"] += 1
+            while len(bucket) > self.max_entries:
+                bucket.popitem(last=False)
+                self._stats["evictions"] += 1
+            return True
+
+    def invalidate(self, user_id: str, notebook_id: Optional[str]) -> int:
+        """
+        Drop all cached node details for a notebook (call when its documents change)
+
+        Returns:
+            Number of entries dropped
+        """
+        key = self._notebook_key(user_id, notebook_id)
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            bucket = self._buckets.pop(key, None)
+            dropped = len(bucket) if bucket else 0
+            if dropped:
+                self._stats["invalidations"] += 1
+                logger.info(f"Invalidated {dropped} cached node details for notebook {notebook_id}")
+            return dropped
+
+    def drop_mind_map(self, mind_map_id: str) -> int:
+        """Drop the cached details of a deleted mind map; returns how many"""
+        with self._lock:
+            dropped = 0
+            for bucket in self._buckets.values():
+                keys = [key for key in bucket if key[0] == mind_map_id]
+                for key in keys:
+                    del bucket[key]
+                dropped += len(keys)
+            return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, hit rate and current size"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": sum(len(bucket) for bucket in self._buckets.values()),
+                "notebooks": len(self._buckets),
+                "enabled": self.enabled,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+# Global instance
+node_details_cache = NodeDetailsCache()
@@ -0,0 +1,163 @@
+"""
+Sharded quiz generation: concurrent shards over different context slices, merged and deduplicated
+"""
+import os
+import math
+import asyncio
+from typing import Callable, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from .llm_wrapper import llm_wrapper
+from .llm_scheduler import BULK
+from .fan_out import FanOut
+from ..models.schemas import QuizOutput, QuizQuestionOutput
+
+logger = logging.getLogger(__name__)
+
+# Questions requested from each shard
+SHARD_SIZE = int(os.getenv("CLARITY_QUIZ_SHARD_SIZE", "5"))
+# Retrieved chunks given to each shard
+CHUNKS_PER_SHARD = int(os.getenv("CLARITY_QUIZ_CHUNKS_PER_SHARD", "3"))
+# Questions at least this similar (cosine) to a kept question are dropped
+DEDUPE_THRESHOLD = float(os.getenv("CLARITY_QUIZ_DEDUPE_THRESHOLD", "0.9"))
+# Output tokens allowed per requested question (JSON with explanations and hints)
+TOKENS_PER_QUESTION = 250
+
+
+def shard_plan(num_questions: int) -> Tuple[int, int]:
+    """
+    (shards, questions per shard) for a quiz
+
+    Quizzes larger than one shard get a spare shard, which is cancelled if
+    the others already produced enough distinct questions.
+    """
+    if num_questions <= SHARD_SIZE:
+        return 1, num_questions
+    needed = math.ceil(num_questions / SHARD_SIZE)
+    return needed + 1, math.ceil(num_questions / needed)
+
+
+def chunks_needed(num_questions: int) -> int:
+    """How many chunks to retrieve so every shard gets its own slice"""
+    return max(5, shard_plan(num_questions)[0] * CHUNKS_PER_SHARD)
+
+
+def slice_context(chunks: List[str], num_shards: int) -> List[List[int]]:
+    """Deal chunk indices round-robin so each shard mixes high- and lower-ranked chunks"""
+    num_shards = max(1, min(num_shards, len(chunks)))
+    return [list(range(i, len(chunks), num_shards)) for i in range(num_shards)]
+
+
+class QuestionDeduper:
+    """Keeps questions that are not near-duplicates of ones already kept"""
+
+    def __init__(self, embed: Optional[Callable[[List[str]], List[List[float]]]], threshold: float = DEDUPE_THRESHOLD):
+        self.embed = embed
+        self.threshold = threshold
+        self.kept: List[QuizQuestionOutput] = []
+        self._embeddings: Optional[np.ndarray] = None
+        self._texts = set()
+
+    async def add(self, questions: List[QuizQuestionOutput]) -> int:
+        """Add questions, returning how many were dropped as duplicates"""
+        fresh = [q for q in questions if q.question.strip().lower() not in self._texts]
+        dropped = len(questions) - len(fresh)
+        if not fresh:
+            return dropped
+
+        vectors = None
+        if self.embed is not None:
+            try:
+                vectors = np.asarray(await asyncio.to_thread(self.embed, [q.question for q in fresh]), dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            except Exception as e:
+                logger.warning(f"Question embedding failed, deduplicating by exact text only: {e}")
+
+        for i, question in enumerate(fresh):
+            if vectors is not None:
+                vector = vectors[i]
+                if self._embeddings is not None and float(np.max(self._embeddings @ vector)) >= self.threshold:
+                    dropped += 1
+                    continue
+                self._embeddings = vector[None, :] if self._embeddings is None else np.vstack([self._embeddings, vector])
+            self._texts.add(question.question.strip().lower())
+            self.kept.append(question)
+        return dropped
+
+
+async def generate_quiz_sharded(
+    topic: str,
+    context_chunks: List[str],
+    difficulty: str = "medium",
+    num_questions: int = 5,
+    token_counts: Optional[List[Optional[int]]] = None,
+    embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    user_id: Optional[str] = None,
+    priority: str = BULK
+) -> List[QuizQuestionOutput]:
+    """
+    Generate a quiz as concurrent shards, each over its own slice of context
+
+    Shards go through the LLM scheduler (so the concurrency limit applies)
+    and are merged as they finish. Near-duplicate questions are dropped by
+    embedding similarity. As soon as `num_questions` questions are kept the
+    remaining shards are cancelled.
+
+    Args:
+        topic: Quiz topic
+        context_chunks: Retrieved chunk texts, most relevant first
+        difficulty: easy, medium or hard
+        num_questions: Questions wanted
+        token_counts: Per-chunk token counts stored at ingest (optional)
+        embed: Function embedding a list of texts (for deduplication)
+        user_id: Caller, for scheduler fairness
+
+    Returns:
+        Up to `num_questions` questions
+
+    Raises:
+        StructuredOutputError: If no shard produced a valid question
+        DeadlineExceeded: If the request deadline passed before any shard finished
+        LLMUnavailableError: If every shard failed because the LLM was unavailable
+    """
+    num_shards, per_shard = shard_plan(num_questions)
+    slices = slice_context(context_chunks, num_shards)
+    if len(slices) < num_shards:
+        # Too few chunks for every shard to get its own slice
+        per_shard = math.ceil(num_questions / len(slices))
+
+    async def run_shard(indices: List[int]) -> QuizOutput:
+        prompt = llm_wrapper.build_quiz_prompt(
+            topic,
+            [context_chunks[i] for i in indices],
+            difficulty,
+            per_shard,
+            [token_counts[i] for i in indices] if token_counts else None
+        )
+        return await llm_wrapper.agenerate_structured(
+            prompt,
+            QuizOutput,
+            max_tokens=TOKENS_PER_QUESTION * per_shard + 200,
+            temperature=0.7,
+            task="quiz",
+            topup_field="questions" if len(slices) == 1 else None,
+            min_items=per_shard,
+            priority=priority,
+            user_id=user_id
+        )
+
+    logger.info(f"Generating {num_questions} quiz questions in {len(slices)} shards of {per_shard}")
+    deduper = QuestionDeduper(embed)
+    duplicates = 0
+    async with FanOut("Quiz shard", [run_shard(indices) for indices in slices]) as shards:
+        async for shard in shards:
+            duplicates += await deduper.add(shard.questions)
+            if len(deduper.kept) >= num_questions:
+                break
+
+    logger.info(f"Quiz shards kept {len(deduper.kept)} questions ({duplicates} duplicates, {shards.failures} failed shards)")
+    if not deduper.kept:
+        shards.raise_failure("No valid quiz questions were generated")
+    return deduper.kept[:num_questions]
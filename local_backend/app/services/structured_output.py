@@ -0,0 +1,213 @@
+"""
+Parsing, repair and accounting for schema-constrained LLM output
+"""
+import re
+import json
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Type, get_args, get_origin
+import logging
+
+from pydantic import BaseModel, ValidationError
+
+from ..utils.chunker import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class StructuredOutputError(ValueError):
+    """Raised when no valid structured output could be produced"""
+
+
+class ParsedOutput(NamedTuple):
+    value: Optional[BaseModel]  # None when the output could not be used at all
+    dropped: List[Any]          # list items removed because they failed validation
+    repaired: bool              # JSON needed local repair before it parsed
+    error: Optional[str]
+
+
+def repair_json(text: str) -> str:
+    """
+    Fix common defects in model-produced JSON
+
+    Strips markdown fences and surrounding prose, normalises smart quotes,
+    removes trailing commas and closes output truncated by max_tokens
+    (dropping the incomplete trailing element).
+    """
+    text = re.sub(r"```(?:json)?", "", text)
+    text = text.replace("“", '"').replace("”", '"')
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return text.strip()
+    text = text[min(starts):]
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+
+    try:
+        json.loads(text, strict=False)
+        return text
+    except json.JSONDecodeError:
+        pass
+
+    # Cut back to the last complete object/array and close what is still open
+    stack = []
+    in_string = escaped = False
+    last_complete = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if not stack:
+                break
+            stack.pop()
+            last_complete = (i + 1, list(stack))
+            if not stack:
+                break
+    if last_complete is None:
+        return text
+    end, still_open = last_complete
+    return re.sub(r",\s*([}\]])", r"\1", text[:end] + "".join(reversed(still_open)))
+
+
+def _list_item_models(schema: Type[BaseModel]) -> Dict[str, Type[BaseModel]]:
+    """Fields of `schema` that are lists of models, mapped to the item model"""
+    fields = {}
+    for name, field in schema.model_fields.items():
+        args = get_args(field.annotation)
+        if get_origin(field.annotation) in (list, List) and args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            fields[field.alias or name] = args[0]
+    return fields
+
+
+def parse_structured(text: str, schema: Type[BaseModel]) -> ParsedOutput:
+    """
+    Parse model output into `schema`, salvaging what is valid
+
+    Items of list-of-model fields that fail validation are dropped instead of
+    failing the whole output.
+
+    Args:
+        text: Raw model output
+        schema: Pydantic model describing the expected JSON
+
+    Returns:
+        ParsedOutput
+    """
+    repaired = False
+    try:
+        data = json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_json(text), strict=False)
+            repaired = True
+        except json.JSONDecodeError as e:
+            return ParsedOutput(None, [], False, f"Invalid JSON: {e}")
+
+    if not isinstance(data, dict):
+        return ParsedOutput(None, [], repaired, f"Expected a JSON object, got {type(data).__name__}")
+
+    dropped = []
+    for field, item_model in _list_item_models(schema).items():
+        items = data.get(field)
+        if not isinstance(items, list):
+            continue
+        kept = []
+        for item in items:
+            try:
+                kept.append(item_model.model_validate(item).model_dump(by_alias=True))
+            except ValidationError:
+                dropped.append(item)
+        data[field] = kept
+
+    try:
+        return ParsedOutput(schema.model_validate(data), dropped, repaired, None)
+    except ValidationError as e:
+        return ParsedOutput(None, dropped, repaired, str(e))
+
+
+def build_repair_prompt(text: str, error: str, schema: Type[BaseModel]) -> str:
+    """Prompt asking the model to fix its own output (no source context needed)"""
+    return f"""The following output should be JSON matching this schema, but it is invalid.
+
+Schema:
+{json.dumps(schema.model_json_schema())}
+
+Error:
+{error[:500]}
+
+Output:
+{text}
+
+Return ONLY the corrected JSON, keeping all of the original content."""
+
+
+def build_topup_prompt(prompt: str, field: str, existing: List[Any], missing: int) -> str:
+    """Original prompt plus a request for only the items still missing"""
+    return f"""{prompt}
+
+You already produced these {field}:
+{json.dumps(existing)}
+
+Generate ONLY {missing} more {field}, different from the ones above, in the same JSON format."""
+
+
+class StructuredOutputStats:
+    """Output-token accounting per structured generation task
+
+    `wasted_tokens` counts output tokens that were thrown away: whole
+    responses that could not be used and items dropped by validation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict[str, float]] = {}
+
+    def record(
+        self,
+        task: str,
+        output_tokens: int = 0,
+        wasted_tokens: int = 0,
+        generations: int = 0,
+        local_repairs: int = 0,
+        retries: int = 0,
+        failures: int = 0
+    ) -> None:
+        with self._lock:
+            stats = self._tasks.setdefault(task, {
+                "generations": 0, "output_tokens": 0, "wasted_tokens": 0,
+                "local_repairs": 0, "retries": 0, "failures": 0
+            })
+            stats["generations"] += generations
+            stats["output_tokens"] += output_tokens
+            stats["wasted_tokens"] += wasted_tokens
+            stats["local_repairs"] += local_repairs
+            stats["retries"] += retries
+            stats["failures"] += failures
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and wasted-token rate per task"""
+        with self._lock:
+            return {
+                task: {
+                    **stats,
+                    "wasted_rate": stats["wasted_tokens"] / stats["output_tokens"] if stats["output_tokens"] else 0.0,
+                }
+                for task, stats in self._tasks.items()
+            }
+
+
+def item_tokens(items: List[Any]) -> int:
+    """Approximate output tokens spent on `items`"""
+    return sum(count_tokens(json.dumps(item)) for item in items)
+
+
+# Global instance
+structured_stats = StructuredOutputStats()
@@ -0,0 +1,739 @@
+"""
+Vector store backends behind ChromaService (chroma, numpy)
+"""
+import os
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Collections at or above this many vectors are searched with HNSW (numpy backend only)
+HNSW_THRESHOLD = int(os.getenv("CLARITY_HNSW_THRESHOLD", "20000"))
+
+# Quantised collections rerank this many candidates per requested result
+RERANK_FACTOR = int(os.getenv("CLARITY_RERANK_FACTOR", "4"))
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+
+
+class VectorStore(ABC):
+    """Abstract base class for vector storage backends
+
+    Query results use Chroma's nested layout (one list per query embedding)
+    so callers can switch backends without reshaping results.
+    """
+
+    @abstractmethod
+    def add(
+        self,
+        name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        collection_metadata: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Add vectors to a collection, creating it if needed"""
+        pass
+
+    @abstractmethod
+    def query(
+        self,
+        name: str,
+        query_embeddings: List[List[float]],
+        n_results: int = 4,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, List[List[Any]]]:
+        """Return the nearest neighbours of each query embedding"""
+        pass
+
+    @abstractmethod
+    def get(
+        self,
+        name: str,
+        where: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False,
+        limit: Optional[int] = None,
+        ids: Optional[List[str]] = None
+    ) -> Dict[str, List[Any]]:
+        """Return the records of a collection matching `where` and `ids` (at most `limit`, if given)"""
+        pass
+
+    @abstractmethod
+    def delete(self, name: str, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        """Delete records by id or metadata filter"""
+        pass
+
+    @abstractmethod
+    def count(self, name: str) -> int:
+        """Number of records in a collection (0 if missing)"""
+        pass
+
+    @abstractmethod
+    def has_collection(self, name: str) -> bool:
+        """Whether a collection exists"""
+        pass
+
+    @abstractmethod
+    def delete_collection(self, name: str) -> None:
+        """Delete a collection (raises if missing)"""
+        pass
+
+    @abstractmethod
+    def list_collections(self) -> List[str]:
+        """List collection names"""
+        pass
+
+
+class ChromaVectorStore(VectorStore):
+    """ChromaDB PersistentClient backend (default)"""
+
+    def __init__(self, persist_dir: str):
+        import chromadb
+        from chromadb.config import Settings
+
+        self.client = chromadb.PersistentClient(
+            path=persist_dir,
+            settings=Settings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+        )
+
+    def _get_or_create(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        try:
+            return self.client.get_collection(name=name)
+        except Exception:
+            logger.info(f"Created new collection: {name}")
+            return self.client.create_collection(name=name, metadata=metadata)
+
+    def add(self, name, ids, embeddings, documents, metadatas, collection_metadata=None):
+        collection = self._get_or_create(name, collection_metadata)
+        collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def query(self, name, query_embeddings, n_results=4, where=None):
+        collection = self.client.get_collection(name=name)
+        results = collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where
+        )
+        return {
+            "ids": results["ids"] or [],
+            "documents": results["documents"] or [],
+            "metadatas": results["metadatas"] or [],
+            "distances": results["distances"] or [],
+        }
+
+    def get(self, name, where=None, include_embeddings=False, limit=None, ids=None):
+        collection = self.client.get_collection(name=name)
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        results = collection.get(ids=ids, where=where, include=include, limit=limit)
+        # Recent Chroma versions return embeddings as a numpy array, which has no truth value
+        embeddings = results.get("embeddings")
+        return {
+            "ids": results["ids"] or [],
+            "documents": results["documents"] or [],
+            "metadatas": results["metadatas"] or [],
+            "embeddings": [] if embeddings is None else list(embeddings),
+        }
+
+    def delete(self, name, ids=None, where=None):
+        collection = self.client.get_collection(name=name)
+        collection.delete(ids=ids, where=where)
+
+    def count(self, name):
+        try:
+            return self.client.get_collection(name=name).count()
+        except Exception:
+            return 0
+
+    def has_collection(self, name):
+        try:
+            self.client.get_collection(name=name)
+            return True
+        except Exception:
+            return False
+
+    def delete_collection(self, name):
+        self.client.delete_collection(name=name)
+
+    def list_collections(self):
+        return [col.name for col in self.client.list_collections()]
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    """Evaluate one field condition of a Chroma `where` filter"""
+    if not isinstance(condition, dict):
+        return value == condition
+
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            ok = value == operand
+        elif operator == "$ne":
+            ok = value != operand
+        elif operator == "$in":
+            ok = value in operand
+        elif operator == "$nin":
+            ok = value not in operand
+        elif value is None:
+            ok = False
+        elif operator == "$gt":
+            ok = value > operand
+        elif operator == "$gte":
+            ok = value >= operand
+        elif operator == "$lt":
+            ok = value < operand
+        elif operator == "$lte":
+            ok = value <= operand
+        else:
+            raise ValueError(f"Unsupported where operator: {operator}")
+        if not ok:
+            return False
+    return True
+
+
+def matches_where(metadata: Optional[Dict[str, Any]], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluate a Chroma-style `where` filter against one metadata dict
+
+    Supports $and/$or and the $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin
+    field operators.
+    """
+    if not where:
+        return True
+    metadata = metadata or {}
+
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif not _match_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalise rows of a float32 matrix (zero rows stay zero)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def quantize(matrix: np.ndarray, quantization: str) -> Dict[str, np.ndarray]:
+    """
+    Quantise normalised float32 rows for storage
+
+    Args:
+        matrix: (n, dim) float32 matrix
+        quantization: "float16" or "int8" ("none" stores nothing extra)
+
+    Returns:
+        Dict of file name -> array to append to that file
+    """
+    if quantization == "float16":
+        return {"vectors.f16": matrix.astype(np.float16)}
+    if quantization == "int8":
+        # Symmetric per-vector scale so every row uses the full int8 range
+        scales = np.abs(matrix).max(axis=1, keepdims=True) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+        return {"vectors.i8": codes, "scales.f32": scales.astype(np.float32)}
+    return {}
+
+
+class _NumpyCollection:
+    """One collection: memory-mapped vector files plus JSON records
+
+    Unquantised collections keep a single float32 matrix (vectors.f32).
+    Quantised collections search a float16 (vectors.f16) or int8 matrix
+    with per-vector scales (vectors.i8 + scales.f32), and rerank the top
+    candidates exactly against vectors.f32 when keep_float32 is set.
+
+    Records are a snapshot (records.json) plus a log of the records added
+    since (one JSON line each), so an add costs its own records rather
+    than a rewrite of the whole collection. Deletes compact the log into a
+    new snapshot generation.
+    """
+
+    RECORDS_FILE = "records.json"
+    LOG_FILE = "records.{generation}.jsonl"
+    # Rows dequantised at a time during a quantised scan
+    BLOCK_ROWS = 512
+
+    def __init__(self, path: str, quantization: str = "none", keep_float32: bool = True):
+        self.path = path
+        self.dim = 0
+        self.quantization = quantization
+        self.keep_float32 = keep_float32 or quantization == "none"
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.metadata: Dict[str, Any] = {}
+        self.row_of: Dict[str, int] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.hnsw = None
+        # Snapshot generation; only the log of the current generation is read
+        self.generation = 0
+
+        records_path = os.path.join(path, self.RECORDS_FILE)
+        if os.path.exists(records_path):
+            with open(records_path) as f:
+                records = json.load(f)
+            self.dim = records["dim"]
+            self.quantization = records.get("quantization", "none")
+            self.keep_float32 = records.get("keep_float32", True)
+            self.ids = records["ids"]
+            self.documents = records["documents"]
+            self.metadatas = records["metadatas"]
+            self.metadata = records.get("metadata") or {}
+            self.generation = records.get("generation", 0)
+            self.row_of = {id_: i for i, id_ in enumerate(self.ids)}
+            self._read_log()
+            self._map_arrays()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        """Exact float32 vectors (None for quantised collections that dropped them)"""
+        return self.arrays.get("vectors.f32")
+
+    def _layout(self) -> Dict[str, Any]:
+        """File name -> (dtype, columns) for this collection's storage mode"""
+        layout = {}
+        if self.keep_float32:
+            layout["vectors.f32"] = (np.float32, self.dim)
+        if self.quantization == "float16":
+            layout["vectors.f16"] = (np.float16, self.dim)
+        elif self.quantization == "int8":
+            layout["vectors.i8"] = (np.int8, self.dim)
+            layout["scales.f32"] = (np.float32, 1)
+        return layout
+
+    def _map_arrays(self):
+        self.arrays = {}
+        for name, (dtype, cols) in self._layout().items():
+            if not self.ids:
+                self.arrays[name] = np.zeros((0, cols), dtype=dtype)
+                continue
+            # Records are written after vectors, so ignore any trailing partial append
+            self.arrays[name] = np.memmap(
+                os.path.join(self.path, name),
+                dtype=dtype,
+                mode="r",
+                shape=(len(self.ids), cols)
+            )
+
+    def _log_path(self) -> str:
+        return os.path.join(self.path, self.LOG_FILE.format(generation=self.generation))
+
+    def _read_log(self):
+        """Apply the records appended since the snapshot"""
+        log_path = self._log_path()
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, "rb") as f:
+            lines = f.read().split(b"\n")
+        good_bytes = 0
+        # The last element is empty unless an append was interrupted mid-line
+        for line in lines[:-1]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            good_bytes += len(line) + 1
+            if record["id"] in self.row_of:
+                continue
+            self.row_of[record["id"]] = len(self.ids)
+            self.ids.append(record["id"])
+            self.documents.append(record["document"])
+            self.metadatas.append(record["metadata"])
+        if good_bytes < sum(len(line) + 1 for line in lines) - 1:
+            # Drop the torn tail so the next append starts on a fresh line
+            with open(log_path, "r+b") as f:
+                f.truncate(good_bytes)
+
+    def _append_records(self, start: int):
+        """Append the records from row `start` on to the log"""
+        with open(self._log_path(), "a") as f:
+            f.write("".join(
+                json.dumps({"id": id_, "document": document, "metadata": metadata}) + "\n"
+                for id_, document, metadata in zip(self.ids[start:], self.documents[start:], self.metadatas[start:])
+            ))
+
+    def _write_records(self):
+        """Write every record to a new snapshot generation and drop the old log"""
+        old_log = self._log_path()
+        self.generation += 1
+        tmp_path = os.path.join(self.path, self.RECORDS_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "dim": self.dim,
+                "quantization": self.quantization,
+                "keep_float32": self.keep_float32,
+                "generation": self.generation,
+                "ids": self.ids,
+                "documents": self.documents,
+                "metadatas": self.metadatas,
+                "metadata": self.metadata,
+            }, f)
+        os.replace(tmp_path, os.path.join(self.path, self.RECORDS_FILE))
+        if os.path.exists(old_log):
+            os.remove(old_log)
+
+    def _encode(self, matrix: np.ndarray) -> Dict[str, np.ndarray]:
+        encoded = quantize(matrix, self.quantization)
+        if self.keep_float32:
+            encoded["vectors.f32"] = matrix
+        return encoded
+
+    def add(self, ids, embeddings, documents, metadatas):
+        new_rows = [i for i, id_ in enumerate(ids) if id_ not in self.row_of]
+        if len(new_rows) < len(ids):
+            logger.warning(f"Skipping {len(ids) - len(new_rows)} existing ids in {os.path.basename(self.path)}")
+        if not new_rows:
+            return
+
+        matrix = normalize_rows(np.asarray([embeddings[i] for i in new_rows], dtype=np.float32))
+        if not self.dim:
+            self.dim = matrix.shape[1]
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match collection dimension {self.dim}")
+
+        os.makedirs(self.path, exist_ok=True)
+        start = len(self.ids)
+        for name, array in self._encode(matrix).items():
+            with open(os.path.join(self.path, name), "r+b" if start else "wb") as f:
+                f.seek(start * array.shape[1] * array.itemsize)
+                f.write(np.ascontiguousarray(array).tobytes())
+                f.truncate()
+
+        for i in new_rows:
+            self.row_of[ids[i]] = len(self.ids)
+            self.ids.append(ids[i])
+            self.documents.append(documents[i])
+            self.metadatas.append(metadatas[i] if metadatas else {})
+        if start:
+            self._append_records(start)
+        else:
+            # First records: the snapshot also carries dim, quantisation and collection metadata
+            self._write_records()
+        self._map_arrays()
+
+        if self.hnsw is not None:
+            self.hnsw.resize_index(len(self.ids))
+            self.hnsw.add_items(matrix, np.arange(start, len(self.ids)))
+
+    def delete(self, rows: List[int]):
+        if not rows:
+            return
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[rows] = False
+
+        kept_arrays = {name: np.asarray(array[keep]) for name, array in self.arrays.items()}
+        # Drop the old maps before replacing the files they point at
+        self.arrays = {}
+        for name, kept in kept_arrays.items():
+            tmp_path = os.path.join(self.path, name + ".tmp")
+            kept.tofile(tmp_path)
+            os.replace(tmp_path, os.path.join(self.path, name))
+
+        self.ids = [id_ for id_, k in zip(self.ids, keep) if k]
+        self.documents = [d for d, k in zip(self.documents, keep) if k]
+        self.metadatas = [m for m, k in zip(self.metadatas, keep) if k]
+        self.row_of = {id_: i for i, id_ in enumerate(self.ids)}
+        self.hnsw = None
+        self._write_records()
+        self._map_arrays()
+
+    def rows_matching(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Row indices matching `where` (None means all rows)"""
+        if not where:
+            return None
+        return np.asarray(
+            [i for i, metadata in enumerate(self.metadatas) if matches_where(metadata, where)],
+            dtype=np.int64
+        )
+
+    def exact_vectors(self, rows) -> np.ndarray:
+        """float32 vectors for `rows` (dequantised if the originals were dropped)"""
+        if self.vectors is not None:
+            return np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.quantization == "float16":
+            return np.asarray(self.arrays["vectors.f16"][rows], dtype=np.float32)
+        codes = np.asarray(self.arrays["vectors.i8"][rows], dtype=np.float32)
+        return codes * np.asarray(self.arrays["scales.f32"][rows])
+
+    def _quantized_scores(self, queries: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Approximate scores computed block by block from the quantised matrix"""
+        total = len(self.ids) if rows is None else len(rows)
+        scores = np.empty((len(queries), total), dtype=np.float32)
+        codes = self.arrays["vectors.f16" if self.quantization == "float16" else "vectors.i8"]
+        # Small cache-resident block reused for every dequantisation
+        buffer = np.empty((min(self.BLOCK_ROWS, total), self.dim), dtype=np.float32)
+
+        for start in range(0, total, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, total)
+            block_rows = slice(start, end) if rows is None else rows[start:end]
+            block = buffer[:end - start]
+            block[...] = codes[block_rows]
+            scores[:, start:end] = queries @ block.T
+            if self.quantization == "int8":
+                scores[:, start:end] *= self.arrays["scales.f32"][block_rows, 0]
+        return scores
+
+    def _get_hnsw(self):
+        if self.hnsw is None:
+            import hnswlib
+
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(max_elements=len(self.ids), ef_construction=200, M=16)
+            index.add_items(np.asarray(self.vectors), np.arange(len(self.ids)))
+            self.hnsw = index
+            logger.info(f"Built HNSW index over {len(self.ids)} vectors in {os.path.basename(self.path)}")
+        return self.hnsw
+
+    def search(self, queries: np.ndarray, n_results: int, rows: Optional[np.ndarray]):
+        """Top-k rows and cosine distances for each query"""
+        candidates = len(self.ids) if rows is None else len(rows)
+        k = min(n_results, candidates)
+        if k == 0:
+            return [np.zeros(0, dtype=np.int64)] * len(queries), [np.zeros(0, dtype=np.float32)] * len(queries)
+
+        if self.quantization != "none":
+            return self._search_quantized(queries, k, rows)
+
+        if rows is None and len(self.ids) >= HNSW_THRESHOLD and _hnswlib_available():
+            index = self._get_hnsw()
+            index.set_ef(max(64, 2 * k))
+            labels, distances = index.knn_query(queries, k=k)
+            # hnswlib's "ip" space already reports 1 - dot
+            return list(labels.astype(np.int64)), list(distances)
+
+        # Exact search: one matrix product over the (pre-filtered) candidates
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        scores = queries @ np.asarray(matrix).T
+        top_rows, top_distances = [], []
+        for query_scores in scores:
+            top = _top_k(query_scores, k)
+            top_rows.append(top if rows is None else rows[top])
+            top_distances.append(1.0 - query_scores[top])
+        return top_rows, top_distances
+
+    def _search_quantized(self, queries: np.ndarray, k: int, rows: Optional[np.ndarray]):
+        """Scan the quantised matrix, then rerank the best candidates exactly"""
+        scores = self._quantized_scores(queries, rows)
+        shortlist = min(scores.shape[1], k * RERANK_FACTOR)
+
+        top_rows, top_distances = [], []
+        for query, query_scores in zip(queries, scores):
+            candidates = _top_k(query_scores, shortlist)
+            if rows is not None:
+                candidates = rows[candidates]
+            # Sorted row order keeps memory-mapped reads sequential
+            candidates = np.sort(candidates)
+            exact = self.exact_vectors(candidates) @ query
+            best = _top_k(exact, k)
+            top_rows.append(candidates[best])
+            top_distances.append(1.0 - exact[best])
+        return top_rows, top_distances
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+def _hnswlib_available() -> bool:
+    try:
+        import hnswlib  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class NumpyVectorStore(VectorStore):
+    """In-process backend: normalised float32 matrices in memory-mapped files
+
+    Each collection lives in <base_dir>/<name>/ as a raw float32 matrix
+    (vectors.f32) and a JSON file with ids, documents and metadatas.
+    Queries are exact dot-product top-k; collections with at least
+    CLARITY_HNSW_THRESHOLD vectors use an in-memory HNSW index instead
+    (when hnswlib is installed). Distances are cosine distances.
+
+    New collections can instead be stored quantised (float16, or int8 with
+    per-vector scales); they are scanned quantised and the top candidates
+    reranked exactly. Existing collections keep the mode they were created
+    with (see scripts/migrate_vector_quantization.py).
+    """
+
+    def __init__(self, base_dir: str, quantization: Optional[str] = None, keep_float32: Optional[bool] = None):
+        if quantization is None:
+            quantization = os.getenv("CLARITY_VECTOR_QUANTIZATION", "none").lower()
+        if keep_float32 is None:
+            keep_float32 = os.getenv("CLARITY_VECTOR_KEEP_FLOAT32", "true").lower() == "true"
+        if quantization not in QUANTIZATION_MODES:
+            logger.warning(f"Unknown vector quantization: {quantization}, using none")
+            quantization = "none"
+
+        self.base_dir = base_dir
+        self.quantization = quantization
+        self.keep_float32 = keep_float32
+        os.makedirs(base_dir, exist_ok=True)
+        self._collections: Dict[str, _NumpyCollection] = {}
+        self._lock = threading.RLock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.base_dir, name)
+
+    def _load(self, name: str, create: bool = False) -> _NumpyCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            path = self._path(name)
+            if not create and not os.path.isdir(path):
+                raise ValueError(f"Collection {name} does not exist.")
+            collection = _NumpyCollection(path, self.quantization, self.keep_float32)
+            self._collections[name] = collection
+        return collection
+
+    def add(self, name, ids, embeddings, documents, metadatas, collection_metadata=None):
+        with self._lock:
+            collection = self._load(name, create=True)
+            if not len(collection) and collection_metadata:
+                collection.metadata = collection_metadata
+            collection.add(ids, embeddings, documents, metadatas)
+
+    def query(self, name, query_embeddings, n_results=4, where=None):
+        with self._lock:
+            collection = self._load(name)
+            queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+            rows, distances = collection.search(queries, n_results, collection.rows_matching(where))
+            return {
+                "ids": [[collection.ids[r] for r in q] for q in rows],
+                "documents": [[collection.documents[r] for r in q] for q in rows],
+                "metadatas": [[collection.metadatas[r] for r in q] for q in rows],
+                "distances": [[float(d) for d in q] for q in distances],
+            }
+
+    def get(self, name, where=None, include_embeddings=False, limit=None, ids=None):
+        with self._lock:
+            collection = self._load(name)
+            rows = collection.rows_matching(where)
+            if rows is None:
+                rows = np.arange(len(collection))
+            if ids is not None:
+                wanted = {collection.row_of[id_] for id_ in ids if id_ in collection.row_of}
+                rows = rows[np.isin(rows, list(wanted))]
+            if limit is not None:
+                rows = rows[:limit]
+            return {
+                "ids": [collection.ids[r] for r in rows],
+                "documents": [collection.documents[r] for r in rows],
+                "metadatas": [collection.metadatas[r] for r in rows],
+                "embeddings": collection.exact_vectors(rows).tolist() if include_embeddings else [],
+            }
+
+    def delete(self, name, ids=None, where=None):
+        with self._lock:
+            collection = self._load(name)
+            rows = set()
+            if ids is not None:
+                rows.update(collection.row_of[id_] for id_ in ids if id_ in collection.row_of)
+            if where:
+                rows.update(collection.rows_matching(where).tolist())
+            collection.delete(sorted(rows))
+
+    def count(self, name):
+        with self._lock:
+            try:
+                return len(self._load(name))
+            except ValueError:
+                return 0
+
+    def has_collection(self, name):
+        return name in self._collections or os.path.isdir(self._path(name))
+
+    def delete_collection(self, name):
+        import shutil
+
+        with self._lock:
+            if not self.has_collection(name):
+                raise ValueError(f"Collection {name} does not exist.")
+            self._collections.pop(name, None)
+            shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def list_collections(self):
+        return sorted(
+            entry for entry in os.listdir(self.base_dir)
+            if os.path.isdir(self._path(entry))
+        )
+
+
+def copy_collection(source: VectorStore, target: VectorStore, name: str, batch_size: int = 1000) -> int:
+    """
+    Copy one collection between stores, replacing it in the target
+
+    The source collection is read fully before the target is touched, so
+    source and target may be the same store (re-encoding in place).
+
+    Returns:
+        Number of records copied
+    """
+    records = source.get(name, include_embeddings=True)
+    collection_metadata = None
+    if isinstance(source, NumpyVectorStore):
+        collection_metadata = source._load(name).metadata or None
+
+    if target.has_collection(name):
+        target.delete_collection(name)
+
+    for start in range(0, len(records["ids"]), batch_size):
+        end = start + batch_size
+        target.add(
+            name,
+            ids=records["ids"][start:end],
+            embeddings=records["embeddings"][start:end],
+            documents=records["documents"][start:end],
+            metadatas=records["metadatas"][start:end],
+            collection_metadata=collection_metadata
+        )
+    return len(records["ids"])
+
+
+def create_vector_store(backend: str, base_dir: str) -> VectorStore:
+    """
+    Create a vector store backend
+
+    Args:
+        backend: "chroma" or "numpy" (CLARITY_VECTOR_BACKEND)
+        base_dir: Clarity base directory (~/.clarity)
+
+    Returns:
+        VectorStore instance
+    """
+    backend = backend.lower()
+    if backend == "numpy":
+        store_dir = os.path.join(base_dir, "vectors")
+        logger.info(f"Initializing numpy vector store at: {store_dir}")
+        return NumpyVectorStore(store_dir)
+
+    if backend != "chroma":
+        logger.warning(f"Unknown vector backend: {backend}, using chroma")
+    chroma_dir = os.path.join(base_dir, "chroma")
+    os.makedirs(chroma_dir, exist_ok=True)
+    logger.info(f"Initializing ChromaDB at: {chroma_dir}")
+    return ChromaVectorStore(chroma_dir)
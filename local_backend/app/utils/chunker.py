@@ -51,6 +51,25 @@ def split_into_sentences(text: str) -> List[str]:
     return [s.strip() for s in sentences if s.strip()]
 
 
+def join_pages(pages: List[str]) -> Tuple[str, List[int]]:
+    """
+    Join page texts into one document and record where each page starts
+    
+    Args:
+        pages: List of page texts (e.g. from pdf_parser.extract_pages_from_file)
+        
+    Returns:
+        Tuple of (joined text, character offset at which each page starts)
+    """
+    page_offsets = []
+    offset = 0
+    for page in pages:
+        page_offsets.append(offset)
+        offset += len(page) + 2  # "\n\n" separator
+    
+    return "\n\n".join(pages), page_offsets
+
+
 def chunk_text(
     text: str,
     chunk_size: int = None,
@@ -0,0 +1,80 @@
+"""
+Token-budgeted context packing for LLM prompts
+"""
+import os
+import re
+from typing import List, Optional
+import logging
+
+from .chunker import count_tokens, split_into_sentences
+
+logger = logging.getLogger(__name__)
+
+# Total prompt size (template + question + context) in tokens
+PROMPT_TOKEN_BUDGET = int(os.getenv("CLARITY_PROMPT_TOKEN_BUDGET", "3000"))
+
+# Don't add a trimmed chunk unless this many tokens of it fit
+MIN_TRIMMED_TOKENS = int(os.getenv("CLARITY_MIN_TRIMMED_TOKENS", "32"))
+
+
+def _sentence_key(sentence: str) -> str:
+    return re.sub(r"\s+", " ", sentence).strip().lower()
+
+
+def pack_context(
+    chunks: List[str],
+    budget: int,
+    token_counts: Optional[List[Optional[int]]] = None,
+    overhead_tokens: int = 0
+) -> List[str]:
+    """
+    Select chunks for a prompt without exceeding a token budget
+
+    Chunks are taken in the given (relevance) order. Sentences already
+    included by an earlier chunk are dropped, which removes the overlap the
+    chunker adds between neighbouring chunks. The first chunk that no longer
+    fits is trimmed at a sentence boundary and packing stops there.
+
+    Args:
+        chunks: Chunk texts, most relevant first
+        budget: Tokens available for context
+        token_counts: Precomputed token count per chunk (from ingest metadata)
+        overhead_tokens: Tokens each chunk costs in the prompt besides its text
+
+    Returns:
+        Packed chunk texts, most relevant first
+    """
+    packed = []
+    seen = set()
+    used = 0
+
+    for i, chunk in enumerate(chunks):
+        sentences = split_into_sentences(chunk)
+        fresh = [s for s in sentences if _sentence_key(s) not in seen]
+        if not fresh:
+            continue
+
+        if len(fresh) == len(sentences) and token_counts and token_counts[i] is not None:
+            text, tokens = chunk, token_counts[i]
+        else:
+            text = " ".join(fresh)
+            tokens = count_tokens(text)
+
+        remaining = budget - used - overhead_tokens
+        if tokens > remaining:
+            kept = []
+            for sentence in fresh:
+                if count_tokens(" ".join(kept + [sentence])) > remaining:
+                    break
+                kept.append(sentence)
+            if kept and count_tokens(" ".join(kept)) >= min(MIN_TRIMMED_TOKENS, remaining):
+                packed.append(" ".join(kept))
+            break
+
+        packed.append(text)
+        used += tokens + overhead_tokens
+        seen.update(_sentence_key(s) for s in fresh)
+
+    if len(packed) < len(chunks):
+        logger.debug(f"Packed {len(packed)}/{len(chunks)} chunks into {budget} tokens")
+    return packed
@@ -0,0 +1,134 @@
+"""
+Request deadlines shared by every stage of a request (embedding, retrieval, generation)
+"""
+import os
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# End-to-end budgets (seconds) for interactive answers and for long generations (quiz, mind map, flashcards)
+ASK_DEADLINE_SECONDS = float(os.getenv("CLARITY_ASK_DEADLINE", "60"))
+GENERATION_DEADLINE_SECONDS = float(os.getenv("CLARITY_GENERATION_DEADLINE", "240"))
+
+# Output tokens per second assumed until the LLM metrics have measured the model
+DEFAULT_TOKENS_PER_SECOND = float(os.getenv("CLARITY_LLM_TOKENS_PER_SECOND", "20"))
+# Share of the remaining budget generation may plan to use (the rest covers prompt processing)
+GENERATION_BUDGET_SHARE = 0.8
+# Don't start a generation that could not produce at least this many tokens
+MIN_OUTPUT_TOKENS = 32
+
+_current: ContextVar[Optional["Deadline"]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's time budget has run out"""
+
+
+class Deadline:
+    """Absolute end time for a request"""
+
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """
+    Run the enclosed request stages under a `seconds` budget
+
+    An enclosing deadline that ends sooner wins. None means no deadline.
+    """
+    if seconds is None:
+        yield current_deadline()
+        return
+    outer = _current.get()
+    scope = Deadline(seconds)
+    if outer is not None and outer.expires_at < scope.expires_at:
+        scope = outer
+    token = _current.set(scope)
+    try:
+        yield scope
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request (None without a deadline)"""
+    scope = _current.get()
+    return scope.remaining() if scope is not None else None
+
+
+def check_deadline(stage: str) -> None:
+    """Raise DeadlineExceeded if the budget is already spent before `stage` starts"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Request deadline exceeded before {stage}")
+
+
+def stage_timeout(default: float, stage: str) -> float:
+    """
+    Timeout for one stage: its own default, shrunk to the remaining budget
+
+    Raises:
+        DeadlineExceeded: If no budget is left
+    """
+    check_deadline(stage)
+    left = remaining()
+    return default if left is None else min(default, left)
+
+
+def fit_max_tokens(max_tokens: int, tokens_per_second: Optional[float] = None) -> int:
+    """
+    Cap `max_tokens` to what the model can generate in the remaining budget
+
+    Args:
+        max_tokens: Tokens the caller asked for
+        tokens_per_second: Measured generation speed (DEFAULT_TOKENS_PER_SECOND if unknown)
+
+    Raises:
+        DeadlineExceeded: If fewer than MIN_OUTPUT_TOKENS would fit
+    """
+    left = remaining()
+    if left is None:
+        return max_tokens
+    fitted = int(left * GENERATION_BUDGET_SHARE * (tokens_per_second or DEFAULT_TOKENS_PER_SECOND))
+    if fitted < min(max_tokens, MIN_OUTPUT_TOKENS):
+        raise DeadlineExceeded(f"Only {left:.1f}s left, too little to generate")
+    if fitted < max_tokens:
+        logger.info(f"Capping generation at {fitted} tokens to fit the {left:.1f}s left")
+    return min(max_tokens, fitted)
+
+
+async def within_deadline(work: Awaitable[T], stage: str) -> T:
+    """
+    Await `work`, giving up (and cancelling it) when the budget runs out
+
+    Raises:
+        DeadlineExceeded: If the deadline passes first
+    """
+    left = remaining()
+    if left is None:
+        return await work
+    if left <= 0:
+        if asyncio.iscoroutine(work):
+            work.close()
+        raise DeadlineExceeded(f"Request deadline exceeded before {stage}")
+    try:
+        return await asyncio.wait_for(work, timeout=left)
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded(f"Request deadline exceeded during {stage}") from e
@@ -0,0 +1,63 @@
+"""
+Cancel long-running request work when the client disconnects
+"""
+import os
+import asyncio
+from typing import Awaitable, TypeVar
+import logging
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How often to check whether the client is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("CLARITY_DISCONNECT_POLL_SECONDS", "0.5"))
+
+# Non-standard status (nginx convention) for requests the client abandoned
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(HTTPException):
+    """Raised when the client went away before the work finished"""
+
+    def __init__(self):
+        super().__init__(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T], label: str = "request") -> T:
+    """
+    Await `work`, cancelling it if the client disconnects first
+
+    Cancellation propagates into the LLM call: queued calls leave the
+    scheduler queue and in-flight generations close their stream to
+    Ollama, which stops generating.
+
+    Args:
+        request: Incoming request (used to detect the disconnect)
+        work: Coroutine doing the request's work
+        label: What is being done, for the log
+
+    Raises:
+        ClientDisconnected: If the client disconnected before `work` finished
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    logger.info(f"Client disconnected, cancelling {label}")
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+    raise ClientDisconnected()
@@ -0,0 +1,82 @@
+"""
+Graph index for mind maps: node positions, adjacency lists and degrees
+
+Stored alongside a mind map's nodes and edges so one node or a subtree can
+be located without reading (or scanning) the full node list.
+"""
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def degree_counts(edges: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Edges touching each node, in one pass over the edges"""
+    degree: Dict[str, int] = {}
+    for edge in edges:
+        for node_id in (edge["from"], edge["to"]):
+            degree[node_id] = degree.get(node_id, 0) + 1
+    return degree
+
+
+def build_index(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Index a mind map's nodes and edges
+
+    Returns:
+        {
+            "positions": node ID -> index in `nodes`,
+            "children": node ID -> [[child ID, index of the edge in `edges`], ...],
+            "parents": node ID -> [parent IDs],
+            "degree": node ID -> number of edges touching it,
+        }
+    """
+    positions = {node["id"]: i for i, node in enumerate(nodes)}
+    children: Dict[str, List[List[Any]]] = {}
+    parents: Dict[str, List[str]] = {}
+    for i, edge in enumerate(edges):
+        source, target = edge["from"], edge["to"]
+        if source not in positions or target not in positions:
+            continue
+        children.setdefault(source, []).append([target, i])
+        parents.setdefault(target, []).append(source)
+    return {
+        "positions": positions,
+        "children": children,
+        "parents": parents,
+        "degree": degree_counts(edges),
+    }
+
+
+def subtree(index: Dict[str, Any], root_id: str, max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> Tuple[List[int], List[int]]:
+    """
+    Breadth-first walk down from `root_id`
+
+    Args:
+        index: Graph index from build_index()
+        root_id: ID of the subtree's root node
+        max_depth: Levels below the root to include (all if None)
+        max_nodes: Stop once this many nodes are included
+
+    Returns:
+        (node positions, edge positions) in visiting order; both empty if the root is unknown
+    """
+    positions = index["positions"]
+    if root_id not in positions:
+        return [], []
+    node_positions = [positions[root_id]]
+    edge_positions: List[int] = []
+    seen = {root_id}
+    queue = deque([(root_id, 0)])
+    while queue:
+        node_id, depth = queue.popleft()
+        if max_depth is not None and depth >= max_depth:
+            continue
+        for child_id, edge_position in index["children"].get(node_id, []):
+            if child_id in seen:
+                continue
+            if max_nodes is not None and len(node_positions) >= max_nodes:
+                return node_positions, edge_positions
+            seen.add(child_id)
+            node_positions.append(positions[child_id])
+            edge_positions.append(edge_position)
+            queue.append((child_id, depth + 1))
+    return node_positions, edge_positions
@@ -2,7 +2,7 @@
 PDF parsing utility
 """
 import io
-from typing import Optional
+from typing import List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,15 +23,15 @@ except ImportError:
         logger.error("No PDF library available! Install pdfplumber or PyPDF2")
 
 
-def extract_text_from_pdf(file_content: bytes) -> Optional[str]:
+def extract_pages_from_pdf(file_content: bytes) -> Optional[List[str]]:
     """
-    Extract text from PDF file
+    Extract text from PDF file, one string per page
     
     Args:
         file_content: PDF file as bytes
         
     Returns:
-        Extracted text or None if failed
+        List of page texts (empty pages included) or None if failed
     """
     if PDF_LIBRARY is None:
         logger.error("No PDF library available")
@@ -40,30 +40,33 @@ def extract_text_from_pdf(file_content: bytes) -> Optional[str]:
     try:
         if PDF_LIBRARY == "pdfplumber":
             with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                text_parts = []
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        text_parts.append(text)
-                
-                return "\n\n".join(text_parts)
+                return [page.extract_text() or "" for page in pdf.pages]
         
         elif PDF_LIBRARY == "pypdf2":
             pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            text_parts = []
-            
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
-            
-            return "\n\n".join(text_parts)
+            return [page.extract_text() or "" for page in pdf_reader.pages]
     
     except Exception as e:
         logger.error(f"Failed to extract PDF text: {e}")
         return None
 
 
+def extract_text_from_pdf(file_content: bytes) -> Optional[str]:
+    """
+    Extract text from PDF file
+    
+    Args:
+        file_content: PDF file as bytes
+        
+    Returns:
+        Extracted text or None if failed
+    """
+    pages = extract_pages_from_pdf(file_content)
+    if pages is None:
+        return None
+    return "\n\n".join(page for page in pages if page)
+
+
 def extract_text_from_file(filename: str, content: bytes) -> Optional[str]:
     """
     Extract text from various file formats
@@ -93,3 +96,25 @@ def extract_text_from_file(filename: str, content: bytes) -> Optional[str]:
     else:
         logger.warning(f"Unsupported file format: {ext}")
         return None
+
+
+def extract_pages_from_file(filename: str, content: bytes) -> Optional[List[str]]:
+    """
+    Extract text from various file formats, one string per page
+    
+    Plain-text formats have no pages and are returned as a single page.
+    
+    Args:
+        filename: Original filename
+        content: File content as bytes
+        
+    Returns:
+        List of page texts or None if failed
+    """
+    ext = filename.lower().split('.')[-1]
+    
+    if ext == 'pdf':
+        return extract_pages_from_pdf(content)
+    
+    text = extract_text_from_file(filename, content)
+    return [text] if text is not None else None
@@ -0,0 +1,96 @@
+"""
+Benchmark scoped (metadata pre-filtered) retrieval against whole-notebook retrieval
+
+Builds a throwaway notebook collection with synthetic embeddings and compares
+query latency with and without a `where` filter on document_id / source / page.
+
+Usage:
+    python -m scripts.benchmark_scoped_retrieval --documents 500 --chunks-per-doc 8
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+import logging
+
+from app.services.chroma_service import ChromaService, build_chunk_metadatas, build_scope_filter
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def random_vector(dim: int):
+    return [random.gauss(0.0, 1.0) for _ in range(dim)]
+
+
+def time_queries(service, collection_id, queries, top_k, where=None):
+    """Run each query once and return per-query latencies in milliseconds"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        service.query(collection_id, query, top_k=top_k, filter_metadata=where)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<28} mean={statistics.mean(latencies):7.2f} ms  p50={statistics.median(latencies):7.2f} ms  p95={p95:7.2f} ms")
+
+
+def run_benchmark(num_documents: int, chunks_per_doc: int, dim: int, num_queries: int, top_k: int):
+    with tempfile.TemporaryDirectory() as base_dir:
+        service = ChromaService(base_dir=base_dir)
+        collection_id = service.get_notebook_collection_id("bench|user", "bench-notebook")
+
+        document_ids = [f"doc-{i}" for i in range(num_documents)]
+        ingest_start = time.perf_counter()
+        for document_id in document_ids:
+            chunks = [(f"{document_id} chunk {j}", j * 2000, (j + 1) * 2000) for j in range(chunks_per_doc)]
+            # ~2 chunks per page
+            page_offsets = [p * 4000 for p in range((chunks_per_doc + 1) // 2)]
+            service.add_documents(
+                user_id=collection_id,
+                documents=[c[0] for c in chunks],
+                metadatas=build_chunk_metadatas(
+                    document_id=document_id,
+                    source=f"{document_id}.pdf",
+                    chunks=chunks,
+                    page_offsets=page_offsets,
+                    notebook_id="bench-notebook"
+                ),
+                embeddings=[random_vector(dim) for _ in chunks],
+                ids=[f"{document_id}_{j}" for j in range(chunks_per_doc)]
+            )
+        ingest_seconds = time.perf_counter() - ingest_start
+
+        total_chunks = num_documents * chunks_per_doc
+        print(f"Ingested {num_documents} documents / {total_chunks} chunks in {ingest_seconds:.1f}s")
+
+        queries = [random_vector(dim) for _ in range(num_queries)]
+        scopes = {
+            "whole notebook": None,
+            "1 document": build_scope_filter(document_ids=document_ids[:1]),
+            "10 documents": build_scope_filter(document_ids=document_ids[:10]),
+            "1 source, pages 1-2": build_scope_filter(sources=[f"{document_ids[0]}.pdf"], page_start=1, page_end=2),
+        }
+
+        # Warm up the HNSW index and SQLite page cache
+        time_queries(service, collection_id, queries[:5], top_k)
+
+        for label, where in scopes.items():
+            summarize(label, time_queries(service, collection_id, queries, top_k, where))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--chunks-per-doc", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+
+    run_benchmark(args.documents, args.chunks_per_doc, args.dim, args.queries, args.top_k)
@@ -0,0 +1,86 @@
+"""
+Benchmark the chroma and numpy vector store backends on ingest and query
+
+Each backend ingests the same synthetic notebook (in document-sized batches,
+as the upload endpoint does) and then answers the same queries.
+
+Usage:
+    python -m scripts.benchmark_vector_backends --chunks 2000 4000 --dim 768
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import logging
+
+import numpy as np
+
+from app.services import vector_store
+from app.services.chroma_service import ChromaService
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def run_backend(backend: str, vectors: np.ndarray, queries: np.ndarray, batch_size: int, top_k: int):
+    with tempfile.TemporaryDirectory() as base_dir:
+        service = ChromaService(base_dir=base_dir, backend=backend)
+        collection_id = service.get_notebook_collection_id("bench|user", "bench-notebook")
+
+        start = time.perf_counter()
+        for offset in range(0, len(vectors), batch_size):
+            batch = vectors[offset:offset + batch_size]
+            service.add_documents(
+                user_id=collection_id,
+                documents=[f"chunk {offset + i}" for i in range(len(batch))],
+                metadatas=[{"document_id": f"doc-{offset // batch_size}", "chunk_index": i} for i in range(len(batch))],
+                embeddings=batch.tolist(),
+                ids=[f"c{offset + i}" for i in range(len(batch))]
+            )
+        ingest_seconds = time.perf_counter() - start
+
+        # First query pays index load/build; report it separately
+        start = time.perf_counter()
+        service.query(collection_id, queries[0].tolist(), top_k=top_k)
+        first_ms = (time.perf_counter() - start) * 1000
+
+        latencies = []
+        for query in queries[1:]:
+            start = time.perf_counter()
+            service.query(collection_id, query.tolist(), top_k=top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    return {
+        "ingest_s": ingest_seconds,
+        "first_ms": first_ms,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch-size", type=int, default=20, help="Chunks per ingest call (one document)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--hnsw-threshold", type=int, default=None, help="Override CLARITY_HNSW_THRESHOLD")
+    args = parser.parse_args()
+
+    if args.hnsw_threshold is not None:
+        vector_store.HNSW_THRESHOLD = args.hnsw_threshold
+
+    rng = np.random.default_rng(0)
+    print(f"{'backend':<8} {'chunks':>7} {'ingest s':>9} {'first ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for num_chunks in args.chunks:
+        vectors = rng.normal(size=(num_chunks, args.dim)).astype(np.float32)
+        queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+        for backend in ("chroma", "numpy"):
+            r = run_backend(backend, vectors, queries, args.batch_size, args.top_k)
+            print(f"{backend:<8} {num_chunks:>7} {r['ingest_s']:>9.2f} {r['first_ms']:>9.2f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
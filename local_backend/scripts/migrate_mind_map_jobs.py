@@ -0,0 +1,42 @@
+"""
+Add the background-generation and graph index columns to an existing mind_maps table
+
+create_all() does not alter existing tables, so older databases need
+status, progress, error and graph added. Existing maps are marked ready;
+their graph index is built the first time one of their nodes is looked up.
+
+Usage:
+    python -m scripts.migrate_mind_map_jobs
+"""
+from sqlalchemy import text
+
+from app.db import engine
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    "ALTER TABLE mind_maps ADD COLUMN IF NOT EXISTS status VARCHAR DEFAULT 'ready'",
+    "ALTER TABLE mind_maps ADD COLUMN IF NOT EXISTS progress JSON",
+    "ALTER TABLE mind_maps ADD COLUMN IF NOT EXISTS error TEXT",
+    "ALTER TABLE mind_maps ADD COLUMN IF NOT EXISTS graph JSON",
+]
+
+
+def migrate_mind_map_jobs():
+    """Add the status, progress, error and graph columns"""
+    try:
+        with engine.begin() as connection:
+            for statement in COLUMNS:
+                connection.execute(text(statement))
+            connection.execute(text("UPDATE mind_maps SET status = 'ready' WHERE status IS NULL"))
+        logger.info("✅ Mind map columns added")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Failed to migrate mind_maps: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    migrate_mind_map_jobs()
@@ -0,0 +1,64 @@
+"""
+Migrate vector collections into the numpy backend, optionally quantised
+
+Copies collections from the chroma backend (or re-encodes existing numpy
+collections in place) using the requested storage mode. Switch the server
+over afterwards with CLARITY_VECTOR_BACKEND=numpy.
+
+Usage:
+    python -m scripts.migrate_vector_quantization --from chroma --quantization int8
+    python -m scripts.migrate_vector_quantization --from numpy --quantization float16 --drop-float32
+"""
+import argparse
+import os
+import logging
+
+from app.services.vector_store import (
+    QUANTIZATION_MODES,
+    NumpyVectorStore,
+    copy_collection,
+    create_vector_store,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def migrate(source_backend: str, quantization: str, keep_float32: bool, collections=None, dry_run: bool = False):
+    base_dir = os.path.expanduser(os.getenv("CLARITY_BASE_DIR", "~/.clarity"))
+    source = create_vector_store(source_backend, base_dir)
+    target = NumpyVectorStore(os.path.join(base_dir, "vectors"), quantization=quantization, keep_float32=keep_float32)
+
+    names = collections or source.list_collections()
+    logger.info(f"Migrating {len(names)} collections from {source_backend} to numpy ({quantization}, keep_float32={keep_float32})")
+
+    for name in names:
+        count = source.count(name)
+        if dry_run:
+            logger.info(f"[dry run] {name}: {count} records")
+            continue
+        copied = copy_collection(source, target, name)
+        size_kb = directory_size(os.path.join(target.base_dir, name)) / 1024
+        logger.info(f"✅ {name}: {copied} records, {size_kb:.0f} KB on disk")
+
+    if source_backend == "chroma" and not dry_run:
+        logger.info("Chroma data was left in place; remove ~/.clarity/chroma once the numpy backend is verified")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--from", dest="source", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES, default="int8")
+    parser.add_argument("--drop-float32", action="store_true", help="Do not keep float32 originals for exact rerank")
+    parser.add_argument("--collection", action="append", help="Only migrate this collection (repeatable)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    migrate(args.source, args.quantization, not args.drop_float32, args.collection, args.dry_run)
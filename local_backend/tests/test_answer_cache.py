@@ -0,0 +1,73 @@
+"""
+Tests for the semantic answer cache
+"""
+import pytest
+from app.services.answer_cache import SemanticAnswerCache
+
+
+@pytest.fixture
+def cache():
+    return SemanticAnswerCache(threshold=0.95, ttl_seconds=60, max_entries=2, max_notebooks=2, enabled=True)
+
+
+def test_hit_on_similar_question(cache):
+    """A near-identical embedding in the same notebook hits"""
+    cache.store("u", "nb", [1.0, 0.0, 0.0], "answer", 0, variant="k4")
+    assert cache.lookup("u", "nb", [0.99, 0.05, 0.0], variant="k4") == "answer"
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss_on_different_question_notebook_or_variant(cache):
+    """Dissimilar questions, other notebooks and other options miss"""
+    cache.store("u", "nb", [1.0, 0.0, 0.0], "answer", 0, variant="k4")
+    assert cache.lookup("u", "nb", [0.0, 1.0, 0.0], variant="k4") is None
+    assert cache.lookup("u", "other", [1.0, 0.0, 0.0], variant="k4") is None
+    assert cache.lookup("u", "nb", [1.0, 0.0, 0.0], variant="k8") is None
+    assert cache.stats()["hit_rate"] == 0.0
+
+
+def test_lru_eviction(cache):
+    """Each notebook keeps at most max_entries answers"""
+    cache.store("u", "nb", [1.0, 0.0, 0.0], "a", 0)
+    cache.store("u", "nb", [0.0, 1.0, 0.0], "b", 0)
+    cache.lookup("u", "nb", [1.0, 0.0, 0.0])  # touch "a"
+    cache.store("u", "nb", [0.0, 0.0, 1.0], "c", 0)
+
+    assert cache.lookup("u", "nb", [1.0, 0.0, 0.0]) == "a"
+    assert cache.lookup("u", "nb", [0.0, 1.0, 0.0]) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry(cache, monkeypatch):
+    """Entries older than the TTL are dropped"""
+    import app.services.answer_cache as module
+
+    now = [1000.0]
+    monkeypatch.setattr(module.time, "monotonic", lambda: now[0])
+    cache.store("u", "nb", [1.0, 0.0, 0.0], "answer", 0)
+    now[0] += 61
+    assert cache.lookup("u", "nb", [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_invalidate_notebook(cache):
+    """Document changes drop only that notebook's answers"""
+    cache.store("u", "nb", [1.0, 0.0, 0.0], "a", 0)
+    cache.store("u", "other", [1.0, 0.0, 0.0], "b", 0)
+    assert cache.invalidate("u", "nb") == 1
+    assert cache.lookup("u", "nb", [1.0, 0.0, 0.0]) is None
+    assert cache.lookup("u", "other", [1.0, 0.0, 0.0]) == "b"
+
+
+def test_store_dropped_after_invalidation(cache):
+    """An answer retrieved before the notebook changed is not cached"""
+    version = cache.version("u", "nb")
+    cache.invalidate("u", "nb")
+    assert cache.store("u", "nb", [1.0, 0.0, 0.0], "stale", version) is False
+    assert cache.lookup("u", "nb", [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["stale_stores"] == 1
+    assert cache.store("u", "nb", [1.0, 0.0, 0.0], "fresh", cache.version("u", "nb")) is True
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,6 +1,7 @@
 """
 Tests for local backend API endpoints
 """
+import json
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
@@ -54,6 +55,119 @@ def test_ask_question_no_documents():
     assert "source_chunks" in data
 
 
+class FakeEmbedder:
+    """Embeds every text as the same unit vector"""
+
+    def embed_query(self, query):
+        return [1.0, 0.0]
+
+    def embed_texts(self, texts, batch_size=32):
+        return [[1.0, 0.0] for _ in texts]
+
+
+def fake_query_batch(user_id, query_embeddings, top_k=4, filter_metadata=None, notebook_id=None):
+    return [
+        {"documents": ["Machine learning learns from data."], "distances": [0.1], "metadatas": [{"source": "ml.txt"}], "ids": ["doc_0"]}
+        for _ in query_embeddings
+    ]
+
+
+@pytest.fixture
+def stubbed_rag(monkeypatch):
+    """/ask endpoints without the embedding model, vector store or answer cache"""
+    from app.api import endpoints
+    from app.services.answer_cache import SemanticAnswerCache
+    monkeypatch.setattr(endpoints, "embedder", FakeEmbedder())
+    monkeypatch.setattr(endpoints, "answer_cache", SemanticAnswerCache(enabled=False))
+    monkeypatch.setattr(endpoints.chroma_service, "query_batch", fake_query_batch)
+    return endpoints
+
+
+def test_ask_fast_mode_quotes_top_chunk(stubbed_rag, monkeypatch):
+    """The extractive fast path scores the stored chunk embedding and embeds only its sentences"""
+    from app.services.extractive_answer import ExtractiveAnswerer
+    embedded = []
+
+    def embed_texts(texts):
+        embedded.append(texts)
+        return FakeEmbedder().embed_texts(texts)
+
+    monkeypatch.setattr(stubbed_rag, "extractive_answerer", ExtractiveAnswerer(min_chunk_score=0.7, min_sentence_score=0.7, embed_texts=embed_texts))
+    monkeypatch.setattr(stubbed_rag.chroma_service, "get_chunks", lambda user_id, notebook_id=None, include_embeddings=False, ids=None: {"embeddings": [[1.0, 0.0]]})
+    request_data = {
+        "user_id": "test_user",
+        "notebook_id": "nb1",
+        "question": "What is machine learning?",
+        "fast_mode": True
+    }
+    response = client.post("/api/ask", json=request_data)
+    assert response.status_code == 200
+    assert response.json()["extractive"] is True
+    assert response.json()["answer"].startswith("Machine learning learns from data.")
+    assert embedded == [["Machine learning learns from data."]]
+
+
+def test_ask_stream_sends_sources_before_tokens(stubbed_rag, monkeypatch):
+    """Test streaming answers emit sources, then tokens, then timings"""
+    async def fake_astream_answer(question, context_chunks, prompt=None, **kwargs):
+        for piece in ["Machine ", "learning."]:
+            yield piece
+
+    monkeypatch.setattr(stubbed_rag.llm_wrapper, "astream_answer", fake_astream_answer)
+    request_data = {
+        "user_id": "test_user",
+        "notebook_id": "nb1",
+        "question": "What is machine learning?"
+    }
+    response = client.post("/api/ask/stream", json=request_data)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert events == ["sources", "token", "token", "done"]
+
+
+def test_ask_stream_degrades_at_deadline(stubbed_rag, monkeypatch):
+    """A stream out of time sends the best excerpt and a degraded event instead of hanging"""
+    from app.utils.deadline import DeadlineExceeded
+
+    async def slow_astream_answer(question, context_chunks, prompt=None, **kwargs):
+        raise DeadlineExceeded("Request deadline exceeded during ask generation")
+        yield
+
+    monkeypatch.setattr(stubbed_rag.llm_wrapper, "astream_answer", slow_astream_answer)
+    response = client.post("/api/ask/stream", json={"user_id": "test_user", "notebook_id": "nb1", "question": "What is machine learning?"})
+    lines = response.text.splitlines()
+    events = [line.split(": ", 1)[1] for line in lines if line.startswith("event: ")]
+    data = [json.loads(line.split(": ", 1)[1]) for line in lines if line.startswith("data: ")]
+    assert events == ["sources", "token", "degraded", "done"]
+    assert data[1]["text"].startswith(stubbed_rag.DEADLINE_ANSWER)
+    assert data[-1]["degraded"] is True
+
+
+def test_ask_batch_streams_one_line_per_question(stubbed_rag, monkeypatch):
+    """Test batch questions stream back as NDJSON, one item per question"""
+    async def fake_aanswer_question(question, context_chunks, prompt=None, **kwargs):
+        return f"Answer to {question}"
+
+    monkeypatch.setattr(stubbed_rag.llm_wrapper, "aanswer_question", fake_aanswer_question)
+    questions = ["What is machine learning?", "What is a neural network?", "What is a gradient?"]
+    request_data = {
+        "user_id": "test_user",
+        "notebook_id": "nb1",
+        "questions": questions,
+        "top_k": 4
+    }
+    response = client.post("/api/ask/batch", json=request_data)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = [json.loads(line) for line in response.text.splitlines() if line]
+    assert len(items) == len(questions)
+    assert sorted(item["index"] for item in items) == [0, 1, 2]
+    for item in items:
+        assert item["error"] is None
+        assert item["response"]["answer"] == f"Answer to {questions[item['index']]}"
+
+
 @pytest.mark.asyncio
 async def test_ingest_text_file(tmp_path):
     """Test document ingestion with text file"""
@@ -88,5 +202,22 @@ def test_generate_quiz():
     assert response.status_code in [200, 404]
 
 
+def test_suggest_quiz_topics_asks_llm(monkeypatch):
+    """Topic suggestions come from the LLM over a sample of the user's chunks"""
+    from app.api import endpoints
+    calls = []
+
+    async def fake_agenerate(prompt, **kwargs):
+        calls.append(kwargs)
+        return 'Topics: ["Photosynthesis", "Cell division"]'
+
+    monkeypatch.setattr(endpoints.chroma_service, "get_chunks", lambda user_id, limit=None: {"documents": ["Plants make sugar from light."]})
+    monkeypatch.setattr(endpoints.llm_wrapper, "agenerate", fake_agenerate)
+
+    response = client.get("/api/suggest-quiz-topics", params={"user_id": "test_user"})
+    assert response.json() == {"topics": ["Photosynthesis", "Cell division"]}
+    assert calls[0]["call_site"] == "quiz-topics" and calls[0]["cache"]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,74 @@
+"""
+Tests for the Ollama backend pool
+"""
+import asyncio
+import time
+import httpx
+import pytest
+from app.services.backend_pool import BackendPool, parse_endpoints
+from app.services.circuit_breaker import LLMUnavailableError, OPEN
+from app.services.llm_wrapper import GPTOSSAdapter
+
+
+def checked_pool(models_by_url):
+    """Pool whose endpoints already report their installed models (no network)"""
+    pool = BackendPool(list(models_by_url))
+    for node in pool.nodes:
+        node.models = set(models_by_url[node.url])
+        node.models_checked_at = time.monotonic()
+    return pool
+
+
+def test_parse_endpoints():
+    assert parse_endpoints(" http://a:11434/, ,http://b:11434") == ["http://a:11434", "http://b:11434"]
+
+
+def test_routes_to_least_loaded_node_with_model():
+    """Busy nodes and nodes without the model are skipped"""
+    pool = checked_pool({"http://a": ["llm:latest"], "http://b": ["llm:latest"], "http://c": ["embed:latest"]})
+    with pool.lease("llm") as first:
+        with pool.lease("llm") as second:
+            assert {first.url, second.url} == {"http://a", "http://b"}
+            assert pool.status()["in_flight"] == 2
+    assert pool.status()["in_flight"] == 0
+
+    with pool.lease("embed") as node:
+        assert node.url == "http://c"
+    with pytest.raises(LLMUnavailableError, match="not installed"):
+        with pool.lease("missing"):
+            pass
+
+
+def test_open_nodes_are_skipped():
+    """Failures open a node's circuit and traffic moves to the others"""
+    pool = checked_pool({"http://a": ["llm"], "http://b": ["llm"]})
+    a = pool.nodes[0]
+    for _ in range(a.breaker.failure_threshold):
+        a.breaker.record_failure(ConnectionError("refused"))
+    assert a.breaker.state == OPEN
+    for _ in range(3):
+        with pool.lease("llm") as node:
+            assert node.url == "http://b"
+
+
+@pytest.mark.asyncio
+async def test_generation_fails_over_to_next_endpoint(monkeypatch):
+    """A 5xx from one endpoint is retried on another and counted against the first"""
+    pool = checked_pool({"http://a": ["test-model:latest"], "http://b": ["test-model:latest"]})
+    monkeypatch.setattr(pool, "refresh", lambda: 2)
+
+    def handler(request):
+        if request.url.host == "a":
+            return httpx.Response(500, json={"error": "out of memory"})
+        return httpx.Response(200, content=b'{"response": "from b", "done": true, "eval_count": 3}\n')
+
+    pool._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    pool._async_client_loop = asyncio.get_running_loop()
+    adapter = GPTOSSAdapter(model_name="test-model", pool=pool)
+    # Make sure the failing endpoint is tried first
+    pool.nodes[1].in_flight = 1
+
+    assert await adapter.agenerate("prompt", allow_fallback=False) == "from b"
+    assert pool.nodes[0].breaker.consecutive_failures == 1
+    assert pool.nodes[1].breaker.status()["successes"] == 1
+    await pool.aclose()
@@ -0,0 +1,55 @@
+"""
+Tests for ChromaDB service helpers
+"""
+import pytest
+from app.services.chroma_service import build_chunk_metadatas, build_scope_filter
+from app.utils.chunker import join_pages
+
+
+def test_scope_filter_empty():
+    """No scope means no where filter"""
+    assert build_scope_filter() is None
+    assert build_scope_filter(document_ids=[], sources=[]) is None
+
+
+def test_scope_filter_single_condition():
+    """A single condition is not wrapped in $and"""
+    where = build_scope_filter(document_ids=["doc-1", "doc-2"])
+    assert where == {"document_id": {"$in": ["doc-1", "doc-2"]}}
+
+
+def test_scope_filter_page_range():
+    """Page ranges match chunks that overlap the range"""
+    where = build_scope_filter(sources=["ch1.pdf"], page_start=3, page_end=5)
+    assert where == {
+        "$and": [
+            {"source": {"$in": ["ch1.pdf"]}},
+            {"page_end": {"$gte": 3}},
+            {"page": {"$lte": 5}},
+        ]
+    }
+
+
+def test_chunk_metadatas_pages():
+    """Chunks are tagged with the pages they span"""
+    text, page_offsets = join_pages(["a" * 100, "b" * 100, "c" * 100])
+    assert page_offsets == [0, 102, 204]
+    assert len(text) == 304
+
+    chunks = [("first", 0, 90), ("straddle", 90, 150), ("last", 210, 304)]
+    metadatas = build_chunk_metadatas("doc-1", "book.pdf", chunks, page_offsets, notebook_id="nb")
+
+    assert [(m["page"], m["page_end"]) for m in metadatas] == [(1, 1), (1, 2), (3, 3)]
+    assert all(m["document_id"] == "doc-1" and m["notebook_id"] == "nb" for m in metadatas)
+    assert [m["chunk_index"] for m in metadatas] == [0, 1, 2]
+
+
+def test_chunk_metadatas_without_pages():
+    """Plain-text documents carry no page keys"""
+    metadatas = build_chunk_metadatas("doc-1", "notes.txt", [("text", 0, 4)])
+    assert "page" not in metadatas[0]
+    assert metadatas[0]["source"] == "notes.txt"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,63 @@
+"""
+Tests for the LLM circuit breaker
+"""
+import time
+import pytest
+from app.services.circuit_breaker import CircuitBreaker, LLMUnavailableError, CALL, PROBE, REJECT, CLOSED, OPEN
+from app.services.backend_pool import BackendPool
+from app.services.llm_wrapper import GPTOSSAdapter
+
+
+def test_opens_after_threshold_and_probes_after_reset():
+    """Consecutive failures open the circuit; after the reset timeout one probe decides"""
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure(ConnectionError("refused"))
+    assert breaker.admit() == CALL
+    breaker.record_failure(ConnectionError("refused"))
+    assert breaker.state == OPEN
+    assert breaker.admit() == REJECT
+
+    time.sleep(0.06)
+    assert breaker.admit() == PROBE
+    # Only one probe at a time
+    assert breaker.admit() == REJECT
+    breaker.probe_result(False)
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.admit() == PROBE
+    breaker.probe_result(True)
+    assert breaker.state == CLOSED
+    assert [t["to"] for t in breaker.status()["transitions"]] == ["open", "half_open", "open", "half_open", "closed"]
+
+
+@pytest.fixture
+def down_adapter(monkeypatch):
+    """Adapter pointed at a port nothing listens on"""
+    monkeypatch.setenv("OLLAMA_BASE_URL", "http://127.0.0.1:9")
+    monkeypatch.setenv("CLARITY_LLM_BREAKER_RESET", "60")
+    return GPTOSSAdapter(model_name="test-model", pool=BackendPool(["http://127.0.0.1:9"]))
+
+
+@pytest.mark.asyncio
+async def test_down_backend_fails_fast(down_adapter):
+    """With the circuit open calls never touch the network and fall back immediately"""
+    assert down_adapter.health()["backends"]["endpoints"][0]["state"] == OPEN
+
+    start = time.perf_counter()
+    answer = await down_adapter.agenerate("What is photosynthesis?")
+    assert answer
+    assert time.perf_counter() - start < 0.5
+    assert down_adapter.pool.nodes[0].breaker.status()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fallback_disabled_raises(down_adapter):
+    """CLARITY_LLM_FALLBACK=error (or an uncached-fallback call) raises instead of serving mock output"""
+    down_adapter.fallback = "error"
+    with pytest.raises(LLMUnavailableError):
+        await down_adapter.agenerate("prompt")
+
+    down_adapter.fallback = "mock"
+    with pytest.raises(LLMUnavailableError):
+        await down_adapter.agenerate("prompt", allow_fallback=False)
@@ -0,0 +1,45 @@
+"""
+Tests for token-budgeted context packing
+"""
+from app.utils.chunker import chunk_text, count_tokens
+from app.utils.context_packer import pack_context
+
+
+def test_pack_context_keeps_relevance_order_within_budget():
+    """Test chunks are taken in order until the budget is used"""
+    chunks = [" ".join([f"Chunk {c} sentence {i}." for i in range(10)]) for c in range(5)]
+    budget = count_tokens(chunks[0]) * 2 + 5
+    packed = pack_context(chunks, budget)
+
+    assert packed[:2] == chunks[:2]
+    assert sum(count_tokens(chunk) for chunk in packed) <= budget
+
+
+def test_pack_context_trims_at_sentence_boundary():
+    """Test the chunk that overflows the budget is cut after a whole sentence"""
+    chunk = " ".join([f"This is sentence number {i} of the only chunk." for i in range(40)])
+    packed = pack_context([chunk], budget=count_tokens(chunk) // 2)
+
+    assert len(packed) == 1
+    assert packed[0].endswith("chunk.")
+    assert chunk.startswith(packed[0])
+    assert count_tokens(packed[0]) <= count_tokens(chunk) // 2
+
+
+def test_pack_context_drops_chunker_overlap():
+    """Test sentences repeated by overlapping chunks are only packed once"""
+    text = " ".join([f"Fact number {i} is worth remembering." for i in range(60)])
+    chunks = [c[0] for c in chunk_text(text, chunk_size=60, chunk_overlap=20)]
+    packed = pack_context(chunks, budget=10_000)
+
+    sentences = " ".join(packed).split(". ")
+    assert len(sentences) == len(set(sentences)) == 60
+
+
+def test_pack_context_uses_precomputed_token_counts():
+    """Test stored token counts are used instead of recounting"""
+    chunks = ["Short chunk one.", "Short chunk two."]
+    packed = pack_context(chunks, budget=100, token_counts=[90, 90])
+
+    assert packed[0] == chunks[0]
+    assert len(packed) == 1
@@ -0,0 +1,102 @@
+"""
+Tests for request deadline propagation
+"""
+import asyncio
+import time
+import httpx
+import pytest
+from app.services import llm_wrapper as llm_wrapper_module
+from app.services.backend_pool import BackendPool
+from app.services.llm_metrics import LLMMetrics
+from app.services.llm_wrapper import GPTOSSAdapter, LLMWrapper
+from app.utils import deadline as deadline_module
+from app.utils.deadline import (
+    DeadlineExceeded,
+    deadline,
+    fit_max_tokens,
+    remaining,
+    stage_timeout,
+)
+
+
+def test_no_deadline_leaves_limits_alone():
+    assert remaining() is None
+    assert fit_max_tokens(2000) == 2000
+    assert stage_timeout(30, "embedding") == 30
+
+
+def test_fit_max_tokens_caps_to_remaining_budget():
+    with deadline(10):
+        # 10s * 0.8 share * 20 tok/s leaves room for ~160 tokens
+        fitted = fit_max_tokens(2000, tokens_per_second=20)
+        assert 150 <= fitted <= 160
+        assert fit_max_tokens(100, tokens_per_second=20) == 100
+        assert stage_timeout(30, "embedding") <= 10
+
+    with deadline(0.5):
+        with pytest.raises(DeadlineExceeded):
+            fit_max_tokens(2000, tokens_per_second=20)
+
+
+def test_outer_deadline_wins_when_sooner():
+    with deadline(1):
+        with deadline(100):
+            assert remaining() <= 1
+        with deadline(0.5):
+            assert remaining() <= 0.5
+        assert 0.5 < remaining() <= 1
+    assert remaining() is None
+
+
+def test_spent_budget_fails_before_stage():
+    with deadline(0):
+        with pytest.raises(DeadlineExceeded, match="retrieval"):
+            stage_timeout(30, "retrieval")
+
+
+class StalledStream(httpx.AsyncByteStream):
+    """One token, then stalls"""
+
+    def __init__(self):
+        self.closed = False
+
+    async def __aiter__(self):
+        yield b'{"response": "a", "done": false}\n'
+        await asyncio.sleep(10)
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_generation_cancelled_at_deadline(monkeypatch):
+    """A generation still running when the deadline passes is cancelled and not held against the endpoint"""
+    pool = BackendPool(["http://a"])
+    pool.nodes[0].models = {"test-model:latest"}
+    pool.nodes[0].models_checked_at = time.monotonic()
+    monkeypatch.setattr(pool, "refresh", lambda: 1)
+    stream = StalledStream()
+    payloads = []
+
+    def handler(request):
+        payloads.append(request.content)
+        return httpx.Response(200, stream=stream)
+
+    pool._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    pool._async_client_loop = asyncio.get_running_loop()
+
+    monkeypatch.setattr(llm_wrapper_module, "llm_metrics", LLMMetrics())
+    monkeypatch.setattr(deadline_module, "DEFAULT_TOKENS_PER_SECOND", 1000)
+    wrapper = LLMWrapper()
+    wrapper.llm = GPTOSSAdapter(model_name="test-model", pool=pool)
+
+    with deadline(0.3):
+        with pytest.raises(DeadlineExceeded):
+            await asyncio.wait_for(wrapper.agenerate("prompt", max_tokens=2000, call_site="ask"), timeout=5)
+
+    assert stream.closed
+    assert pool.nodes[0].in_flight == 0
+    assert pool.nodes[0].breaker.consecutive_failures == 0
+    # max tokens were capped to what fits in the budget
+    assert b'"num_predict": 2000' not in payloads[0]
+    await pool.aclose()
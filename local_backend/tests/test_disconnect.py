@@ -0,0 +1,92 @@
+"""
+Tests for cancelling generations when the client disconnects
+"""
+import asyncio
+import time
+import httpx
+import pytest
+from app.services import llm_wrapper as llm_wrapper_module
+from app.services.backend_pool import BackendPool
+from app.services.llm_metrics import LLMMetrics
+from app.services.llm_wrapper import GPTOSSAdapter, LLMWrapper
+from app.utils import disconnect
+from app.utils.disconnect import ClientDisconnected, cancel_on_disconnect
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after: int):
+        self.checks = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self.checks += 1
+        return self.checks > self.disconnect_after
+
+
+@pytest.mark.asyncio
+async def test_work_cancelled_when_client_leaves(monkeypatch):
+    monkeypatch.setattr(disconnect, "DISCONNECT_POLL_SECONDS", 0.01)
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(ClientDisconnected) as exc:
+        await cancel_on_disconnect(FakeRequest(disconnect_after=2), work())
+    assert exc.value.status_code == 499
+    assert cancelled.is_set()
+
+    async def quick():
+        return "done"
+
+    assert await cancel_on_disconnect(FakeRequest(disconnect_after=0), quick()) == "done"
+
+
+class SlowStream(httpx.AsyncByteStream):
+    """Three tokens, then stalls as a long generation would"""
+
+    def __init__(self):
+        self.closed = False
+
+    async def __aiter__(self):
+        for token in ("a", "b", "c"):
+            yield f'{{"response": "{token}", "done": false}}\n'.encode()
+        await asyncio.sleep(10)
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_cancel_closes_ollama_stream_and_counts_tokens(monkeypatch):
+    """Cancelling a generation closes the stream to Ollama and reports the tokens already produced"""
+    pool = BackendPool(["http://a"])
+    pool.nodes[0].models = {"test-model:latest"}
+    pool.nodes[0].models_checked_at = time.monotonic()
+    monkeypatch.setattr(pool, "refresh", lambda: 1)
+    stream = SlowStream()
+    pool._async_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, stream=stream)))
+    pool._async_client_loop = asyncio.get_running_loop()
+
+    metrics = LLMMetrics()
+    monkeypatch.setattr(llm_wrapper_module, "llm_metrics", metrics)
+    wrapper = LLMWrapper()
+    wrapper.llm = GPTOSSAdapter(model_name="test-model", pool=pool)
+
+    task = asyncio.create_task(wrapper.agenerate("prompt", call_site="mindmap"))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert stream.closed
+    assert pool.nodes[0].in_flight == 0
+    assert pool.nodes[0].breaker.consecutive_failures == 0
+    totals = metrics.summary()["totals"]["mindmap"]
+    assert totals["cancelled"] == 1 and totals["errors"] == 0
+    assert totals["cancelled_tokens"] == 3
+    await pool.aclose()
@@ -0,0 +1,105 @@
+"""
+Tests for extractive fast-path answers
+"""
+import asyncio
+import pytest
+from app.services.extractive_answer import ExtractiveAnswerer, FollowupAnswers, format_citation, split_sentences
+
+CHUNK = (
+    "Photosynthesis\n\n"
+    "Photosynthesis is the process by which plants turn light into chemical energy. "
+    "It takes place in the chloroplasts of leaf cells. "
+    "Unrelated trivia about the history of botany goes here."
+)
+
+# Question, chunk and sentence vectors: the definition matches, its follow-up partly, the trivia not at all
+VECTORS = {
+    CHUNK: [0.9, 0.3, 0.3],
+    "Photosynthesis is the process by which plants turn light into chemical energy.": [1.0, 0.0, 0.0],
+    "It takes place in the chloroplasts of leaf cells.": [0.8, 0.6, 0.0],
+    "Unrelated trivia about the history of botany goes here.": [0.0, 0.0, 1.0],
+}
+QUESTION = [1.0, 0.0, 0.0]
+
+
+def fake_embed(texts):
+    return [VECTORS[text] for text in texts]
+
+
+def test_split_sentences_drops_headings():
+    assert split_sentences(CHUNK) == list(VECTORS)[1:]
+
+
+def test_extracts_matching_sentences():
+    answerer = ExtractiveAnswerer(min_chunk_score=0.7, min_sentence_score=0.75, max_sentences=2, embed_texts=fake_embed)
+    span = answerer.extract(QUESTION, CHUNK)
+    assert span.text == (
+        "Photosynthesis is the process by which plants turn light into chemical energy. "
+        "It takes place in the chloroplasts of leaf cells."
+    )
+    assert span.score == pytest.approx(1.0)
+
+    answerer.max_sentences = 1
+    assert answerer.extract(QUESTION, CHUNK).text.endswith("chemical energy.")
+
+
+def test_no_answer_when_retrieval_not_confident():
+    calls = []
+
+    def embed(texts):
+        calls.append(texts)
+        return fake_embed(texts)
+
+    # Chunk cosine to this question is 0.9 / |chunk| ~ 0.905: enough for 0.7, not for 0.95
+    answerer = ExtractiveAnswerer(min_chunk_score=0.95, min_sentence_score=0.75, embed_texts=embed)
+    assert answerer.extract(QUESTION, CHUNK) is None
+    assert len(calls) == 1 and calls[0][0] == CHUNK  # chunk and sentences embedded together
+
+    answerer.min_chunk_score = 0.1
+    assert answerer.extract([0.0, 1.0, 0.0], CHUNK) is None
+    stats = answerer.stats()
+    assert stats["attempts"] == 2 and stats["low_chunk_score"] == 1 and stats["no_span"] == 1
+
+
+def test_stored_chunk_embedding_skips_re_embedding_the_chunk():
+    calls = []
+
+    def embed(texts):
+        calls.append(texts)
+        return fake_embed(texts)
+
+    answerer = ExtractiveAnswerer(min_chunk_score=0.95, min_sentence_score=0.75, embed_texts=embed)
+    assert answerer.extract(QUESTION, CHUNK, VECTORS[CHUNK]) is None
+    assert calls == []  # a chunk below the threshold costs no embedding at all
+
+    answerer.min_chunk_score = 0.7
+    assert answerer.extract(QUESTION, CHUNK, VECTORS[CHUNK]).text.startswith("Photosynthesis is")
+    assert calls == [split_sentences(CHUNK)]  # only the sentences, in one call
+
+
+def test_format_citation():
+    assert format_citation({"source": "notes.pdf", "page": 3}) == "notes.pdf, p. 3"
+    assert format_citation({"title": "Biology", "source": "bio.txt"}) == "Biology"
+    assert format_citation(None) is None
+
+
+@pytest.mark.asyncio
+async def test_followups_scoped_to_user_and_bounded():
+    followups = FollowupAnswers(max_entries=1)
+    release = asyncio.Event()
+
+    async def full_answer():
+        await release.wait()
+        return "full"
+
+    first = followups.start("alice", full_answer())
+    first_task = followups.get(first, "alice")
+    assert followups.get(first, "bob") is None
+
+    second = followups.start("alice", full_answer())
+    await asyncio.sleep(0)
+    assert followups.get(first, "alice") is None
+    assert first_task.cancelled()
+
+    release.set()
+    assert await followups.get(second, "alice") == "full"
@@ -0,0 +1,49 @@
+"""
+Tests for concurrent LLM shards merged as they finish
+"""
+import asyncio
+import pytest
+from app.services.circuit_breaker import LLMUnavailableError
+from app.services.fan_out import FanOut
+from app.services.structured_output import StructuredOutputError
+from app.utils.deadline import DeadlineExceeded
+
+
+async def shard(result, delay=0.0):
+    await asyncio.sleep(delay)
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+@pytest.mark.asyncio
+async def test_any_shard_error_counts_as_failed():
+    """A shard raising something unexpected is skipped; the others are kept"""
+    async with FanOut("Shard", [shard("a"), shard(KeyError("boom")), shard("b", 0.01)]) as shards:
+        results = [result async for result in shards]
+    assert results == ["a", "b"]
+    assert shards.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_leaving_early_cancels_running_shards():
+    """Breaking out of the loop cancels and awaits the shards still running"""
+    slow = asyncio.ensure_future(shard("slow", 10))
+    async with FanOut("Shard", [shard("fast"), slow]) as shards:
+        async for result in shards:
+            break
+    assert result == "fast"
+    assert slow.cancelled()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("errors,expected", [
+    ([StructuredOutputError("bad json"), DeadlineExceeded("late")], DeadlineExceeded),
+    ([StructuredOutputError("bad json"), LLMUnavailableError("down")], LLMUnavailableError),
+    ([StructuredOutputError("bad json")], StructuredOutputError),
+])
+async def test_raise_failure_prefers_the_telling_error(errors, expected):
+    async with FanOut("Shard", [shard(error) for error in errors]) as shards:
+        assert [result async for result in shards] == []
+    with pytest.raises(expected):
+        shards.raise_failure("Nothing generated")
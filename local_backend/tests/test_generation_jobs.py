@@ -0,0 +1,100 @@
+"""
+Tests for background generation jobs and partial mind map saving
+"""
+import asyncio
+import json
+import pytest
+from app.api import mindmaps
+from app.services.generation_jobs import GenerationJobs
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_queues_jobs():
+    jobs = GenerationJobs("test", max_concurrent=1)
+    release = asyncio.Event()
+    running = []
+
+    async def work(publish):
+        running.append(len(running))
+        await release.wait()
+
+    jobs.start("a", work)
+    await asyncio.sleep(0)
+    jobs.start("b", work)
+    await asyncio.sleep(0)
+
+    assert running == [0]
+    # Subscribing late still shows where the job is
+    events = jobs.subscribe("b")
+    assert await asyncio.wait_for(events.__anext__(), 1) == {"stage": "queued"}
+    await events.aclose()
+    with pytest.raises(ValueError):
+        jobs.start("a", work)
+
+    release.set()
+    await asyncio.sleep(0.01)
+    assert running == [0, 1]
+    assert jobs.stats()["completed"] == 2 and jobs.stats()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_subscribers_receive_events_until_job_finishes():
+    jobs = GenerationJobs("test")
+    step = asyncio.Event()
+
+    async def work(publish):
+        await step.wait()
+        publish({"stage": "generating", "depth": 1})
+        publish({"stage": "done"})
+
+    jobs.start("map", work)
+    received = []
+
+    async def listen():
+        async for event in jobs.subscribe("map"):
+            received.append(event)
+
+    listener = asyncio.ensure_future(listen())
+    await asyncio.sleep(0)
+    step.set()
+    await asyncio.wait_for(listener, 1)
+
+    assert received == [{"stage": "generating", "depth": 1}, {"stage": "done"}]
+    # A finished job has nothing to subscribe to
+    assert [event async for event in jobs.subscribe("map")] == []
+
+
+@pytest.mark.asyncio
+async def test_cancel_and_shutdown():
+    jobs = GenerationJobs("test")
+
+    async def work(publish):
+        await asyncio.sleep(60)
+
+    jobs.start("a", work)
+    jobs.start("b", work)
+    await asyncio.sleep(0)
+    assert jobs.cancel("a")
+    assert not jobs.cancel("missing")
+    await jobs.shutdown()
+    assert jobs.stats()["cancelled"] == 2 and not jobs.running("b")
+
+
+def test_partial_mind_map_saved_per_depth(monkeypatch):
+    saved, progress = [], []
+    monkeypatch.setattr(mindmaps.mindmap_crud, "update_mind_map_data", lambda **kwargs: saved.append(kwargs))
+    monkeypatch.setattr(mindmaps.PartialMindMap, "PARSE_EVERY_CHARS", 1)
+    partial = mindmaps.PartialMindMap(db=None, mind_map_id="m", on_progress=progress.append)
+
+    nodes = [
+        {"id": "1", "label": "Root", "depth": 0},
+        {"id": "2", "label": "Child", "depth": 1},
+        {"id": "3", "label": "Sibling", "depth": 1},
+    ]
+    text = json.dumps({"nodes": nodes, "edges": [{"from": "1", "to": "2"}]})
+    # Output cut off after each node, as it arrives while streaming
+    for node in nodes:
+        partial(text[:text.index(json.dumps(node)) + len(json.dumps(node))])
+
+    assert [s["depth"] for s in saved] == [0, 1]
+    assert progress[-1] == {"stage": "generating", "depth": 1, "nodes": 2, "nodes_per_depth": {"0": 1, "1": 1}}
@@ -0,0 +1,52 @@
+"""
+Tests for the persistent LLM response cache
+"""
+import pytest
+from app.services.llm_cache import LLMResponseCache, llm_cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite3"), max_entries=2, enabled=True)
+
+
+def test_key_covers_generation_parameters():
+    """Changing model, prompt, temperature, max_tokens or options changes the key"""
+    base = llm_cache_key("m", "prompt", 0.3, 100, {"top_p": 0.9})
+    assert base == llm_cache_key("m", "prompt", 0.3, 100, {"top_p": 0.9})
+    assert base != llm_cache_key("other", "prompt", 0.3, 100, {"top_p": 0.9})
+    assert base != llm_cache_key("m", "prompt!", 0.3, 100, {"top_p": 0.9})
+    assert base != llm_cache_key("m", "prompt", 0.2, 100, {"top_p": 0.9})
+    assert base != llm_cache_key("m", "prompt", 0.3, 200, {"top_p": 0.9})
+    assert base != llm_cache_key("m", "prompt", 0.3, 100)
+
+
+def test_hit_reports_saved_generation_time(cache):
+    """A hit returns the stored response and counts the time it saved"""
+    cache.put("k", "response", generation_ms=1500)
+    assert cache.get("k") == "response"
+    assert cache.get("missing") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["saved_seconds"] == pytest.approx(1.5)
+
+
+def test_lru_eviction(cache):
+    """The least recently used entry is evicted beyond max_entries"""
+    cache.put("a", "A", generation_ms=10)
+    cache.put("b", "B", generation_ms=10)
+    cache.get("a")
+    cache.put("c", "C", generation_ms=10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_persists_across_instances(tmp_path):
+    """Entries survive a restart"""
+    path = str(tmp_path / "llm_cache.sqlite3")
+    LLMResponseCache(path=path, enabled=True).put("k", "response", generation_ms=10)
+    assert LLMResponseCache(path=path, enabled=True).get("k") == "response"
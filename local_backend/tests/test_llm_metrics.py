@@ -0,0 +1,75 @@
+"""
+Tests for per-call LLM usage metrics
+"""
+import pytest
+from app.services import llm_wrapper as llm_wrapper_module
+from app.services.llm_metrics import LLMMetrics, report_usage
+from app.services.llm_wrapper import LLMInterface, LLMWrapper
+
+
+class UsageLLM(LLMInterface):
+    """Reports Ollama-style usage for every call"""
+
+    def generate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        report_usage({
+            "prompt_eval_count": 100,
+            "eval_count": 50,
+            "load_duration": 2_000_000_000,
+            "prompt_eval_duration": 500_000_000,
+            "eval_duration": 1_000_000_000,
+        })
+        return "answer"
+
+    async def agenerate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        return self.generate(prompt, max_tokens, temperature, **kwargs)
+
+    def get_model_name(self):
+        return "usage-llm"
+
+
+@pytest.fixture
+def metered(monkeypatch):
+    metrics = LLMMetrics(window_seconds=60)
+    monkeypatch.setattr(llm_wrapper_module, "llm_metrics", metrics)
+    wrapper = LLMWrapper()
+    wrapper.llm = UsageLLM()
+    return wrapper, metrics
+
+
+@pytest.mark.asyncio
+async def test_calls_recorded_per_call_site(metered):
+    """Provider usage is attributed to the call site that made the call"""
+    wrapper, metrics = metered
+    await wrapper.agenerate("p", call_site="node-details")
+    await wrapper.agenerate("p", call_site="node-details")
+    async for _ in wrapper.astream_answer("q", ["context"]):
+        pass
+
+    summary = metrics.summary()
+    node = summary["window"]["node-details"]
+    assert node["calls"] == 2
+    assert node["prompt_tokens"] == 200
+    assert node["output_tokens"] == 100
+    assert node["tokens_per_s"] == pytest.approx(50.0)
+    assert node["load_ms_total"] == pytest.approx(4000.0)
+    assert summary["window"]["ask"]["calls"] == 1
+    assert node["inference_share"] == pytest.approx(2 / 3)
+
+    recent = metrics.recent(1)[0]
+    assert recent["call_site"] == "ask" and recent["queue_ms"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_failed_calls_counted(metered):
+    """Calls that raise are still recorded, as errors"""
+    wrapper, metrics = metered
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("backend down")
+
+    wrapper.llm.agenerate = fail
+    with pytest.raises(RuntimeError):
+        await wrapper.agenerate("p", call_site="quiz")
+    assert metrics.summary()["totals"]["quiz"]["errors"] == 1
+    # Usage reported outside a measured call is ignored
+    report_usage({"eval_count": 5})
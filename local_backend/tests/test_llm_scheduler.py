@@ -0,0 +1,112 @@
+"""
+Tests for the LLM priority scheduler
+"""
+import asyncio
+import pytest
+from app.services.backend_pool import BackendPool
+from app.services.llm_scheduler import LLMScheduler, INTERACTIVE, BULK
+from app.services.llm_wrapper import LLMInterface, LLMWrapper, scheduler_for
+
+
+async def run_calls(scheduler, calls):
+    """Hold the only slot, queue `calls` behind it, then record the order they run in"""
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot(BULK, "blocker"):
+            await release.wait()
+
+    async def call(priority, user_id, label):
+        async with scheduler.slot(priority, user_id):
+            order.append(label)
+
+    first = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+    tasks = []
+    for priority, user_id, label in calls:
+        tasks.append(asyncio.create_task(call(priority, user_id, label)))
+        await asyncio.sleep(0)
+    assert scheduler.queued() == len(calls)
+
+    release.set()
+    await asyncio.gather(first, *tasks)
+    return order
+
+
+@pytest.mark.asyncio
+async def test_interactive_jumps_ahead_of_bulk():
+    """Queued interactive calls run before earlier-queued bulk calls"""
+    scheduler = LLMScheduler(max_in_flight=1)
+    order = await run_calls(scheduler, [
+        (BULK, "u1", "bulk-1"),
+        (BULK, "u1", "bulk-2"),
+        (INTERACTIVE, "u2", "ask"),
+    ])
+    assert order == ["ask", "bulk-1", "bulk-2"]
+    assert scheduler.stats()["priorities"][INTERACTIVE]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_users_served_round_robin_within_priority():
+    """One user's burst does not starve another user in the same class"""
+    scheduler = LLMScheduler(max_in_flight=1)
+    order = await run_calls(scheduler, [
+        (BULK, "u1", "u1-a"),
+        (BULK, "u1", "u1-b"),
+        (BULK, "u1", "u1-c"),
+        (BULK, "u2", "u2-a"),
+    ])
+    assert order == ["u1-a", "u2-a", "u1-b", "u1-c"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    """A cancelled queued call frees its place and the slot is not leaked"""
+    scheduler = LLMScheduler(max_in_flight=1)
+    async with scheduler.slot(INTERACTIVE, "u1"):
+        waiter = asyncio.create_task(scheduler.slot(BULK, "u2").__aenter__())
+        await asyncio.sleep(0)
+        assert scheduler.queued() == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.queued() == 0
+    assert scheduler.in_flight == 0
+
+
+class PooledLLM(LLMInterface):
+    """Records how many generations run at once on a pool of `nodes` endpoints"""
+
+    def __init__(self, nodes):
+        self.pool = BackendPool([f"http://node-{i}:11434" for i in range(nodes)])
+        self.running = 0
+        self.peak = 0
+
+    def generate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        return prompt
+
+    async def agenerate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return prompt
+
+    def get_model_name(self):
+        return "pooled"
+
+
+@pytest.mark.asyncio
+async def test_limit_scales_with_pool_nodes(monkeypatch):
+    """Two endpoints at one call per node run two generations at once"""
+    monkeypatch.setenv("CLARITY_LLM_MAX_IN_FLIGHT", "1")
+    llm = PooledLLM(nodes=2)
+    wrapper = LLMWrapper()
+    wrapper.llm = llm
+    wrapper.scheduler = scheduler_for(llm)
+    assert wrapper.scheduler.max_in_flight == 2
+
+    results = await asyncio.gather(*(wrapper.agenerate(f"p{i}", user_id=f"u{i}") for i in range(4)))
+    assert results == ["p0", "p1", "p2", "p3"]
+    assert llm.peak == 2
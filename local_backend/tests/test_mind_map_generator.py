@@ -0,0 +1,89 @@
+"""
+Tests for map-reduce mind map generation
+"""
+import asyncio
+import numpy as np
+import pytest
+from app.models.schemas import MindMapOutput
+from app.services import mind_map_generator
+from app.services.mind_map_generator import cluster_count, kmeans, merge_branches, representative_chunks
+from app.services.structured_output import StructuredOutputError
+
+
+def blobs(per_blob=10, dim=16, seed=1):
+    """Three well separated groups of unit vectors"""
+    rng = np.random.default_rng(seed)
+    centers = np.eye(dim)[:3]
+    vectors = np.concatenate([center + 0.05 * rng.standard_normal((per_blob, dim)) for center in centers])
+    return vectors.astype(np.float32), np.repeat(np.arange(3), per_blob)
+
+
+def branch(theme):
+    return MindMapOutput.model_validate({
+        "nodes": [
+            {"id": "1", "label": theme, "depth": 0},
+            {"id": "2", "label": f"{theme} detail", "depth": 1},
+        ],
+        "edges": [{"from": "1", "to": "2", "label": "includes"}, {"from": "1", "to": "9"}],
+    })
+
+
+def test_kmeans_recovers_separated_groups():
+    vectors, truth = blobs()
+    labels, centroids = kmeans(vectors, 3)
+    # Same partition as the ground truth, whatever the cluster numbering
+    assert len({(t, l) for t, l in zip(truth, labels)}) == 3
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+
+    clusters = representative_chunks(vectors, labels, centroids, per_cluster=4)
+    assert [len(indices) for indices in clusters] == [4, 4, 4]
+    assert all(len({truth[i] for i in indices}) == 1 for indices in clusters)
+
+
+def test_cluster_count_bounded():
+    assert cluster_count(1) == 1
+    assert cluster_count(12) == 2
+    assert cluster_count(100_000) == mind_map_generator.MAX_CLUSTERS
+
+
+def test_merge_branches_renumbers_under_root():
+    merged = merge_branches("Biology", [branch("Cells"), branch("Plants")])
+    assert [(n.id, n.label, n.depth) for n in merged.nodes] == [
+        ("1", "Biology", 0),
+        ("2", "Cells", 1), ("3", "Cells detail", 2),
+        ("4", "Plants", 1), ("5", "Plants detail", 2),
+    ]
+    assert [(e.from_, e.to) for e in merged.edges] == [("1", "2"), ("2", "3"), ("1", "4"), ("4", "5")]
+
+
+@pytest.mark.asyncio
+async def test_branches_generated_concurrently_with_bounded_prompts(monkeypatch):
+    vectors, _ = blobs(per_blob=40)
+    chunks = [f"chunk {i}" for i in range(len(vectors))]
+    prompts = []
+    in_flight = peak = 0
+
+    async def fake_structured(prompt, schema, **kwargs):
+        nonlocal in_flight, peak
+        prompts.append(prompt)
+        number = len(prompts)
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if number == 1:
+            raise StructuredOutputError("bad branch")
+        return branch(f"Theme {number}")
+
+    monkeypatch.setattr(mind_map_generator.llm_wrapper, "agenerate_structured", fake_structured)
+    progress = []
+    merged = await mind_map_generator.generate_mind_map_clustered(
+        "Notes", chunks, vectors.tolist(), max_depth=2,
+        on_branch=lambda mind_map, done, total: progress.append((done, total))
+    )
+
+    assert peak == len(prompts) > 1
+    assert all(p.count("chunk ") <= mind_map_generator.CHUNKS_PER_CLUSTER for p in prompts)
+    # The failed branch is left out
+    assert sum(1 for node in merged.nodes if node.depth == 1) == len(prompts) - 1
+    assert progress[-1] == (len(prompts), len(prompts))
@@ -0,0 +1,70 @@
+"""
+Tests for the mind map graph index and single-node lookups
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.api.mindmaps import get_mind_map_subtree
+from app.db import Base, mindmap_crud
+from app.db.mindmap_models import MindMap
+from app.utils.mind_map_graph import build_index, subtree
+
+NODES = [
+    {"id": "1", "label": "Root", "depth": 0},
+    {"id": "2", "label": "Left", "depth": 1},
+    {"id": "3", "label": "Right", "depth": 1},
+    {"id": "4", "label": "Leaf", "depth": 2},
+]
+EDGES = [
+    {"from": "1", "to": "2", "label": "includes"},
+    {"from": "1", "to": "3", "label": "includes"},
+    {"from": "2", "to": "4", "label": "explains"},
+    {"from": "2", "to": "missing", "label": "dangling"},
+]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_build_index_and_subtree():
+    index = build_index(NODES, EDGES)
+    assert index["positions"]["4"] == 3
+    assert index["children"]["1"] == [["2", 0], ["3", 1]]
+    assert index["parents"]["4"] == ["2"]
+    assert index["degree"]["2"] == 3
+
+    assert subtree(index, "1") == ([0, 1, 2, 3], [0, 1, 2])
+    assert subtree(index, "1", max_depth=1) == ([0, 1, 2], [0, 1])
+    assert subtree(index, "1", max_nodes=2) == ([0, 1], [0])
+    assert subtree(index, "unknown") == ([], [])
+
+
+@pytest.mark.asyncio
+async def test_subtree_endpoint_reads_only_requested_elements(db):
+    mind_map = mindmap_crud.create_mind_map(db, "alice", "Map", None)
+    mindmap_crud.update_mind_map_data(db, mind_map.id, NODES, EDGES, node_count=4, depth=2)
+    db.expunge_all()
+
+    result = await get_mind_map_subtree(mind_map.id, "2", user_id="alice", depth=1, db=db)
+    assert result["node"]["label"] == "Left"
+    assert result["parents"] == ["1"]
+    assert [node["id"] for node in result["nodes"]] == ["2", "4"]
+    assert result["edges"] == [EDGES[2]]
+    # Nodes and edges were never loaded into the session
+    assert all("nodes" not in mm.__dict__ for mm in db.identity_map.values() if isinstance(mm, MindMap))
+
+
+def test_index_built_for_maps_saved_without_one(db):
+    db.add(MindMap(id="old", user_id="alice", title="Old", nodes=NODES, edges=EDGES))
+    db.commit()
+
+    notebook_id, index = mindmap_crud.get_mind_map_graph(db, "old", "alice")
+    assert notebook_id is None and index["positions"]["3"] == 2
+    assert db.query(MindMap.graph).filter(MindMap.id == "old").scalar() == index
+    assert mindmap_crud.get_mind_map_graph(db, "old", "bob") is None
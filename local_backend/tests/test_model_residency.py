@@ -0,0 +1,79 @@
+"""
+Tests for the model residency manager
+"""
+from datetime import datetime
+import pytest
+from app.services.llm_wrapper import MockLLM
+from app.services.model_residency import ModelResidencyManager, parse_active_hours
+
+
+class FakeWrapper:
+    def __init__(self, llm, tiers=None):
+        self.llm = llm
+        self.tiers = tiers or {}
+
+    def get_model_name(self):
+        return self.llm.get_model_name()
+
+
+class ResidentLLM(MockLLM):
+    keep_alive = "30m"
+
+    def __init__(self):
+        self.loads = 0
+        self.resident = False
+
+    async def apreload(self):
+        self.loads += 1
+        self.resident = True
+        return True
+
+    async def aresident(self):
+        return self.resident
+
+
+def test_active_hours():
+    """Hour windows, including ones that wrap past midnight"""
+    assert parse_active_hours("") is None
+    manager = ModelResidencyManager(FakeWrapper(MockLLM()), active_hours="7-23")
+    assert manager.in_active_hours(datetime(2024, 1, 1, 7))
+    assert not manager.in_active_hours(datetime(2024, 1, 1, 23))
+    night = ModelResidencyManager(FakeWrapper(MockLLM()), active_hours="22-6")
+    assert night.in_active_hours(datetime(2024, 1, 1, 2))
+    assert not night.in_active_hours(datetime(2024, 1, 1, 12))
+
+
+@pytest.mark.asyncio
+async def test_preload_and_eviction_status():
+    """Preloading marks the model warm; eviction shows up as cold"""
+    llm = ResidentLLM()
+    manager = ModelResidencyManager(FakeWrapper(llm), active_hours="")
+    await manager.preload()
+    status = await manager.status()
+    assert status["state"] == "warm" and status["resident"] is True
+    assert status["last_load_ms"] is not None
+
+    llm.resident = False
+    assert (await manager.status())["state"] == "cold"
+
+
+@pytest.mark.asyncio
+async def test_nothing_to_load_for_mock_provider():
+    """Providers without a model to load report not_applicable"""
+    manager = ModelResidencyManager(FakeWrapper(MockLLM()), active_hours="")
+    await manager.preload()
+    assert (await manager.status())["state"] == "not_applicable"
+
+
+@pytest.mark.asyncio
+async def test_preload_warms_every_tier():
+    """Tier models are preloaded and pinged alongside the quality model"""
+    quality, fast = ResidentLLM(), ResidentLLM()
+    manager = ModelResidencyManager(FakeWrapper(quality, {"fast": fast}), active_hours="")
+    await manager.preload()
+    await manager.preload()  # keepalive ping
+    assert quality.loads == 2 and fast.loads == 2
+
+    status = await manager.status()
+    assert status["state"] == "warm"
+    assert status["tiers"]["fast"]["state"] == "warm" and status["tiers"]["fast"]["resident"] is True
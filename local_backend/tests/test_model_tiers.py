@@ -0,0 +1,103 @@
+"""
+Tests for routing call sites to model tiers
+"""
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import llm_wrapper as llm_wrapper_module
+from app.services.chroma_service import chroma_service
+from app.services.llm_cache import LLMResponseCache
+from app.services.llm_metrics import LLMMetrics, report_usage
+from app.services.llm_scheduler import LLMScheduler
+from app.services.llm_wrapper import FAST, QUALITY, LLMInterface, LLMWrapper, parse_tier_map
+
+
+class TimedLLM(LLMInterface):
+    """Reports 100 prompt / 50 output tokens at the given speeds (tokens per second)"""
+
+    def __init__(self, name, prompt_tps, eval_tps):
+        self.name = name
+        self.prompt_tps = prompt_tps
+        self.eval_tps = eval_tps
+        self.calls = 0
+
+    def generate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        self.calls += 1
+        report_usage({
+            "prompt_eval_count": 100,
+            "eval_count": 50,
+            "prompt_eval_duration": 100 / self.prompt_tps * 1e9,
+            "eval_duration": 50 / self.eval_tps * 1e9,
+        })
+        return self.name
+
+    async def agenerate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        return self.generate(prompt, max_tokens, temperature, **kwargs)
+
+    def get_model_name(self):
+        return self.name
+
+
+@pytest.fixture
+def tiered(monkeypatch):
+    metrics = LLMMetrics(window_seconds=60)
+    monkeypatch.setattr(llm_wrapper_module, "llm_metrics", metrics)
+    wrapper = LLMWrapper()
+    wrapper.llm = TimedLLM("big", prompt_tps=500, eval_tps=10)
+    wrapper.tiers = {FAST: TimedLLM("small", prompt_tps=2000, eval_tps=50)}
+    wrapper.tier_schedulers = {FAST: LLMScheduler(name="small")}
+    return wrapper, metrics
+
+
+def test_parse_tier_map():
+    assert parse_tier_map("node-details=quality, quiz-topics = FAST,broken,=fast") == {
+        "node-details": "quality",
+        "quiz-topics": "fast",
+    }
+
+
+@pytest.mark.asyncio
+async def test_auxiliary_call_sites_use_fast_tier(tiered):
+    wrapper, _ = tiered
+    assert await wrapper.agenerate("p", call_site="normalize-topic") == "small"
+    assert await wrapper.agenerate("p", call_site="ask") == "big"
+    assert wrapper.tier_schedulers[FAST].stats()["in_flight"] == 0
+
+    wrapper.call_site_tiers["normalize-topic"] = QUALITY
+    assert await wrapper.agenerate("p", call_site="normalize-topic") == "big"
+
+
+@pytest.mark.asyncio
+async def test_unconfigured_tier_falls_back_to_quality(tiered):
+    wrapper, _ = tiered
+    wrapper.tiers = {}
+    assert wrapper.route("quiz-topics") == (QUALITY, wrapper.llm)
+    assert await wrapper.agenerate("p", call_site="quiz-topics") == "big"
+
+
+@pytest.mark.asyncio
+async def test_tier_savings_measured_against_quality(tiered):
+    wrapper, metrics = tiered
+    await wrapper.agenerate("p", call_site="ask")
+    await wrapper.agenerate("p", call_site="node-details")
+
+    tiers = metrics.summary()["tiers"]
+    assert tiers[QUALITY]["models"] == ["big"]
+    assert tiers[FAST]["tokens_per_s"] == pytest.approx(50.0)
+    assert tiers[QUALITY]["estimated_ms_saved"] is None
+    # big: 200ms prompt + 5000ms output; small: 50ms + 1000ms
+    assert tiers[FAST]["estimated_ms_saved"] == pytest.approx(5200 - 1050)
+
+
+def test_quiz_topic_suggestions_served_by_fast_tier(monkeypatch, tmp_path):
+    big, small = TimedLLM("big", 500, 10), TimedLLM('["Cells"]', 2000, 50)
+    wrapper = llm_wrapper_module.llm_wrapper
+    monkeypatch.setattr(llm_wrapper_module, "llm_cache", LLMResponseCache(path=str(tmp_path / "cache.sqlite3"), enabled=True))
+    monkeypatch.setattr(wrapper, "llm", big)
+    monkeypatch.setattr(wrapper, "tiers", {FAST: small})
+    monkeypatch.setattr(wrapper, "tier_schedulers", {FAST: LLMScheduler(name="small")})
+    monkeypatch.setattr(chroma_service, "get_chunks", lambda user_id, limit=None: {"documents": ["Cells divide."]})
+
+    response = TestClient(app).get("/api/suggest-quiz-topics", params={"user_id": "alice"})
+    assert response.json() == {"topics": ["Cells"]}
+    assert small.calls == 1 and big.calls == 0
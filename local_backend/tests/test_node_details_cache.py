@@ -0,0 +1,91 @@
+"""
+Tests for cached and prefetched mind map node details
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.api import mindmaps
+from app.db import Base, mindmap_crud
+from app.db.models import Notebook
+from app.services.node_details_cache import NodeDetailsCache, prefetch_order
+
+NODES = [
+    {"id": "1", "label": "Root", "depth": 0},
+    {"id": "2", "label": "Quiet", "depth": 1},
+    {"id": "3", "label": "Busy", "depth": 1},
+    {"id": "4", "label": "Leaf", "depth": 2},
+    {"id": "5", "label": "Other leaf", "depth": 2},
+]
+EDGES = [
+    {"from": "1", "to": "2"},
+    {"from": "1", "to": "3"},
+    {"from": "3", "to": "4"},
+    {"from": "3", "to": "5"},
+]
+
+
+def test_prefetch_order_by_depth_then_degree():
+    degree = {"1": 2, "2": 1, "3": 3, "4": 1, "5": 1}
+    assert prefetch_order(NODES, degree) == ["1", "3", "2", "4", "5"]
+    assert prefetch_order(NODES, degree, limit=2) == ["1", "3"]
+
+
+def test_invalidation_drops_entries_and_rejects_stale_stores():
+    cache = NodeDetailsCache(ttl_seconds=60, max_entries=2, enabled=True)
+    version = cache.version("alice", "nb")
+    assert cache.store("alice", "nb", "map", "1", {"summary": "one"}, version)
+    assert cache.get("alice", "nb", "map", "1") == {"summary": "one"}
+    assert cache.get("bob", "nb", "map", "1") is None
+
+    # Documents changed while a prefetch was computing details from the old ones
+    assert cache.invalidate("alice", "nb") == 1
+    assert cache.get("alice", "nb", "map", "1") is None
+    assert not cache.store("alice", "nb", "map", "2", {"summary": "stale"}, version)
+    assert cache.stats()["stale_stores"] == 1
+
+    version = cache.version("alice", "nb")
+    for node_id in ("1", "2", "3"):
+        cache.store("alice", "nb", "map", node_id, {}, version)
+    assert not cache.contains("alice", "nb", "map", "1")
+    assert cache.drop_mind_map("map") == 2
+
+
+@pytest.fixture
+def mind_map(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(mindmaps, "SessionLocal", Session)
+    monkeypatch.setattr(mindmaps, "node_details_cache", NodeDetailsCache(enabled=True))
+    db = Session()
+    db.add(Notebook(id="nb", user_id="alice", title="Notes"))
+    db.commit()
+    created = mindmap_crud.create_mind_map(db, "alice", "Map", "nb")
+    mindmap_crud.update_mind_map_data(db, created.id, NODES, EDGES, node_count=5, depth=2)
+    yield db, created.id
+    db.close()
+
+
+@pytest.mark.asyncio
+async def test_prefetch_fills_cache_for_clicks(mind_map, monkeypatch):
+    db, mind_map_id = mind_map
+    built = []
+
+    async def fake_build(user_id, notebook_id, node_id, node, priority="interactive"):
+        built.append((node_id, priority))
+        return {"node_id": node_id, "summary": node["label"]}, node_id != "2"
+
+    monkeypatch.setattr(mindmaps, "build_node_details", fake_build)
+    monkeypatch.setattr(mindmaps, "PREFETCH_NODES", 3)
+    progress = []
+    await mindmaps.prefetch_node_details(mind_map_id, "alice", progress.append)
+
+    assert built == [("1", "bulk"), ("3", "bulk"), ("2", "bulk")]
+    assert progress[-1] == {"stage": "prefetching", "done": 3, "total": 3}
+
+    # Prefetched node: no new work; incomplete and unprefetched ones are built on click
+    assert (await mindmaps.get_node_details(mind_map_id, "3", "alice", db=db))["summary"] == "Busy"
+    await mindmaps.get_node_details(mind_map_id, "2", "alice", db=db)
+    await mindmaps.get_node_details(mind_map_id, "4", "alice", db=db)
+    await mindmaps.get_node_details(mind_map_id, "4", "alice", db=db)
+    assert built[3:] == [("2", "interactive"), ("4", "interactive")]
@@ -0,0 +1,109 @@
+"""
+Tests for the OpenAI-compatible adapter against a stand-in server
+"""
+import asyncio
+import json
+import httpx
+import pytest
+from app.services import llm_wrapper as llm_wrapper_module
+from app.services.circuit_breaker import LLMUnavailableError, OPEN
+from app.services.llm_metrics import LLMMetrics
+from app.services.llm_wrapper import LLMWrapper, OpenAICompatibleAdapter
+
+
+def sse(*chunks):
+    lines = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks]
+    return ("".join(lines) + "data: [DONE]\n\n").encode()
+
+
+class StandInServer:
+    """Minimal llama.cpp/vLLM-style server: chat streaming, batched completions and n choices"""
+
+    def __init__(self):
+        self.requests = []
+        self.down = False
+
+    def __call__(self, request):
+        if self.down:
+            raise httpx.ConnectError("connection refused")
+        if request.url.path.endswith("/models"):
+            return httpx.Response(200, json={"data": [{"id": "local-model"}]})
+        body = json.loads(request.content)
+        self.requests.append(body)
+        if request.url.path.endswith("/chat/completions") and body["stream"]:
+            return httpx.Response(200, content=sse(
+                {"choices": [{"index": 0, "delta": {"content": "Hel"}}]},
+                {"choices": [{"index": 0, "delta": {"content": "lo"}}]},
+                {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 2}},
+            ))
+        if request.url.path.endswith("/completions"):
+            prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]] * body.get("n", 1)
+            # Servers may return choices out of order
+            choices = [{"index": i, "text": f"answer {i}: {p}"} for i, p in enumerate(prompts)][::-1]
+            return httpx.Response(200, json={"choices": choices, "usage": {"prompt_tokens": 5, "completion_tokens": 9}})
+        return httpx.Response(404)
+
+
+def make_adapter(server, api="chat"):
+    adapter = OpenAICompatibleAdapter(model_name="local-model", base_url="http://stand-in/v1/", api_key="secret", api=api)
+    adapter._async_client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+    adapter._async_client_loop = asyncio.get_running_loop()
+    return adapter
+
+
+@pytest.mark.asyncio
+async def test_chat_streaming_and_usage(monkeypatch):
+    metrics = LLMMetrics()
+    monkeypatch.setattr(llm_wrapper_module, "llm_metrics", metrics)
+    server = StandInServer()
+    wrapper = LLMWrapper()
+    wrapper.llm = make_adapter(server)
+
+    assert await wrapper.agenerate("Say hello", max_tokens=64, call_site="ask", format="json") == "Hello"
+    pieces = [piece async for piece in wrapper.astream_answer("q", ["context"])]
+    assert "".join(pieces) == "Hello"
+
+    request = server.requests[0]
+    assert request["messages"] == [{"role": "user", "content": "Say hello"}]
+    assert request["max_tokens"] == 64
+    assert request["response_format"] == {"type": "json_object"}
+    record = metrics.recent(2)[1]
+    assert record["prompt_tokens"] == 12 and record["output_tokens"] == 2
+    await wrapper.aclose()
+
+
+@pytest.mark.asyncio
+async def test_batched_completions_and_choices():
+    server = StandInServer()
+    adapter = make_adapter(server, api="completions")
+
+    assert await adapter.agenerate_batch(["a", "b", "c"]) == ["answer 0: a", "answer 1: b", "answer 2: c"]
+    assert len(server.requests) == 1 and server.requests[0]["prompt"] == ["a", "b", "c"]
+
+    assert await adapter.agenerate_choices("q", n=2) == ["answer 0: q", "answer 1: q"]
+    assert server.requests[1]["n"] == 2
+    await adapter.aclose()
+
+
+@pytest.mark.asyncio
+async def test_server_down_opens_circuit(monkeypatch):
+    server = StandInServer()
+    server.down = True
+    adapter = make_adapter(server)
+    adapter.fallback = "error"
+    adapter.breaker.failure_threshold = 2
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            await adapter.agenerate("p")
+    assert adapter.breaker.state == OPEN
+    assert adapter.health()["degraded"]
+
+    # While open, calls fail without reaching the server; mock fallback still answers
+    server.down = False
+    with pytest.raises(LLMUnavailableError, match="unavailable"):
+        await adapter.agenerate("p")
+    assert server.requests == []
+    adapter.fallback = "mock"
+    assert await adapter.agenerate("p")
+    await adapter.aclose()
@@ -0,0 +1,66 @@
+"""
+Tests for sharded quiz generation
+"""
+import json
+import pytest
+from app.services import quiz_generator
+from app.services.llm_wrapper import LLMInterface
+from app.services.quiz_generator import generate_quiz_sharded, shard_plan, slice_context
+
+
+def test_shard_plan_and_slices():
+    """Large quizzes are split with one spare shard; chunks are dealt round-robin"""
+    assert shard_plan(3) == (1, 3)
+    assert shard_plan(12) == (4, 4)
+    assert slice_context(list("abcdefg"), 3) == [[0, 3, 6], [1, 4], [2, 5]]
+    assert slice_context(list("ab"), 4) == [[0], [1]]
+
+
+class ShardLLM(LLMInterface):
+    """Answers each shard with questions named after the first chunk in its prompt"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        self.calls += 1
+        chunk = prompt.split("Content:\n", 1)[1].split("\n", 1)[0]
+        questions = [
+            {"question": f"{chunk} question {i}?", "options": ["a", "b", "c", "d"], "correct_answer": 0}
+            for i in range(2)
+        ]
+        # Every shard also repeats the same question
+        questions.append({"question": "What is shared?", "options": ["a", "b", "c", "d"], "correct_answer": 0})
+        return json.dumps({"questions": questions})
+
+    async def agenerate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        return self.generate(prompt, max_tokens, temperature, **kwargs)
+
+    def get_model_name(self):
+        return "shard-llm"
+
+
+@pytest.mark.asyncio
+async def test_shards_merge_and_dedupe(monkeypatch):
+    """Shards are merged, duplicates dropped, and the quiz stops at num_questions"""
+    monkeypatch.setattr(quiz_generator, "SHARD_SIZE", 3)
+    llm = ShardLLM()
+    monkeypatch.setattr(quiz_generator.llm_wrapper, "llm", llm)
+
+    axes = {}
+
+    def embed(texts):
+        # Identical texts get identical vectors, everything else is orthogonal
+        vectors = []
+        for text in texts:
+            vector = [0.0] * 32
+            vector[axes.setdefault(text, len(axes))] = 1.0
+            vectors.append(vector)
+        return vectors
+
+    chunks = [f"chunk{i}" for i in range(9)]
+    questions = await generate_quiz_sharded("topic", chunks, num_questions=6, embed=embed)
+
+    texts = [q.question for q in questions]
+    assert len(texts) == 6
+    assert texts.count("What is shared?") == 1
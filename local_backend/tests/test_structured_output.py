@@ -0,0 +1,111 @@
+"""
+Tests for structured LLM output parsing, repair and targeted retries
+"""
+import json
+import pytest
+from app.models.schemas import FlashcardsOutput, MindMapOutput, QuizOutput
+from app.services.llm_wrapper import LLMWrapper, LLMInterface
+from app.services.structured_output import (
+    StructuredOutputError,
+    StructuredOutputStats,
+    parse_structured,
+    repair_json,
+)
+
+
+def test_repair_strips_fences_prose_and_trailing_commas():
+    """Markdown fences, chatter and trailing commas are removed"""
+    text = 'Sure! ```json\n{"cards": [{"front": "Q", "back": "A"},],}\n``` Hope this helps.'
+    assert json.loads(repair_json(text)) == {"cards": [{"front": "Q", "back": "A"}]}
+
+
+def test_repair_closes_truncated_output():
+    """Output cut off by max_tokens keeps its complete items"""
+    text = '{"cards": [{"front": "Q1", "back": "A1"}, {"front": "Q2", "ba'
+    assert json.loads(repair_json(text)) == {"cards": [{"front": "Q1", "back": "A1"}]}
+
+
+def test_parse_drops_invalid_items_and_coerces_minor_defects():
+    """Invalid list items are dropped; letters and numeric ids are coerced"""
+    text = json.dumps({"questions": [
+        {"question": "Q1", "options": ["a", "b", "c", "d", "e"], "correct_answer": "B"},
+        {"question": "Q2", "options": ["a", "b"], "correct_answer": 0},
+    ]})
+    parsed = parse_structured(text, QuizOutput)
+    assert [q.question for q in parsed.value.questions] == ["Q1"]
+    assert parsed.value.questions[0].correct_answer == 1
+    assert len(parsed.value.questions[0].options) == 4
+    assert len(parsed.dropped) == 1
+
+    mind_map = parse_structured('{"nodes": [{"id": 1, "label": "Root"}], "edges": [{"from": 1, "to": 2}]}', MindMapOutput)
+    assert mind_map.value.nodes[0].id == "1"
+    assert mind_map.value.edges[0].model_dump(by_alias=True)["from"] == "1"
+
+
+def test_parse_reports_unusable_output():
+    """Text without JSON yields no value and an error"""
+    parsed = parse_structured("Question 1: What is AI?", FlashcardsOutput)
+    assert parsed.value is None
+    assert parsed.error
+
+
+class ScriptedLLM(LLMInterface):
+    """Returns queued responses and records prompts and kwargs"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def generate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        self.calls.append((prompt, kwargs))
+        return self.responses.pop(0)
+
+    async def agenerate(self, prompt, max_tokens=1024, temperature=0.7, **kwargs):
+        return self.generate(prompt, max_tokens, temperature, **kwargs)
+
+    def get_model_name(self):
+        return "scripted"
+
+
+@pytest.fixture
+def wrapper(monkeypatch):
+    import app.services.llm_wrapper as llm_module
+    monkeypatch.setattr(llm_module, "structured_stats", StructuredOutputStats())
+    wrapper = LLMWrapper()
+    wrapper.structured_max_retries = 1
+    return wrapper
+
+
+@pytest.mark.asyncio
+async def test_unusable_output_is_repaired_by_model(wrapper):
+    """Invalid JSON is sent back for repair, and its tokens count as wasted"""
+    wrapper.llm = ScriptedLLM(["not json at all", '{"cards": [{"front": "Q", "back": "A"}]}'])
+    result = await wrapper.agenerate_structured("prompt", FlashcardsOutput, task="flashcards")
+
+    assert result.cards[0].front == "Q"
+    assert "format" in wrapper.llm.calls[0][1]
+    assert "not json at all" in wrapper.llm.calls[1][0]
+    import app.services.llm_wrapper as llm_module
+    stats = llm_module.structured_stats.stats()["flashcards"]
+    assert stats["retries"] == 1 and stats["wasted_tokens"] > 0
+
+
+@pytest.mark.asyncio
+async def test_short_list_is_topped_up(wrapper):
+    """Only the missing items are requested on retry"""
+    wrapper.llm = ScriptedLLM([
+        '{"cards": [{"front": "Q1", "back": "A1"}]}',
+        '{"cards": [{"front": "Q2", "back": "A2"}]}',
+    ])
+    result = await wrapper.agenerate_structured("prompt", FlashcardsOutput, task="flashcards", topup_field="cards", min_items=2)
+
+    assert [card.front for card in result.cards] == ["Q1", "Q2"]
+    assert "Generate ONLY 1 more cards" in wrapper.llm.calls[1][0]
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_retries(wrapper):
+    """Persistently invalid output raises StructuredOutputError"""
+    wrapper.llm = ScriptedLLM(["nope", "still nope"])
+    with pytest.raises(StructuredOutputError):
+        await wrapper.agenerate_structured("prompt", FlashcardsOutput)
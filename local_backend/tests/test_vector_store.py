@@ -0,0 +1,181 @@
+"""
+Tests for the in-process numpy vector store
+"""
+import numpy as np
+import pytest
+from app.services import vector_store
+from app.services.vector_store import NumpyVectorStore, copy_collection, matches_where, quantize
+
+
+def _random_vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return NumpyVectorStore(str(tmp_path / "vectors"))
+
+
+@pytest.fixture
+def populated(store):
+    vectors = _random_vectors(50)
+    store.add(
+        "notes",
+        ids=[f"c{i}" for i in range(50)],
+        embeddings=vectors.tolist(),
+        documents=[f"chunk {i}" for i in range(50)],
+        metadatas=[{"document_id": f"d{i % 5}", "page": i % 10 + 1} for i in range(50)],
+    )
+    return store, vectors
+
+
+def test_exact_query_matches_brute_force(populated):
+    """Exact search returns the true nearest neighbours by cosine"""
+    store, vectors = populated
+    query = vectors[7] + 0.01
+    results = store.query("notes", [query.tolist()], n_results=5)
+
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normed @ (query / np.linalg.norm(query))))[:5]
+    assert results["ids"][0] == [f"c{i}" for i in expected]
+    assert results["ids"][0][0] == "c7"
+    assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-3)
+
+
+def test_query_with_where_filter(populated):
+    """Filters are applied before ranking"""
+    store, vectors = populated
+    where = {"$and": [{"document_id": {"$in": ["d1"]}}, {"page": {"$lte": 5}}]}
+    results = store.query("notes", [vectors[0].tolist()], n_results=20, where=where)
+
+    assert results["ids"][0]
+    assert all(m["document_id"] == "d1" and m["page"] <= 5 for m in results["metadatas"][0])
+
+
+def test_get_with_limit(populated):
+    """get() returns records without a query, up to the limit"""
+    store, _ = populated
+    assert len(store.get("notes")["ids"]) == 50
+    limited = store.get("notes", where={"document_id": "d2"}, limit=3)
+    assert limited["ids"] == ["c2", "c7", "c12"]
+    by_id = store.get("notes", ids=["c7", "c3", "missing"], include_embeddings=True)
+    assert sorted(by_id["ids"]) == ["c3", "c7"] and len(by_id["embeddings"]) == 2
+
+
+def test_delete_and_reload(populated, tmp_path):
+    """Deletes persist and the memory-mapped file is reloaded from disk"""
+    store, vectors = populated
+    store.delete("notes", where={"document_id": "d0"})
+    assert store.count("notes") == 40
+
+    reopened = NumpyVectorStore(str(tmp_path / "vectors"))
+    assert reopened.count("notes") == 40
+    results = reopened.query("notes", [vectors[1].tolist()], n_results=1)
+    assert results["ids"][0] == ["c1"]
+
+
+def test_adds_append_to_log_and_deletes_compact(store, tmp_path):
+    """Later adds append log lines instead of rewriting records.json; deletes fold the log back in"""
+    import json
+    path = tmp_path / "vectors" / "notes"
+    vectors = _random_vectors(30)
+    for start in range(0, 30, 10):
+        store.add(
+            "notes",
+            ids=[f"c{i}" for i in range(start, start + 10)],
+            embeddings=vectors[start:start + 10].tolist(),
+            documents=[f"chunk {i}" for i in range(start, start + 10)],
+            metadatas=[{"document_id": f"d{i % 3}"} for i in range(start, start + 10)],
+        )
+    assert len(json.loads((path / "records.json").read_text())["ids"]) == 10
+    assert len((path / "records.1.jsonl").read_text().splitlines()) == 20
+
+    # An interrupted append leaves a torn last line, which is dropped on load
+    with open(path / "records.1.jsonl", "a") as f:
+        f.write('{"id": "c99", "docu')
+    reopened = NumpyVectorStore(str(tmp_path / "vectors"))
+    assert reopened.count("notes") == 30
+    assert reopened.get("notes", ids=["c25"])["documents"] == ["chunk 25"]
+
+    reopened.delete("notes", where={"document_id": "d0"})
+    assert not (path / "records.1.jsonl").exists()
+    assert len(json.loads((path / "records.json").read_text())["ids"]) == 20
+    assert NumpyVectorStore(str(tmp_path / "vectors")).count("notes") == 20
+
+
+def test_hnsw_above_threshold(populated, monkeypatch):
+    """Large collections are searched with HNSW and agree with exact search"""
+    pytest.importorskip("hnswlib")
+    store, vectors = populated
+    monkeypatch.setattr(vector_store, "HNSW_THRESHOLD", 10)
+
+    results = store.query("notes", [vectors[3].tolist()], n_results=3)
+    assert results["ids"][0][0] == "c3"
+
+
+def test_missing_collection(store):
+    """Querying a missing collection raises like Chroma does"""
+    assert store.count("missing") == 0
+    with pytest.raises(ValueError):
+        store.query("missing", [[0.0] * 16])
+
+
+@pytest.mark.parametrize("quantization,keep_float32", [
+    ("float16", True),
+    ("int8", True),
+    ("int8", False),
+])
+def test_quantized_query_matches_exact(tmp_path, quantization, keep_float32):
+    """Quantised search with rerank finds the same neighbours as float32"""
+    vectors = _random_vectors(200, dim=64, seed=1)
+    kwargs = dict(
+        ids=[f"c{i}" for i in range(200)],
+        embeddings=vectors.tolist(),
+        documents=[""] * 200,
+        metadatas=[{"i": i} for i in range(200)],
+    )
+    exact = NumpyVectorStore(str(tmp_path / "exact"))
+    exact.add("notes", **kwargs)
+    quantized = NumpyVectorStore(str(tmp_path / "q"), quantization=quantization, keep_float32=keep_float32)
+    quantized.add("notes", **kwargs)
+
+    queries = _random_vectors(10, dim=64, seed=2).tolist()
+    expected = exact.query("notes", queries, n_results=5)
+    actual = quantized.query("notes", queries, n_results=5)
+
+    hits = sum(len(set(e) & set(a)) for e, a in zip(expected["ids"], actual["ids"]))
+    assert hits / 50 >= 0.9
+    assert not (tmp_path / "q" / "notes" / "vectors.f32").exists() or keep_float32
+
+
+def test_int8_quantization_error_is_small():
+    """Per-vector scales keep int8 reconstruction error low"""
+    matrix = _random_vectors(20, dim=64)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    encoded = quantize(matrix, "int8")
+    restored = encoded["vectors.i8"].astype(np.float32) * encoded["scales.f32"]
+    assert np.abs(restored - matrix).max() < 0.01
+
+
+def test_copy_collection_requantizes_in_place(populated, tmp_path):
+    """Migration re-encodes an existing collection without losing records"""
+    store, vectors = populated
+    target = NumpyVectorStore(str(tmp_path / "vectors"), quantization="int8", keep_float32=False)
+    assert copy_collection(store, target, "notes") == 50
+
+    assert target.count("notes") == 50
+    results = target.query("notes", [vectors[4].tolist()], n_results=1, where={"document_id": "d4"})
+    assert results["ids"][0] == ["c4"]
+
+
+def test_matches_where_operators():
+    """Where evaluation supports Chroma's operators"""
+    metadata = {"source": "a.pdf", "page": 3}
+    assert matches_where(metadata, {"source": "a.pdf"})
+    assert matches_where(metadata, {"$or": [{"source": "b.pdf"}, {"page": {"$gt": 2}}]})
+    assert not matches_where(metadata, {"source": {"$nin": ["a.pdf"]}})
+    assert not matches_where({"source": "a.pdf"}, {"page": {"$gte": 1}})
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])